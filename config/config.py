@@ -18,13 +18,26 @@ except ImportError:
 
 # === Configuration API SimilarWeb ===
 SIMILARWEB_API_KEY = os.environ.get('SIMILARWEB_API_KEY', '865fd28dc61c402396309df6ddfb145d')
-SIMILARWEB_BASE_URL = 'https://api.similarweb.com/v1'
+# Plusieurs clés (quotas séparés) séparées par des virgules ; à défaut, la clé unique ci-dessus
+SIMILARWEB_API_KEYS = [
+    key.strip() for key in os.environ.get('SIMILARWEB_API_KEYS', '').split(',') if key.strip()
+] or [SIMILARWEB_API_KEY]
+# Surchargeable pour pointer vers un serveur local (scripts/fake_similarweb_server.py)
+SIMILARWEB_BASE_URL = os.environ.get('SIMILARWEB_BASE_URL', 'https://api.similarweb.com/v1')
 
 # Headers par défaut pour l'API
 API_HEADERS = {
-    'accept': 'application/json'
+    'accept': 'application/json',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive'
 }
 
+# === Configuration du pool de connexions HTTP ===
+HTTP_POOL_CONNECTIONS = 4   # Nombre d'hôtes distincts gardés en cache par le pool
+HTTP_POOL_MAXSIZE = 16      # Connexions keep-alive maximum par hôte
+HTTP_POOL_BLOCK = True      # Attendre une connexion libre plutôt que d'en ouvrir une de plus
+API_REQUEST_TIMEOUT = (5, 60)  # Timeout (connexion, lecture) en secondes
+
 # === Configuration des domaines à analyser ===
 TARGET_DOMAINS = ['amazon.fr', 'joueclub.fr']
 
@@ -62,10 +75,97 @@ BIGQUERY_TABLES = {
     'websites': 'websites_data'
 }
 
+# Upload : insertions en streaming ('stream', par défaut) ou jobs de chargement par lots ('load', load_table_from_file)
+BIGQUERY_UPLOAD_MODE = os.environ.get('BIGQUERY_UPLOAD_MODE', 'stream')
+BIGQUERY_LOAD_CHUNK_ROWS = 500000  # Lignes par job de chargement
+BIGQUERY_LOAD_MAX_WORKERS = 4      # Jobs de chargement simultanés (toutes tables confondues)
+BIGQUERY_LOAD_RETRIES = 3          # Nouvelles tentatives d'un job en échec (seul ce lot est renvoyé)
+
 # === Configuration des limites et retry ===
-API_RATE_LIMIT_DELAY = 1  # Délai en secondes entre les appels API
+# Token bucket adaptatif partagé par tous les clients (voir scripts/rate_limiter.py)
+API_RATE_LIMIT_RPS = 2.0               # Débit initial (requêtes/seconde)
+API_RATE_LIMIT_BURST = 5               # Nombre d'appels pouvant partir d'un coup
+API_RATE_LIMIT_MIN_RPS = 0.2           # Débit plancher après des 429
+API_RATE_LIMIT_MAX_RPS = 10.0          # Débit plafond autorisé par le quota
+API_RATE_LIMIT_INCREASE_STEP = 0.5     # Hausse additive (req/s) par palier sans 429
+API_RATE_LIMIT_INCREASE_INTERVAL = 30  # Durée d'un palier en secondes
+API_RATE_LIMIT_DECREASE_FACTOR = 0.5   # Baisse multiplicative sur un 429
+# Dossier d'état partagé des limiteurs : si défini, tous les processus (backfill multi-processus,
+# automatisation lancée en parallèle...) se partagent les mêmes jetons via des fichiers verrouillés
+API_RATE_LIMIT_STATE_DIR = os.environ.get('SIMILARWEB_RATE_LIMIT_DIR', '')
 MAX_RETRIES = 3
-RETRY_DELAY = 5  # Délai en secondes entre les tentatives
+RETRY_DELAY = 5  # Délai en secondes après un 429 sans Retry-After
+RETRY_BACKOFF_BASE = 2   # Backoff exponentiel avec jitter: aléatoire dans [0, min(max, base * 2^n)]
+RETRY_BACKOFF_MAX = 60
+
+# Circuit breaker par famille d'endpoints
+CIRCUIT_FAILURE_THRESHOLD = 5   # Échecs consécutifs avant ouverture du circuit
+CIRCUIT_RECOVERY_TIMEOUT = 60   # Secondes avant un appel test (half-open)
+CIRCUIT_PROBE_POLL = 1          # Secondes avant de redemander pendant l'appel test d'un autre
+CIRCUIT_REQUEUE_MAX_WAIT = 600  # Secondes de circuit ouvert au-delà desquelles un appel est abandonné
+
+# Nombre maximum de jours demandés en un seul appel granularity=daily
+API_MAX_DAILY_WINDOW_DAYS = 31
+
+# Nombre d'appels API simultanés en mode concurrent (1 = séquentiel)
+EXTRACTION_MAX_WORKERS = 8
+
+# Échéance de l'extraction automatisée en secondes (0 = aucune) : au-delà, les appels
+# pas encore lancés sont abandonnés pour que le job se termine avant son timeout
+AUTOMATION_DEADLINE_SECONDS = int(os.environ.get('SIMILARWEB_AUTOMATION_DEADLINE', '0'))
+
+# Journal de reprise du backfill historique (unités terminées, une ligne JSON par lot)
+BACKFILL_JOURNAL_PATH = os.path.join('data', 'backfill_journal.jsonl')
+BACKFILL_FLUSH_EVERY = 50  # Entités écrites et journalisées par lot pendant un mois
+BACKFILL_PROCESSES = 1     # Processus du backfill (un mois par processus à la fois, 1 = pas de pool)
+
+# Écriture en flux des résultats (NDJSON, une ligne par entité et par période)
+RESULT_SINK_FSYNC_EVERY = 200               # Enregistrements entre deux fsync
+RESULT_SINK_MAX_BYTES = 128 * 1024 * 1024   # Rotation des fichiers au-delà de 128 Mo
+
+# Format de sortie des extractions : 'ndjson' (enregistrements bruts, par défaut), 'parquet'
+# (lignes normalisées, partitionnées par type, granularité et mois) ou 'both' (les payloads
+# sont normalisés une fois à l'extraction, le NDJSON brut reste pour l'audit)
+RESULT_OUTPUT_FORMAT = os.environ.get('SIMILARWEB_OUTPUT_FORMAT', 'ndjson')
+PARQUET_DATA_PATH = os.path.join('data', 'parquet')
+PARQUET_SINK_MAX_ROWS = 500000    # Lignes gardées en mémoire avant écriture des partitions
+PARQUET_COMPRESSION = 'zstd'
+# Fichiers NDJSON écrits avec leur équivalent Parquet (l'upload 'auto' ne les relit pas)
+PARQUET_SOURCES_PATH = os.path.join(PARQUET_DATA_PATH, '_sources.jsonl')
+
+# Registre des fichiers déjà chargés dans BigQuery (les fichiers inchangés ne sont pas relus)
+UPLOAD_LEDGER_PATH = os.path.join('data', 'upload_ledger.sqlite')
+
+# Nombre de requêtes en vol pour le client asynchrone (AsyncSimilarWebAPI)
+ASYNC_MAX_CONCURRENCY = 50
+
+# === Configuration du cache des réponses API ===
+API_CACHE_ENABLED = True
+API_CACHE_PATH = os.path.join('data', 'cache', 'api_responses.sqlite')
+API_CACHE_MAX_BYTES = 500 * 1024 * 1024  # Éviction LRU au-delà de 500 Mo
+API_CACHE_RECENT_TTL = 6 * 3600          # TTL (secondes) des périodes encore révisées
+API_REVISION_WINDOW_DAYS = 7             # SimilarWeb révise les données ~7 jours
+
+# === Configuration du quota API ===
+API_QUOTA_LEDGER_PATH = os.path.join('data', 'api_quota_ledger.sqlite')
+API_KEY_MONTHLY_QUOTA = int(os.environ.get('SIMILARWEB_KEY_MONTHLY_QUOTA', 10000))  # Quota d'une clé
+API_MONTHLY_QUOTA = int(os.environ.get('SIMILARWEB_MONTHLY_QUOTA',
+                                       API_KEY_MONTHLY_QUOTA * len(SIMILARWEB_API_KEYS)))
+API_QUOTA_RESERVE = 1000  # Appels gardés pour l'automatisation quotidienne (les backfills s'arrêtent avant)
+API_CALL_COST = 1         # Unités de quota consommées par un appel réussi
+API_KEY_USAGE_REFRESH_SECONDS = 30  # Relecture de la consommation par clé (partagée entre processus)
+API_QUOTA_FLUSH_ROWS = 100           # Appels journalisés gardés en mémoire avant écriture groupée
+API_QUOTA_FLUSH_SECONDS = 5          # Écriture groupée au moins toutes les 5 secondes
+API_QUOTA_REFRESH_SECONDS = 30       # Relecture du total du mois (autres processus)
+
+# === Configuration de l'instrumentation des appels API ===
+API_METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Secondes
+API_METRICS_PARSE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)       # Secondes
+# Fichier texte Prometheus (textfile collector) ; export désactivé si vide
+API_METRICS_PROMETHEUS_PATH = os.environ.get('SIMILARWEB_METRICS_TEXTFILE', '')
+
+# Durée de validité du catalogue de segments (describe) en secondes
+SEGMENT_CATALOG_TTL = 24 * 3600
 
 # === Configuration des notifications (pour phases ultérieures) ===
 SLACK_WEBHOOK_URL = os.environ.get('SLACK_WEBHOOK_URL', '')
@@ -0,0 +1,237 @@
+"""
+Pool de clés API SimilarWeb avec un rate limit et un quota suivis par clé
+Les requêtes sont réparties sur les clés disponibles pour multiplier le débit des backfills
+"""
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import sys
+import os
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+from scripts.rate_limiter import TokenBucketRateLimiter, get_shared_rate_limiter
+from scripts.quota_ledger import QuotaBudgetExceededError, QuotaLedger, get_shared_quota_ledger
+
+logger = logging.getLogger(__name__)
+
+
+def get_api_key_id(api_key: str) -> str:
+    """
+    Identifiant court et stable d'une clé (la clé elle-même n'est jamais journalisée)
+
+    Args:
+        api_key: Clé API SimilarWeb
+
+    Returns:
+        Empreinte de 8 caractères
+    """
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]
+
+
+class ApiKeyState:
+    """État d'une clé du pool : limiteur, consommation du mois et mise hors rotation"""
+
+    def __init__(self, api_key: str, rate_limiter: TokenBucketRateLimiter, used: float = 0):
+        self.api_key = api_key
+        self.key_id = get_api_key_id(api_key)
+        self.rate_limiter = rate_limiter
+        self.used = used
+        self.calls = 0
+        self.rate_limited = 0
+        self.disabled_reason = None
+
+    @property
+    def active(self) -> bool:
+        """True si la clé peut encore servir des appels"""
+        return self.disabled_reason is None
+
+
+class ApiKeyPool:
+    """
+    Répartit les appels sur plusieurs clés API
+
+    Chaque appel part sur la clé dont le limiteur libère un jeton le plus tôt
+    (à égalité, la moins consommée du mois). Une clé dont le quota mensuel est
+    épuisé, ou refusée par l'API, sort de la rotation.
+    """
+
+    def __init__(self, api_keys: List[str] = None,
+                 key_quota: int = API_KEY_MONTHLY_QUOTA,
+                 quota_ledger: QuotaLedger = None,
+                 rate_limiter: TokenBucketRateLimiter = None):
+        """
+        Initialise le pool
+
+        Args:
+            api_keys: Clés API (SIMILARWEB_API_KEYS par défaut)
+            key_quota: Quota mensuel de chaque clé
+            quota_ledger: Registre utilisé pour reprendre la consommation du mois
+            rate_limiter: Limiteur imposé à toutes les clés (un limiteur partagé par clé sinon)
+        """
+        api_keys = list(dict.fromkeys(api_keys or SIMILARWEB_API_KEYS))
+        if not api_keys:
+            raise ValueError("Aucune clé API SimilarWeb configurée")
+
+        self.key_quota = key_quota
+        self.quota_ledger = quota_ledger or get_shared_quota_ledger()
+        self._lock = threading.Lock()
+
+        used_by_key = self.quota_ledger.used_by_key()
+        self.keys = []
+        for api_key in api_keys:
+            key_id = get_api_key_id(api_key)
+            limiter = rate_limiter or get_shared_rate_limiter(key_id)
+            self.keys.append(ApiKeyState(api_key, limiter, used_by_key.get(key_id, 0)))
+
+        for state in self.keys:
+            self._check_quota(state)
+        self._usage_refreshed_at = time.monotonic()
+
+        if len(self.keys) > 1:
+            logger.info(f"Pool de {len(self.keys)} clés API ({self.active_count} actives)")
+
+    @property
+    def active_count(self) -> int:
+        """Nombre de clés encore en rotation"""
+        return sum(1 for state in self.keys if state.active)
+
+    def _check_quota(self, state: ApiKeyState) -> None:
+        """Sort une clé de la rotation si son quota du mois est épuisé"""
+        if state.active and state.used >= self.key_quota:
+            state.disabled_reason = 'quota'
+            logger.warning(f"Clé API {state.key_id} hors rotation: quota mensuel épuisé "
+                           f"({state.used:.0f}/{self.key_quota})")
+
+    def _refresh_usage(self) -> None:
+        """
+        Relit la consommation par clé dans le registre (verrou déjà pris)
+
+        D'autres processus (backfill multi-processus) consomment les mêmes clés :
+        sans relecture, chacun ne verrait que ses propres appels.
+        """
+        used_by_key = self.quota_ledger.used_by_key()
+        for state in self.keys:
+            state.used = max(state.used, used_by_key.get(state.key_id, 0))
+            self._check_quota(state)
+        self._usage_refreshed_at = time.monotonic()
+
+    def reserve(self) -> Tuple[ApiKeyState, float]:
+        """
+        Choisit une clé et y réserve un jeton sans attendre
+
+        Returns:
+            (clé choisie, délai à attendre avant d'envoyer la requête)
+
+        Raises:
+            QuotaBudgetExceededError: si aucune clé n'est encore utilisable
+        """
+        with self._lock:
+            if time.monotonic() - self._usage_refreshed_at >= API_KEY_USAGE_REFRESH_SECONDS:
+                self._refresh_usage()
+
+            active = [state for state in self.keys if state.active]
+            if not active:
+                raise QuotaBudgetExceededError(
+                    f"Aucune clé API utilisable ({len(self.keys)} hors rotation)")
+
+            state = min(active, key=lambda s: (s.rate_limiter.available_in(), s.used))
+            state.calls += 1
+
+        return state, state.rate_limiter.reserve()
+
+    def acquire(self) -> ApiKeyState:
+        """
+        Choisit une clé et attend son jeton
+
+        Returns:
+            Clé à utiliser pour l'appel
+        """
+        state, wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return state
+
+    def record_cost(self, state: ApiKeyState, cost: float) -> None:
+        """
+        Comptabilise le coût d'un appel servi par une clé
+
+        Args:
+            state: Clé qui a servi l'appel
+            cost: Unités de quota consommées
+        """
+        if not cost:
+            return
+
+        with self._lock:
+            state.used += cost
+            self._check_quota(state)
+
+    def on_rate_limited(self, state: ApiKeyState, headers=None) -> float:
+        """
+        Signale un 429 sur une clé (seul son limiteur ralentit)
+
+        Args:
+            state: Clé concernée
+            headers: Headers de la réponse 429
+
+        Returns:
+            Délai de blocage appliqué à la clé
+        """
+        state.rate_limited += 1
+        return state.rate_limiter.on_rate_limited(headers)
+
+    def disable(self, state: ApiKeyState, reason: str) -> bool:
+        """
+        Sort une clé de la rotation (clé refusée par l'API)
+
+        Args:
+            state: Clé concernée
+            reason: Motif pour les rapports
+
+        Returns:
+            True s'il reste au moins une clé active
+        """
+        with self._lock:
+            if state.active:
+                state.disabled_reason = reason
+                logger.warning(f"Clé API {state.key_id} hors rotation: {reason}")
+            return any(s.active for s in self.keys)
+
+    def snapshot(self) -> Dict:
+        """Retourne l'état de chaque clé pour les rapports"""
+        with self._lock:
+            return {
+                state.key_id: {
+                    'active': state.active,
+                    'disabled_reason': state.disabled_reason,
+                    'used': state.used,
+                    'quota': self.key_quota,
+                    'calls': state.calls,
+                    'rate_limited': state.rate_limited,
+                    'rate': round(state.rate_limiter.rate, 3)
+                }
+                for state in self.keys
+            }
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_api_key_pool() -> ApiKeyPool:
+    """
+    Retourne le pool de clés unique du processus
+
+    Returns:
+        Instance partagée de ApiKeyPool
+    """
+    global _shared_pool
+
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = ApiKeyPool()
+        return _shared_pool
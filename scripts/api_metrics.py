@@ -0,0 +1,290 @@
+"""
+Instrumentation des appels à l'API SimilarWeb par famille d'endpoints
+Latences, time-to-first-byte, volumes, temps de parsing JSON, retries, 429 et attentes
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Sequence
+import sys
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Histogramme cumulatif à buckets fixes (compatible Prometheus)"""
+
+    def __init__(self, buckets: Sequence[float] = API_METRICS_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Ajoute une observation"""
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimation d'un quantile (borne haute du bucket qui le contient)"""
+        if not self.count:
+            return 0.0
+
+        target = q * self.count
+        for bound, cumulated in zip(self.buckets, self.counts):
+            if cumulated >= target:
+                return bound
+        return self.max
+
+    def snapshot(self) -> Dict:
+        """Retourne les statistiques de l'histogramme"""
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'mean': round(self.sum / self.count, 4) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': round(self.max, 4),
+            'buckets': {str(bound): count for bound, count in zip(self.buckets, self.counts)}
+        }
+
+
+class EndpointMetrics:
+    """Compteurs et histogrammes d'une famille d'endpoints"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.sleep_seconds = 0.0
+        self.bytes = 0
+        self.latency = Histogram()
+        self.ttfb = Histogram()
+        self.parse = Histogram(API_METRICS_PARSE_BUCKETS)
+
+    def snapshot(self) -> Dict:
+        """Retourne les métriques de la famille"""
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'cache_hits': self.cache_hits,
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+            'sleep_seconds': round(self.sleep_seconds, 3),
+            'bytes': self.bytes,
+            'latency_seconds': self.latency.snapshot(),
+            'ttfb_seconds': self.ttfb.snapshot(),
+            'parse_seconds': self.parse.snapshot()
+        }
+
+
+class ApiMetrics:
+    """
+    Registre thread-safe des métriques d'appels API
+
+    Les clients appellent les méthodes record_* depuis _make_request/_fetch ;
+    snapshot() alimente les résumés d'exécution et write_prometheus() un
+    fichier texte lisible par le textfile collector de node_exporter.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families: Dict[str, EndpointMetrics] = {}
+        self._started_at = time.monotonic()
+
+    def _family(self, family: str) -> EndpointMetrics:
+        """Retourne (en les créant si besoin) les métriques d'une famille (verrou déjà pris)"""
+        if family not in self._families:
+            self._families[family] = EndpointMetrics()
+        return self._families[family]
+
+    def record_call(self, family: str, latency: float, ttfb: float = None,
+                    bytes_received: int = 0, status: int = None) -> None:
+        """
+        Enregistre un appel réseau terminé
+
+        Args:
+            family: Famille d'endpoints
+            latency: Durée totale de l'appel en secondes
+            ttfb: Délai avant les headers de la réponse en secondes
+            bytes_received: Taille du corps de la réponse
+            status: Code HTTP (None pour une erreur réseau)
+        """
+        with self._lock:
+            metrics = self._family(family)
+            metrics.calls += 1
+            metrics.bytes += bytes_received
+            metrics.latency.observe(latency)
+            if ttfb is not None:
+                metrics.ttfb.observe(ttfb)
+            if status is None or status >= 400:
+                metrics.errors += 1
+
+    def record_parse(self, family: str, seconds: float) -> None:
+        """Enregistre la durée du parsing JSON d'une réponse"""
+        with self._lock:
+            self._family(family).parse.observe(seconds)
+
+    def record_cache_hit(self, family: str) -> None:
+        """Enregistre une réponse servie par le cache"""
+        with self._lock:
+            self._family(family).cache_hits += 1
+
+    def record_retry(self, family: str) -> None:
+        """Enregistre une nouvelle tentative"""
+        with self._lock:
+            self._family(family).retries += 1
+
+    def record_rate_limited(self, family: str) -> None:
+        """Enregistre une réponse 429"""
+        with self._lock:
+            self._family(family).rate_limited += 1
+
+    def record_sleep(self, family: str, seconds: float) -> None:
+        """Enregistre une attente (rate limiter ou backoff)"""
+        if seconds > 0:
+            with self._lock:
+                self._family(family).sleep_seconds += seconds
+
+    def snapshot(self) -> Dict:
+        """
+        Retourne l'état des métriques pour les rapports d'exécution
+
+        Returns:
+            Métriques par famille et totaux (dont le débit en appels/seconde)
+        """
+        with self._lock:
+            families = {name: metrics.snapshot() for name, metrics in sorted(self._families.items())}
+            elapsed = time.monotonic() - self._started_at
+
+        calls = sum(f['calls'] for f in families.values())
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'calls': calls,
+            'calls_per_second': round(calls / elapsed, 3) if elapsed > 0 else 0.0,
+            'bytes': sum(f['bytes'] for f in families.values()),
+            'retries': sum(f['retries'] for f in families.values()),
+            'rate_limited': sum(f['rate_limited'] for f in families.values()),
+            'sleep_seconds': round(sum(f['sleep_seconds'] for f in families.values()), 3),
+            'families': families
+        }
+
+    def write_prometheus(self, path: str = API_METRICS_PROMETHEUS_PATH) -> None:
+        """
+        Écrit les métriques au format texte Prometheus (écriture atomique)
+
+        Args:
+            path: Fichier .prom lu par le textfile collector
+        """
+        with self._lock:
+            families = dict(self._families)
+            lines = []
+
+            def counter(name: str, help_text: str, attribute: str) -> None:
+                lines.append(f'# HELP similarweb_api_{name} {help_text}')
+                lines.append(f'# TYPE similarweb_api_{name} counter')
+                for family, metrics in sorted(families.items()):
+                    lines.append(f'similarweb_api_{name}{{family="{family}"}} {getattr(metrics, attribute)}')
+
+            def histogram(name: str, help_text: str, attribute: str) -> None:
+                lines.append(f'# HELP similarweb_api_{name} {help_text}')
+                lines.append(f'# TYPE similarweb_api_{name} histogram')
+                for family, metrics in sorted(families.items()):
+                    hist = getattr(metrics, attribute)
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        lines.append(f'similarweb_api_{name}_bucket{{family="{family}",le="{bound}"}} {count}')
+                    lines.append(f'similarweb_api_{name}_bucket{{family="{family}",le="+Inf"}} {hist.count}')
+                    lines.append(f'similarweb_api_{name}_sum{{family="{family}"}} {hist.sum}')
+                    lines.append(f'similarweb_api_{name}_count{{family="{family}"}} {hist.count}')
+
+            counter('calls_total', 'Appels réseau', 'calls')
+            counter('errors_total', 'Appels en erreur', 'errors')
+            counter('cache_hits_total', 'Réponses servies par le cache', 'cache_hits')
+            counter('retries_total', 'Nouvelles tentatives', 'retries')
+            counter('rate_limited_total', 'Réponses 429', 'rate_limited')
+            counter('sleep_seconds_total', 'Temps passé à attendre', 'sleep_seconds')
+            counter('response_bytes_total', 'Octets reçus', 'bytes')
+            histogram('latency_seconds', 'Durée des appels', 'latency')
+            histogram('ttfb_seconds', 'Délai avant le premier octet', 'ttfb')
+            histogram('parse_seconds', 'Durée du parsing JSON', 'parse')
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+        logger.info(f"Métriques API exportées: {path}")
+
+
+def merge_metrics_snapshots(snapshots: List[Dict]) -> Dict:
+    """
+    Agrège les snapshots de plusieurs processus (backfill multi-processus)
+
+    Les compteurs sont additionnés ; les histogrammes ne sont pas fusionnés,
+    seuls leur nombre d'observations et leur somme le sont.
+
+    Args:
+        snapshots: Résultats de ApiMetrics.snapshot()
+
+    Returns:
+        Snapshot au même format (débit calculé sur la plus longue durée)
+    """
+    counters = ('calls', 'errors', 'cache_hits', 'retries', 'rate_limited', 'sleep_seconds', 'bytes')
+    families: Dict[str, Dict] = {}
+
+    for snapshot in snapshots:
+        for name, family in snapshot.get('families', {}).items():
+            merged = families.setdefault(name, {counter: 0 for counter in counters})
+            for counter in counters:
+                merged[counter] += family.get(counter, 0)
+            for histogram in ('latency_seconds', 'ttfb_seconds', 'parse_seconds'):
+                values = family.get(histogram, {})
+                merged_histogram = merged.setdefault(histogram, {'count': 0, 'sum': 0.0})
+                merged_histogram['count'] += values.get('count', 0)
+                merged_histogram['sum'] = round(merged_histogram['sum'] + values.get('sum', 0.0), 4)
+
+    elapsed = max((snapshot.get('elapsed_seconds', 0) for snapshot in snapshots), default=0)
+    calls = sum(snapshot.get('calls', 0) for snapshot in snapshots)
+    return {
+        'elapsed_seconds': elapsed,
+        'calls': calls,
+        'calls_per_second': round(calls / elapsed, 3) if elapsed > 0 else 0.0,
+        'bytes': sum(snapshot.get('bytes', 0) for snapshot in snapshots),
+        'retries': sum(snapshot.get('retries', 0) for snapshot in snapshots),
+        'rate_limited': sum(snapshot.get('rate_limited', 0) for snapshot in snapshots),
+        'sleep_seconds': round(sum(snapshot.get('sleep_seconds', 0) for snapshot in snapshots), 3),
+        'processes': len(snapshots),
+        'families': dict(sorted(families.items()))
+    }
+
+
+_shared_metrics = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_api_metrics() -> ApiMetrics:
+    """
+    Retourne le registre de métriques unique du processus
+
+    Returns:
+        Instance partagée de ApiMetrics
+    """
+    global _shared_metrics
+
+    with _shared_lock:
+        if _shared_metrics is None:
+            _shared_metrics = ApiMetrics()
+        return _shared_metrics
@@ -0,0 +1,491 @@
+"""
+Client asynchrone (asyncio + aiohttp) pour l'API SimilarWeb
+Mêmes méthodes que SimilarWebAPI, pour garder des centaines d'appels en vol
+sur une seule boucle d'événements pendant les backfills
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+import sys
+import os
+
+try:
+    import aiohttp
+except ImportError:
+    # aiohttp n'est pas installé, le client synchrone reste utilisable
+    aiohttp = None
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+from scripts.rate_limiter import TokenBucketRateLimiter
+from scripts.api_key_pool import ApiKeyPool, get_shared_api_key_pool
+from scripts.api_metrics import ApiMetrics, get_shared_api_metrics
+from scripts.response_cache import ResponseCache, get_shared_response_cache
+from scripts.segment_catalog import SegmentCatalog
+from scripts.retry_policy import (RETRYABLE_STATUS_CODES, CircuitBreakerRegistry, CircuitOpenError,
+                                  RetryPolicy, get_shared_circuit_breakers)
+from scripts.quota_ledger import (PRIORITY_NORMAL, QuotaBudgetExceededError, QuotaLedger,
+                                  get_shared_quota_ledger)
+from scripts.similarweb_api import SimilarWebAPI, get_endpoint_family
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSimilarWebAPI:
+    """Client asynchrone pour l'API SimilarWeb"""
+
+    def __init__(self, api_key: str = None,
+                 max_concurrency: int = ASYNC_MAX_CONCURRENCY,
+                 rate_limiter: TokenBucketRateLimiter = None,
+                 cache: ResponseCache = None, use_cache: bool = API_CACHE_ENABLED,
+                 retry_policy: RetryPolicy = None,
+                 circuit_breakers: CircuitBreakerRegistry = None,
+                 quota_ledger: QuotaLedger = None,
+                 priority: str = PRIORITY_NORMAL,
+                 key_pool: ApiKeyPool = None,
+                 metrics: ApiMetrics = None,
+                 base_url: str = None):
+        """
+        Initialise le client API asynchrone
+
+        Args:
+            api_key: Clé API SimilarWeb (pool SIMILARWEB_API_KEYS partagé si non fournie)
+            max_concurrency: Nombre maximum de requêtes en vol simultanément
+            rate_limiter: Limiteur de débit imposé (un limiteur partagé par clé par défaut)
+            cache: Cache des réponses (cache disque partagé par défaut)
+            use_cache: Si False, toutes les requêtes partent vers l'API
+            retry_policy: Politique de retry (backoff exponentiel + jitter)
+            circuit_breakers: Circuits par famille d'endpoints (registre partagé par défaut)
+            quota_ledger: Registre des appels et du budget mensuel (registre partagé par défaut)
+            priority: Priorité des extractions de ce client (high, normal, low)
+            key_pool: Pool de clés API (remplace api_key et rate_limiter)
+            metrics: Registre des métriques d'appels (registre partagé par défaut)
+            base_url: URL de l'API (SIMILARWEB_BASE_URL par défaut)
+        """
+        if aiohttp is None:
+            raise ImportError("aiohttp est requis pour AsyncSimilarWebAPI (pip install aiohttp)")
+
+        self.base_url = base_url or SIMILARWEB_BASE_URL
+        self.headers = API_HEADERS.copy()
+        self.max_concurrency = max_concurrency
+        self.cache = (cache or get_shared_response_cache()) if use_cache else None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breakers = circuit_breakers or get_shared_circuit_breakers()
+        self.quota_ledger = quota_ledger or get_shared_quota_ledger()
+        self.priority = priority
+
+        if key_pool is None:
+            if api_key or rate_limiter or quota_ledger:
+                key_pool = ApiKeyPool([api_key] if api_key else None,
+                                      quota_ledger=self.quota_ledger, rate_limiter=rate_limiter)
+            else:
+                key_pool = get_shared_api_key_pool()
+        self.key_pool = key_pool
+        self.api_key = key_pool.keys[0].api_key
+        self.rate_limiter = key_pool.keys[0].rate_limiter
+        self.metrics = metrics or get_shared_api_metrics()
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+        self._segment_catalogs = {}
+        self._catalog_lock = asyncio.Lock()
+
+        # Requêtes en vol, partagées par les coroutines qui demandent la même chose
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    async def _get_session(self) -> 'aiohttp.ClientSession':
+        """Crée la session HTTP au premier appel (doit tourner dans la boucle)"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                limit_per_host=self.max_concurrency
+            )
+            timeout = aiohttp.ClientTimeout(
+                sock_connect=API_REQUEST_TIMEOUT[0],
+                sock_read=API_REQUEST_TIMEOUT[1]
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                headers=self.headers
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Ferme la session HTTP et écrit le registre des appels"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        await asyncio.to_thread(self.quota_ledger.flush)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _make_request(self, endpoint: str, params: Dict = None) -> Optional[Dict]:
+        """
+        Effectue une requête à l'API (cache, puis déduplication des appels en vol)
+
+        Si le circuit de la famille d'endpoints est ouvert, la requête attend sa
+        réouverture sans bloquer la boucle (CIRCUIT_REQUEUE_MAX_WAIT au plus).
+
+        Args:
+            endpoint: Endpoint de l'API (sans le base_url)
+            params: Paramètres de la requête
+
+        Returns:
+            Réponse JSON ou None en cas d'erreur (objet partagé, ne pas modifier)
+        """
+        params = dict(params or {})
+
+        # Cache et registre SQLite sont synchrones : ils tournent hors de la boucle
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, endpoint, params,
+                                             self.base_url)
+            if cached is not None:
+                logger.info(f"Cache API: {endpoint}")
+                family = get_endpoint_family(endpoint)
+                await asyncio.to_thread(self.quota_ledger.record, endpoint, family, 200,
+                                        cached=True, priority=self.priority)
+                self.metrics.record_cache_hit(family)
+                return cached
+
+        key = ResponseCache.make_key(endpoint, params, self.base_url)
+        deferred_since = None
+        while True:
+            task = self._in_flight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._fetch(endpoint, params))
+                self._in_flight[key] = task
+                task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+            try:
+                # shield: l'annulation d'un appelant n'annule pas l'appel des autres
+                return await asyncio.shield(task)
+            except CircuitOpenError as e:
+                # Circuit ouvert : attendre sa réouverture sans bloquer la boucle, puis redemander
+                now = time.monotonic()
+                deferred_since = deferred_since or now
+                if e.open_until - deferred_since > CIRCUIT_REQUEUE_MAX_WAIT:
+                    logger.error(f"{e} depuis plus de {CIRCUIT_REQUEUE_MAX_WAIT}s, abandon: {endpoint}")
+                    return None
+                await asyncio.sleep(max(0.0, e.open_until - now))
+
+    async def _fetch(self, endpoint: str, params: Dict) -> Optional[Dict]:
+        """
+        Effectue l'appel réseau avec retry (backoff exponentiel + jitter) et circuit breaker
+
+        Les appels bloquants (registre SQLite, cache disque, limiteurs verrouillés
+        par flock) passent par asyncio.to_thread. Le jeton de la clé est réservé
+        une fois un créneau du sémaphore obtenu : un 429 ou une baisse de débit
+        s'applique aussi aux requêtes qui attendaient encore leur tour.
+
+        Args:
+            endpoint: Endpoint de l'API (sans le base_url)
+            params: Paramètres de la requête
+
+        Returns:
+            Réponse JSON ou None en cas d'erreur
+
+        Raises:
+            CircuitOpenError: si le circuit de la famille d'endpoints est ouvert
+        """
+        url = f"{self.base_url}{endpoint}"
+        session = await self._get_session()
+
+        family = get_endpoint_family(endpoint)
+        breaker = self.circuit_breakers.get(family)
+        max_retries = self.retry_policy.max_retries
+
+        for attempt in range(max_retries + 1):
+            if attempt:
+                self.metrics.record_retry(family)
+
+            # Budget vérifié avant le circuit : un refus ne retient pas l'appel test
+            await asyncio.to_thread(self.quota_ledger.check_budget, 1, self.priority)
+
+            if not breaker.allow_request():
+                logger.warning(f"Circuit {family} ouvert, appel reporté: {endpoint}")
+                raise CircuitOpenError(family, breaker.open_until)
+
+            status = None
+
+            try:
+                async with self._semaphore:
+                    # Choisir une clé et réserver un jeton de son limiteur, puis l'attendre sans bloquer la boucle
+                    try:
+                        key, wait = await asyncio.to_thread(self.key_pool.reserve)
+                    except QuotaBudgetExceededError:
+                        breaker.release_probe()
+                        raise
+                    params['api_key'] = key.api_key
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                        self.metrics.record_sleep(family, wait)
+
+                    logger.info(f"Appel API: {endpoint}")
+                    loop = asyncio.get_running_loop()
+                    started = loop.time()
+                    ttfb = None
+                    raw = b''
+                    try:
+                        async with session.get(url, params=params) as response:
+                            # Headers reçus : time-to-first-byte
+                            ttfb = loop.time() - started
+                            status = response.status
+                            headers = response.headers
+                            raw = await response.read()
+                    finally:
+                        self.metrics.record_call(family, loop.time() - started, ttfb=ttfb,
+                                                 bytes_received=len(raw), status=status)
+
+                cost = API_CALL_COST if status < 400 else 0
+                await asyncio.to_thread(self.quota_ledger.record, endpoint, family, status, len(raw),
+                                        cost=cost, priority=self.priority, api_key_id=key.key_id)
+                self.key_pool.record_cost(key, cost)
+                if status < 400:
+                    parse_started = loop.time()
+                    payload = json.loads(raw)
+                    self.metrics.record_parse(family, loop.time() - parse_started)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                if status is None:
+                    await asyncio.to_thread(self.quota_ledger.record, endpoint, family, None,
+                                            priority=self.priority, api_key_id=key.key_id)
+                breaker.record_failure()
+                logger.error(f"Erreur de requête: {e!r}")
+
+                if attempt < max_retries:
+                    delay = self.retry_policy.backoff(attempt)
+                    logger.info(f"Nouvelle tentative ({attempt + 1}/{max_retries}) dans {delay:.1f}s...")
+                    await asyncio.sleep(delay)
+                    self.metrics.record_sleep(family, delay)
+                    continue
+                return None
+
+            if status == 429:
+                # Le limiteur de cette clé repousse ses prochaines réservations
+                delay = await asyncio.to_thread(self.key_pool.on_rate_limited, key, headers)
+                self.metrics.record_rate_limited(family)
+                breaker.release_probe()
+                logger.warning(f"Rate limit atteint (clé {key.key_id}), reprise dans {delay:.1f} secondes...")
+                continue
+
+            if status == 401:
+                # Clé refusée : l'appel repart sur une autre clé s'il en reste
+                if self.key_pool.disable(key, 'clé refusée (HTTP 401)'):
+                    breaker.release_probe()
+                    continue
+
+            if status in RETRYABLE_STATUS_CODES:
+                breaker.record_failure()
+                logger.error(f"Erreur HTTP {status} sur {endpoint}")
+
+                if attempt < max_retries:
+                    delay = self.retry_policy.backoff(attempt)
+                    logger.info(f"Nouvelle tentative ({attempt + 1}/{max_retries}) dans {delay:.1f}s...")
+                    await asyncio.sleep(delay)
+                    self.metrics.record_sleep(family, delay)
+                    continue
+                return None
+
+            breaker.record_success()
+
+            if status >= 400:
+                logger.error(f"Erreur HTTP {status} sur {endpoint}: {raw[:200]!r}")
+                return None
+
+            await asyncio.to_thread(key.rate_limiter.on_success, headers)
+
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.set, endpoint, params, payload,
+                                        self.base_url)
+            return payload
+
+        logger.error(f"Abandon après {max_retries + 1} tentatives: {endpoint}")
+        return None
+
+    async def get_custom_segments(self, user_only: bool = True) -> Optional[List[Dict]]:
+        """
+        Récupère la liste des segments personnalisés
+
+        Args:
+            user_only: Si True, récupère uniquement les segments créés par l'utilisateur
+
+        Returns:
+            Liste des segments ou None en cas d'erreur
+        """
+        logger.info(f"Récupération des segments personnalisés (user_only={user_only})...")
+
+        params = {}
+        if user_only:
+            params['userOnlySegments'] = 'true'
+
+        response = await self._make_request('/segment/traffic-and-engagement/describe/', params)
+
+        if response and 'response' in response:
+            segments = response['response'].get('segments', [])
+            logger.info(f"{len(segments)} segments récupérés")
+            return segments
+
+        logger.error("Impossible de récupérer les segments")
+        return None
+
+    async def get_segment_catalog(self, user_only: bool = True) -> SegmentCatalog:
+        """
+        Retourne le catalogue de segments mémorisé, rafraîchi s'il a expiré
+
+        Args:
+            user_only: Si True, catalogue des segments créés par l'utilisateur
+
+        Returns:
+            Catalogue partagé par toutes les extractions du client
+        """
+        if user_only not in self._segment_catalogs:
+            self._segment_catalogs[user_only] = SegmentCatalog(user_only=user_only)
+
+        catalog = self._segment_catalogs[user_only]
+        # Lecture/écriture du fichier JSON du catalogue hors de la boucle ; un seul describe à la fois
+        async with self._catalog_lock:
+            if await asyncio.to_thread(catalog.fresh_segments) is None:
+                segments = await self.get_custom_segments(user_only=user_only)
+                await asyncio.to_thread(catalog.update, segments)
+        return catalog
+
+    async def get_segment_data(self, segment_id: str, start_date: str, end_date: str,
+                               country: str = DEFAULT_COUNTRY,
+                               granularity: str = DEFAULT_GRANULARITY) -> Optional[Dict]:
+        """
+        Récupère les données de trafic pour un segment spécifique
+        Les groupes de métriques sont demandés en parallèle
+        """
+        group_results = await asyncio.gather(*[
+            self._make_request(*SimilarWebAPI.segment_group_request(
+                segment_id, metrics_group, start_date, end_date, country, granularity))
+            for metrics_group in SEGMENT_METRICS_GROUPS
+        ])
+
+        return SimilarWebAPI._combine_segment_groups(list(group_results))
+
+    async def get_website_metric(self, domain: str, metric_endpoint: str,
+                                 start_date: str, end_date: str,
+                                 country: str = DEFAULT_COUNTRY,
+                                 granularity: str = DEFAULT_GRANULARITY) -> Optional[Dict]:
+        """
+        Récupère une métrique spécifique pour un site web
+
+        Args:
+            domain: Domaine à analyser
+            metric_endpoint: Endpoint de la métrique
+            start_date: Date de début
+            end_date: Date de fin
+            country: Code pays
+            granularity: Granularité
+
+        Returns:
+            Données de la métrique ou None en cas d'erreur
+        """
+        return await self._make_request(*SimilarWebAPI.website_metric_request(
+            domain, metric_endpoint, start_date, end_date, country, granularity))
+
+    async def extract_all_segments(self, start_date: str, end_date: str,
+                                   limit: int = None, user_only: bool = True,
+                                   granularity: str = DEFAULT_GRANULARITY) -> List[Dict]:
+        """
+        Extrait les données pour tous les segments personnalisés
+
+        Args:
+            start_date: Date de début
+            end_date: Date de fin
+            limit: Nombre maximum de segments à traiter (None = tous)
+            user_only: Si True, récupère uniquement les segments créés par l'utilisateur
+            granularity: Granularité demandée à l'API
+
+        Returns:
+            Liste des résultats pour chaque segment, dans l'ordre du catalogue
+        """
+        segments = (await self.get_segment_catalog(user_only)).segments
+        if not segments:
+            return []
+
+        if limit:
+            segments = segments[:limit]
+
+        logger.info(f"Extraction asynchrone de {len(segments)} segments...")
+
+        all_data = await asyncio.gather(*[
+            self.get_segment_data(segment.get('segment_id'), start_date, end_date,
+                                  granularity=granularity)
+            for segment in segments
+        ])
+
+        return [
+            SimilarWebAPI._build_segment_result(segment, data)
+            for segment, data in zip(segments, all_data)
+        ]
+
+    async def extract_website_data(self, domain: str, start_date: str, end_date: str,
+                                   granularity: str = DEFAULT_GRANULARITY) -> Dict:
+        """
+        Extrait toutes les métriques pour un site web
+
+        Args:
+            domain: Domaine à analyser
+            start_date: Date de début
+            end_date: Date de fin
+            granularity: Granularité demandée à l'API
+
+        Returns:
+            Dictionnaire avec toutes les métriques du site
+        """
+        logger.info(f"Extraction pour {domain}")
+
+        metric_names = list(WEBSITE_METRICS_ENDPOINTS.keys())
+        payloads = await asyncio.gather(*[
+            self.get_website_metric(domain, WEBSITE_METRICS_ENDPOINTS[metric_name],
+                                    start_date, end_date, granularity=granularity)
+            for metric_name in metric_names
+        ])
+
+        return SimilarWebAPI._build_website_result(domain, start_date, end_date,
+                                                   dict(zip(metric_names, payloads)))
+
+    async def extract_all_websites(self, domains: List[str], start_date: str, end_date: str,
+                                   granularity: str = DEFAULT_GRANULARITY) -> List[Dict]:
+        """
+        Extrait les données pour plusieurs sites web
+
+        Args:
+            domains: Liste des domaines à analyser
+            start_date: Date de début
+            end_date: Date de fin
+            granularity: Granularité demandée à l'API
+
+        Returns:
+            Liste des résultats pour chaque domaine
+        """
+        logger.info(f"Extraction asynchrone de {len(domains)} sites web...")
+
+        results = await asyncio.gather(*[
+            self.extract_website_data(domain, start_date, end_date, granularity)
+            for domain in domains
+        ])
+
+        return list(results)
+
+
+if __name__ == "__main__":
+    # Test du module
+    async def _test():
+        async with AsyncSimilarWebAPI() as api:
+            segments = await api.get_custom_segments()
+            if segments:
+                logger.info(f"Test réussi: {len(segments)} segments trouvés")
+            else:
+                logger.error("Test échoué: Impossible de récupérer les segments")
+
+    asyncio.run(_test())
@@ -0,0 +1,164 @@
+"""
+Journal de reprise du backfill historique
+Chaque lot d'unités terminées (entité, période, groupe de métriques) est ajouté
+en JSON Lines et synchronisé sur disque : une reprise ne refait que le reste
+"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+import sys
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+
+try:
+    import fcntl
+except ImportError:  # Windows : un seul processus écrit le journal
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+KIND_SEGMENT = 'segment'
+KIND_WEBSITE = 'website'
+
+
+class BackfillJournal:
+    """
+    Journal append-only des unités de backfill terminées
+
+    Format d'une ligne :
+        {"ts": ..., "kind": "segment", "period": "2024-03",
+         "entities": {"<segment_id>": ["visits,share", ...]}, "file": "..."}
+    ou, quand un mois est entièrement traité :
+        {"ts": ..., "kind": "period", "period": "2024-03"}
+    """
+
+    def __init__(self, path: str = BACKFILL_JOURNAL_PATH):
+        """
+        Initialise le journal et recharge les unités déjà terminées
+
+        Args:
+            path: Fichier JSON Lines du journal
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._done: Set[Tuple[str, str, str, str]] = set()
+        self._periods_done: Set[str] = set()
+        self._load()
+
+    def _load(self) -> None:
+        """Relit le journal (une dernière ligne tronquée par un crash est ignorée)"""
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ligne {line_number} illisible dans {self.path}, ignorée")
+                    continue
+
+                if entry.get('kind') == 'period':
+                    self._periods_done.add(entry['period'])
+                    continue
+
+                for entity, units in entry.get('entities', {}).items():
+                    for unit in units:
+                        self._done.add((entry['kind'], entry['period'], entity, unit))
+
+        if self._done or self._periods_done:
+            logger.info(f"Journal de backfill repris: {len(self._done)} unités, "
+                        f"{len(self._periods_done)} mois terminés")
+
+    def _append(self, entry: Dict) -> None:
+        """Ajoute une ligne et la force sur disque (verrou déjà pris)"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        entry = {'ts': datetime.now().isoformat(), **entry}
+
+        with open(self.path, 'a', encoding='utf-8') as f:
+            # Les workers d'un backfill multi-processus écrivent dans le même journal
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def is_done(self, kind: str, period: str, entity: str, units: Sequence[str]) -> bool:
+        """
+        Indique si toutes les unités d'une entité sont terminées pour une période
+
+        Args:
+            kind: KIND_SEGMENT ou KIND_WEBSITE
+            period: Mois au format YYYY-MM
+            entity: Identifiant du segment ou domaine
+            units: Groupes de métriques (segments) ou métriques (sites web) attendus
+        """
+        with self._lock:
+            return all((kind, period, entity, unit) in self._done for unit in units)
+
+    def pending(self, kind: str, period: str, entities: Iterable[str],
+                units: Sequence[str]) -> List[str]:
+        """
+        Filtre les entités qui ont encore des unités à extraire
+
+        Returns:
+            Entités à traiter, dans l'ordre d'origine
+        """
+        return [entity for entity in entities if not self.is_done(kind, period, entity, units)]
+
+    def record(self, kind: str, period: str, entities: Dict[str, List[str]], file: str = None) -> None:
+        """
+        Enregistre un lot d'unités terminées
+
+        Args:
+            kind: KIND_SEGMENT ou KIND_WEBSITE
+            period: Mois au format YYYY-MM
+            entities: Unités terminées par entité
+            file: Fichier de résultats qui contient ce lot
+        """
+        entities = {entity: list(units) for entity, units in entities.items() if units}
+        if not entities:
+            return
+
+        with self._lock:
+            self._append({'kind': kind, 'period': period, 'entities': entities, 'file': file})
+            for entity, units in entities.items():
+                for unit in units:
+                    self._done.add((kind, period, entity, unit))
+
+    def mark_period_done(self, period: str) -> None:
+        """Enregistre qu'un mois est entièrement extrait"""
+        with self._lock:
+            if period not in self._periods_done:
+                self._append({'kind': 'period', 'period': period})
+                self._periods_done.add(period)
+
+    def is_period_done(self, period: str) -> bool:
+        """Indique si un mois est entièrement extrait"""
+        with self._lock:
+            return period in self._periods_done
+
+    def reset(self) -> None:
+        """Repart d'un journal vide (l'ancien est conservé en .bak)"""
+        with self._lock:
+            if os.path.exists(self.path):
+                os.replace(self.path, self.path + '.bak')
+            self._done.clear()
+            self._periods_done.clear()
+
+    def summary(self) -> Dict:
+        """Retourne l'avancement pour les rapports d'exécution"""
+        with self._lock:
+            return {
+                'path': self.path,
+                'units_done': len(self._done),
+                'periods_done': sorted(self._periods_done)
+            }
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Benchmark de bout en bout des extractions contre le serveur SimilarWeb local
+Balaye le nombre d'entités, la plage de dates, la concurrence et la latence simulée
+
+Usage:
+    python scripts/benchmark_extraction.py --stages segments,websites --segments 88,1000 \\
+        --domains 21,200 --days 7,31 --workers 1,8,32 --latency-ms 50,200
+    python scripts/benchmark_extraction.py --stages normalize --segments 88 --domains 21,200 --days 365,1095
+    python scripts/benchmark_extraction.py --compare data/benchmarks/benchmark_<ts>.json
+"""
+import argparse
+import glob
+import itertools
+import json
+import logging
+import multiprocessing
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+import sys
+import os
+
+# Ajouter le chemin parent pour importer les modules
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+from config.config import *
+from scripts.fake_similarweb_server import (FakeSimilarWebState, build_segment_payload,
+                                            build_website_payload, fake_segment_id,
+                                            start_fake_server)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+BENCHMARK_PATH = os.path.join(DATA_PATH, 'benchmarks')
+BENCHMARK_START_DATE = date(2025, 1, 1)
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def _float_list(value: str) -> List[float]:
+    return [float(v) for v in value.split(',') if v.strip()]
+
+
+def build_scenarios(args) -> List[Dict]:
+    """
+    Produit le plan de benchmark (produit cartésien des paramètres par étape)
+
+    Returns:
+        Liste des scénarios avec un identifiant stable pour les comparaisons
+    """
+    scenarios = []
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+
+    for stage in stages:
+        if stage == 'segments':
+            grid = itertools.product(args.segments, [0], args.days, [0], args.workers, args.latency_ms)
+        elif stage == 'websites':
+            grid = itertools.product([0], args.domains, args.days, [0], args.workers, args.latency_ms)
+        elif stage == 'backfill':
+            grid = itertools.product(args.segments, args.domains, [0], args.months, args.workers, args.latency_ms)
+        elif stage == 'normalize':
+            # Hors API : ni concurrence ni latence
+            grid = itertools.product(args.segments, args.domains, args.days, [0], [1], [0])
+        else:
+            raise ValueError(f"Étape inconnue: {stage}")
+
+        for segments, domains, days, months, workers, latency_ms in grid:
+            scenario = {
+                'stage': stage,
+                'segments': segments,
+                'domains': domains,
+                'days': days,
+                'months': months,
+                'workers': workers,
+                'latency_ms': latency_ms,
+                'server_rate_limit': args.server_rate_limit,
+                'throttle_rate': args.throttle_rate,
+                'error_rate': args.error_rate,
+                'client_rps': args.client_rps
+            }
+            scenario['id'] = (f"{stage}|seg={segments}|dom={domains}|days={days}|months={months}"
+                              f"|workers={workers}|latency={latency_ms}")
+            scenarios.append(scenario)
+
+    return scenarios
+
+
+def _count_segment_points(records: List[Dict]) -> int:
+    """Points de données utiles dans des résultats de segments"""
+    return sum(len((r.get('data') or {}).get('segments', [])) for r in records if not r.get('error'))
+
+
+def _count_website_points(records: List[Dict]) -> int:
+    """Points de données utiles (dates de visites) dans des résultats de sites web"""
+    return sum(len(((r.get('metrics') or {}).get('visits') or {}).get('visits', [])) for r in records)
+
+
+def _daily_params(days: int) -> Dict[str, str]:
+    end = BENCHMARK_START_DATE + timedelta(days=days - 1)
+    return {'start_date': BENCHMARK_START_DATE.isoformat(), 'end_date': end.isoformat(), 'granularity': 'daily'}
+
+
+def write_segment_file(segments: int, days: int) -> str:
+    """
+    Écrit un fichier NDJSON d'enregistrements de segments quotidiens (sans appel API)
+
+    Args:
+        segments: Nombre de segments
+        days: Nombre de jours de chaque série, à partir de BENCHMARK_START_DATE
+
+    Returns:
+        Chemin du fichier écrit
+    """
+    from scripts.result_sink import NdjsonResultSink
+
+    params = dict(_daily_params(days), metrics=','.join(SEGMENT_METRICS_GROUPS))
+
+    with NdjsonResultSink('segments_normalize') as sink:
+        for index in range(segments):
+            segment_id = fake_segment_id(index)
+            sink.write({
+                'segment_id': segment_id,
+                'segment_name': f'Segment {index}',
+                'extraction_granularity': 'daily',
+                'data': build_segment_payload(segment_id, params)[0]
+            })
+    return sink.files[0]
+
+
+def write_website_file(domains: List[str], days: int) -> str:
+    """
+    Écrit un fichier NDJSON d'enregistrements de sites web quotidiens (sans appel API)
+
+    Args:
+        domains: Domaines
+        days: Nombre de jours de chaque série, à partir de BENCHMARK_START_DATE
+
+    Returns:
+        Chemin du fichier écrit
+    """
+    from scripts.result_sink import NdjsonResultSink
+
+    params = _daily_params(days)
+
+    with NdjsonResultSink('websites_normalize') as sink:
+        for domain in domains:
+            sink.write({
+                'domain': domain,
+                'extraction_granularity': 'daily',
+                'metrics': {name: build_website_payload(domain, endpoint, params)[0]
+                            for name, endpoint in WEBSITE_METRICS_ENDPOINTS.items()}
+            })
+    return sink.files[0]
+
+
+def run_scenario(scenario: Dict, base_url: str) -> Dict:
+    """
+    Exécute un scénario dans le processus courant (appelé dans un processus dédié)
+
+    Le scénario tourne dans un répertoire temporaire : sorties JSON, catalogue
+    de segments et registre de quota n'interfèrent ni avec data/ ni entre eux.
+
+    Args:
+        scenario: Scénario produit par build_scenarios
+        base_url: URL du serveur local
+
+    Returns:
+        Mesures du scénario
+    """
+    from scripts.similarweb_api import SimilarWebAPI
+    from scripts.rate_limiter import TokenBucketRateLimiter
+    from scripts.single_flight import SingleFlight
+    from scripts.retry_policy import CircuitBreakerRegistry
+    from scripts.quota_ledger import PRIORITY_HIGH, QuotaLedger
+    from scripts.api_metrics import ApiMetrics
+    from scripts.daily_extraction import (extract_segments_daily, extract_websites_daily,
+                                          get_date_range_for_extraction)
+    from scripts.historical_backfill import run_backfill
+    from scripts.result_sink import iter_ndjson
+    from scripts.normalization import (ENTITY_SEGMENT, ENTITY_WEBSITE, normalize_segments,
+                                       normalize_websites)
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    workdir = tempfile.mkdtemp(prefix='similarweb_benchmark_')
+    os.chdir(workdir)
+    os.makedirs(DATA_PATH, exist_ok=True)
+
+    rps = scenario['client_rps']
+    api_client = SimilarWebAPI(
+        api_key='benchmark',
+        base_url=base_url,
+        use_cache=False,
+        rate_limiter=TokenBucketRateLimiter(rate=rps, burst=max(1, int(rps)),
+                                            min_rate=min(API_RATE_LIMIT_MIN_RPS, rps), max_rate=rps),
+        single_flight=SingleFlight(),
+        circuit_breakers=CircuitBreakerRegistry(),
+        quota_ledger=QuotaLedger(os.path.join(workdir, 'quota.sqlite'), monthly_quota=10 ** 9, reserve=0),
+        metrics=ApiMetrics(),
+        priority=PRIORITY_HIGH
+    )
+    domains = [f'site{i:05d}.example' for i in range(scenario['domains'])]
+
+    normalize_seconds = None
+    started = time.perf_counter()
+    try:
+        if scenario['stage'] == 'normalize':
+            # Relecture + normalisation de fichiers multi-années (génération non mesurée),
+            # chaque type d'entité chronométré séparément
+            files = [(ENTITY_WEBSITE, normalize_websites, write_website_file(domains, scenario['days']))]
+            if scenario['segments']:
+                files.append((ENTITY_SEGMENT, normalize_segments,
+                              write_segment_file(scenario['segments'], scenario['days'])))
+            normalize_seconds, data_points, wall = {}, 0, 0.0
+            for kind, normalize, path in files:
+                started = time.perf_counter()
+                data_points += len(normalize(iter_ndjson(path)))
+                normalize_seconds[kind] = round(time.perf_counter() - started, 3)
+                wall += normalize_seconds[kind]
+        elif scenario['stage'] in ('segments', 'websites'):
+            end = BENCHMARK_START_DATE + timedelta(days=scenario['days'] - 1)
+            periods = get_date_range_for_extraction(BENCHMARK_START_DATE.isoformat(), end.isoformat(), 'daily')
+
+            if scenario['stage'] == 'segments':
+                records = extract_segments_daily(api_client, periods, max_workers=scenario['workers'])
+                data_points = _count_segment_points(records)
+            else:
+                records = extract_websites_daily(api_client, periods, domains=domains,
+                                                 max_workers=scenario['workers'])
+                data_points = _count_website_points(records)
+        else:
+            run_backfill(start_year=2024, end_month=f"2024-{scenario['months']:02d}",
+                         limit_segments=scenario['segments'], batch_size=scenario['months'],
+                         max_workers=scenario['workers'], use_cache=False, assume_yes=True,
+                         domains=domains, api_client=api_client)
+            data_points = 0
+            for path in glob.glob(os.path.join(DATA_PATH, 'segments_extraction_*.ndjson')):
+                data_points += _count_segment_points(list(iter_ndjson(path)))
+            for path in glob.glob(os.path.join(DATA_PATH, 'websites_extraction_*.ndjson')):
+                data_points += _count_website_points(list(iter_ndjson(path)))
+        if normalize_seconds is None:
+            wall = time.perf_counter() - started
+    finally:
+        api_client.close()
+        os.chdir(ROOT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    metrics = api_client.metrics.snapshot()
+    result = {
+        'wall_seconds': round(wall, 3),
+        'calls': metrics['calls'],
+        'calls_per_second': round(metrics['calls'] / wall, 3) if wall > 0 else 0.0,
+        'data_points': data_points,
+        'calls_per_data_point': round(metrics['calls'] / data_points, 4) if data_points else None,
+        'retries': metrics['retries'],
+        'rate_limited': metrics['rate_limited'],
+        'sleep_seconds': metrics['sleep_seconds'],
+        'bytes': metrics['bytes'],
+        # ru_maxrss est en kilo-octets sous Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+    if normalize_seconds is not None:
+        result['normalize_seconds'] = normalize_seconds
+    return result
+
+
+def _scenario_worker(scenario: Dict, base_url: str, queue) -> None:
+    """Point d'entrée du processus d'un scénario"""
+    try:
+        queue.put({'ok': True, 'result': run_scenario(scenario, base_url)})
+    except Exception as e:
+        queue.put({'ok': False, 'error': f'{type(e).__name__}: {e}'})
+
+
+def run_benchmark(scenarios: List[Dict], timeout: float = 1800) -> List[Dict]:
+    """
+    Exécute les scénarios un par un, chacun dans un processus neuf (RSS mesurable)
+
+    Args:
+        scenarios: Scénarios à exécuter
+        timeout: Durée maximale d'un scénario en secondes
+
+    Returns:
+        Scénarios complétés de leurs mesures (ou de leur erreur)
+    """
+    server, base_url = start_fake_server()
+    context = multiprocessing.get_context('spawn')
+    results = []
+
+    try:
+        for i, scenario in enumerate(scenarios):
+            logger.info(f"Scénario {i+1}/{len(scenarios)}: {scenario['id']}")
+
+            # État neuf du serveur pour chaque scénario
+            server.state = FakeSimilarWebState(
+                segments=max(scenario['segments'], 1),
+                latency_ms=scenario['latency_ms'],
+                rate_limit=scenario['server_rate_limit'],
+                throttle_rate=scenario['throttle_rate'],
+                error_rate=scenario['error_rate']
+            )
+
+            queue = context.Queue()
+            process = context.Process(target=_scenario_worker, args=(scenario, base_url, queue))
+            process.start()
+
+            try:
+                outcome = queue.get(timeout=timeout)
+            except Exception:
+                outcome = {'ok': False, 'error': f'timeout après {timeout}s'}
+                process.terminate()
+            process.join()
+
+            record = dict(scenario)
+            record['server'] = server.state.snapshot()
+            if outcome['ok']:
+                record.update(outcome['result'])
+                logger.info(f"   {record['wall_seconds']}s, {record['calls_per_second']} appels/s, "
+                            f"{record['data_points']} points, RSS {record['peak_rss_mb']} Mo")
+                if 'normalize_seconds' in record:
+                    logger.info("   Normalisation: " + ', '.join(
+                        f"{kind} {seconds}s" for kind, seconds in record['normalize_seconds'].items()))
+            else:
+                record['error'] = outcome['error']
+                logger.error(f"   Échec: {outcome['error']}")
+            results.append(record)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return results
+
+
+def get_git_revision() -> Optional[str]:
+    """Commit courant, pour rattacher les résultats à une version"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_benchmark(results: List[Dict], output_dir: str = BENCHMARK_PATH) -> str:
+    """
+    Sauvegarde les résultats avec le contexte d'exécution
+
+    Returns:
+        Chemin du fichier écrit
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created_at': datetime.now().isoformat(),
+            'git_revision': get_git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'scenarios': results
+        }, f, indent=2, ensure_ascii=False)
+
+    return path
+
+
+def compare_benchmarks(results: List[Dict], baseline_path: str) -> None:
+    """
+    Affiche l'évolution du débit et du temps par rapport à un benchmark précédent
+
+    Args:
+        results: Résultats courants
+        baseline_path: Fichier JSON d'un benchmark précédent
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {s['id']: s for s in baseline.get('scenarios', []) if 'error' not in s}
+
+    print(f"\nComparaison avec {baseline_path} (révision {baseline.get('git_revision')})")
+    for record in results:
+        before = previous.get(record['id'])
+        if not before or 'error' in record:
+            continue
+        speedup = before['wall_seconds'] / record['wall_seconds'] if record['wall_seconds'] else 0
+        flag = '  RÉGRESSION' if speedup < 0.9 else ''
+        print(f"   {record['id']}: {before['wall_seconds']}s -> {record['wall_seconds']}s "
+              f"(x{speedup:.2f}){flag}")
+
+
+def print_report(results: List[Dict]) -> None:
+    """Affiche un tableau récapitulatif"""
+    print(f"\n{'Scénario':<72} {'Temps (s)':>10} {'Appels/s':>10} {'Appels/pt':>10} {'RSS (Mo)':>9}")
+    for record in results:
+        if 'error' in record:
+            print(f"{record['id']:<72} ERREUR: {record['error']}")
+            continue
+        per_point = record['calls_per_data_point']
+        print(f"{record['id']:<72} {record['wall_seconds']:>10} {record['calls_per_second']:>10} "
+              f"{per_point if per_point is not None else '-':>10} {record['peak_rss_mb']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark des extractions contre l\'API SimilarWeb locale')
+    parser.add_argument('--stages', default='segments,websites',
+                        help='Étapes à mesurer: segments, websites, backfill, '
+                             'normalize (lignes de sites web et de segments)')
+    parser.add_argument('--segments', type=_int_list, default=[88], help='Nombres de segments (ex: 88,1000,5000)')
+    parser.add_argument('--domains', type=_int_list, default=[21], help='Nombres de domaines (ex: 21,200,1000)')
+    parser.add_argument('--days', type=_int_list, default=[7], help='Plages de dates en jours (étapes quotidiennes)')
+    parser.add_argument('--months', type=_int_list, default=[1], help='Nombre de mois (backfill)')
+    parser.add_argument('--workers', type=_int_list, default=[1, 8], help='Niveaux de concurrence')
+    parser.add_argument('--latency-ms', type=_float_list, default=[100], help='Latences médianes simulées (ms)')
+    parser.add_argument('--server-rate-limit', type=float, default=0,
+                        help='Rate limit du serveur en req/s (0 = illimité)')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='Probabilité d\'un 429 aléatoire')
+    parser.add_argument('--error-rate', type=float, default=0, help='Probabilité d\'une erreur 503')
+    parser.add_argument('--client-rps', type=float, default=1000, help='Débit du rate limiter client (req/s)')
+    parser.add_argument('--timeout', type=float, default=1800, help='Durée maximale d\'un scénario (s)')
+    parser.add_argument('--output', default=BENCHMARK_PATH, help='Dossier des résultats')
+    parser.add_argument('--compare', help='Benchmark précédent à comparer')
+
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(args)
+    logger.info(f"{len(scenarios)} scénarios à exécuter")
+
+    results = run_benchmark(scenarios, timeout=args.timeout)
+    path = save_benchmark(results, args.output)
+
+    print_report(results)
+    if args.compare:
+        compare_benchmarks(results, args.compare)
+
+    logger.info(f"Résultats sauvegardés dans {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ import sys
 import os
 import json
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import argparse
@@ -15,6 +16,9 @@ import argparse
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config.config import *
 from scripts.similarweb_api import SimilarWebAPI, save_results_to_json
+from scripts.quota_ledger import PRIORITY_HIGH, PRIORITY_NORMAL
+from scripts.task_scheduler import TaskScheduler
+from scripts.result_sink import NdjsonResultSink, open_result_sink
 
 # Configuration du logging
 logging.basicConfig(
@@ -79,99 +83,347 @@ def get_date_range_for_extraction(start_date: str, end_date: str, granularity: s
     return periods
 
 
-def extract_segments_daily(api_client: SimilarWebAPI, periods: List[Dict], 
-                          limit: int = None) -> List[Dict]:
-    """
-    Extrait les segments avec la granularité correcte
+def _period_granularity(period: Dict) -> str:
+    """Retourne 'daily' si la période est un jour (YYYY-MM-DD), 'monthly' sinon"""
+    return 'daily' if '-' in period['api_format'] and len(period['api_format']) > 7 else 'monthly'
+
+
+def plan_request_windows(periods: List[Dict],
+                         max_days: int = API_MAX_DAILY_WINDOW_DAYS) -> List[Dict]:
     """
-    logger.info(f"=== EXTRACTION SEGMENTS ({len(periods)} périodes) ===")
+    Regroupe les périodes journalières contiguës en fenêtres d'appel API
     
-    all_results = []
+    Un seul appel avec granularity=daily couvre toute la fenêtre au lieu d'un
+    appel par jour. Les périodes mensuelles restent une fenêtre chacune.
     
-    for i, period in enumerate(periods):
-        logger.info(f"Période {i+1}/{len(periods)}: {period['start_date']} → {period['end_date']}")
+    Args:
+        periods: Périodes produites par get_date_range_for_extraction
+        max_days: Nombre maximum de jours couverts par un appel
         
-        # Utiliser le format API approprié
-        segments_data = api_client.extract_all_segments(
-            start_date=period['api_format'],
-            end_date=period['api_format'], 
-            limit=limit,
-            user_only=True
-        )
+    Returns:
+        Liste de fenêtres {'start_date', 'end_date', 'granularity', 'periods'}
+    """
+    windows = []
+    previous_day = None
+    
+    for period in periods:
+        if _period_granularity(period) != 'daily':
+            windows.append({
+                'start_date': period['api_format'],
+                'end_date': period['api_format'],
+                'granularity': DEFAULT_GRANULARITY,
+                'periods': [period]
+            })
+            previous_day = None
+            continue
         
-        # Ajouter l'information de période à chaque segment
-        for segment in segments_data:
-            segment['extraction_period'] = period
-            segment['extraction_granularity'] = 'daily' if '-' in period['api_format'] and len(period['api_format']) > 7 else 'monthly'
+        day = datetime.strptime(period['api_format'], '%Y-%m-%d').date()
         
-        all_results.extend(segments_data)
+        # Prolonger la fenêtre courante si le jour est contigu et qu'il reste de la place
+        if (previous_day is not None and day == previous_day + timedelta(days=1)
+                and len(windows[-1]['periods']) < max_days):
+            windows[-1]['end_date'] = period['api_format']
+            windows[-1]['periods'].append(period)
+        else:
+            windows.append({
+                'start_date': period['api_format'],
+                'end_date': period['api_format'],
+                'granularity': 'daily',
+                'periods': [period]
+            })
+        previous_day = day
+    
+    return windows
+
+
+def _points_for_day(points: List, day: str) -> List:
+    """Filtre une série de points sur un jour (dates YYYY-MM-DD ou ISO complètes)"""
+    return [p for p in points if isinstance(p, dict) and str(p.get('date', ''))[:10] == day]
+
+
+def fan_out_segments(segments_data: List[Dict], window: Dict) -> List[Dict]:
+    """
+    Redistribue les résultats d'une fenêtre en un enregistrement par segment et par jour
+    
+    Args:
+        segments_data: Résultats de extract_all_segments pour la fenêtre
+        window: Fenêtre produite par plan_request_windows
         
-        # Pause entre les périodes
-        if i < len(periods) - 1:
-            time.sleep(2)
+    Returns:
+        Enregistrements au même format qu'une extraction jour par jour
+    """
+    results = []
     
-    # Statistiques
-    stats = {
-        'total': len(all_results),
-        'success': len([s for s in all_results if not s.get('error')]),
-        'errors': len([s for s in all_results if s.get('error')])
-    }
+    for period in window['periods']:
+        granularity = _period_granularity(period)
+        
+        for segment in segments_data:
+            record = dict(segment)
+            
+            # Une fenêtre d'un jour (ou un mois) correspond déjà à la période
+            if len(window['periods']) > 1 and segment.get('data'):
+                points = _points_for_day(segment['data'].get('segments', []), period['api_format'])
+                if points:
+                    record['data'] = {'meta': segment['data'].get('meta', {}), 'segments': points}
+                else:
+                    record['data'] = None
+                    record['error'] = True
+            
+            record['extraction_period'] = period
+            record['extraction_granularity'] = granularity
+            results.append(record)
     
-    logger.info(f"Segments: {stats['success']}/{stats['total']} extraits avec succès")
+    return results
+
+
+def fan_out_websites(websites_data: List[Dict], window: Dict) -> List[Dict]:
+    """
+    Redistribue les résultats d'une fenêtre en un enregistrement par site et par jour
+    
+    Args:
+        websites_data: Résultats de extract_all_websites pour la fenêtre
+        window: Fenêtre produite par plan_request_windows
+        
+    Returns:
+        Enregistrements au même format qu'une extraction jour par jour
+    """
+    results = []
+    
+    for period in window['periods']:
+        granularity = _period_granularity(period)
+        
+        for website in websites_data:
+            record = dict(website)
+            
+            if len(window['periods']) > 1:
+                day = period['api_format']
+                record['period'] = f"{day} to {day}"
+                record['metrics'] = {}
+                
+                for metric_name, payload in website.get('metrics', {}).items():
+                    if not payload:
+                        record['metrics'][metric_name] = None
+                        continue
+                    
+                    # Filtrer chaque série datée du payload, garder le reste (meta...)
+                    day_payload = {}
+                    has_points = False
+                    for key, value in payload.items():
+                        if isinstance(value, list):
+                            value = _points_for_day(value, day)
+                            has_points = has_points or bool(value)
+                        day_payload[key] = value
+                    
+                    record['metrics'][metric_name] = day_payload if has_points else None
+                
+                record['endpoints_succeeded'] = sum(1 for payload in record['metrics'].values() if payload)
+            
+            record['extraction_period'] = period
+            record['extraction_granularity'] = granularity
+            results.append(record)
     
-    return all_results
+    return results
 
 
-def extract_websites_daily(api_client: SimilarWebAPI, periods: List[Dict],
-                          domains: List[str] = None) -> List[Dict]:
+def _segment_succeeded(record: Dict) -> bool:
+    """Un enregistrement de segment est réussi s'il n'a pas le flag d'erreur"""
+    return not record.get('error')
+
+
+def _website_succeeded(record: Dict) -> bool:
+    """Un enregistrement de site est réussi si au moins une métrique a répondu"""
+    return any(record.get('metrics', {}).values())
+
+
+def _catalog_segments(api_client: SimilarWebAPI, limit: int = None) -> List[Dict]:
+    """Segments du catalogue à extraire (les limit premiers si demandé)"""
+    catalog_segments = api_client.get_segment_catalog(user_only=True).get_segments() or []
+    return catalog_segments[:limit] if limit else catalog_segments
+
+
+def _load_domains(domains: List[str] = None) -> List[str]:
+    """Domaines à extraire : ceux fournis, sinon la liste de manage_websites"""
+    if domains is not None:
+        return domains
+    try:
+        from scripts.manage_websites import load_websites
+        domains = load_websites()
+        logger.info(f"{len(domains)} sites web chargés")
+    except (OSError, ValueError) as e:
+        domains = TARGET_DOMAINS
+        logger.warning(f"Liste des sites web illisible ({e}), "
+                       f"utilisation de la liste par défaut: {len(domains)} sites")
+    return domains
+
+
+def estimate_extraction_calls(api_client: SimilarWebAPI, periods: List[Dict],
+                              segments: bool = True, websites: bool = True,
+                              limit: int = None, domains: List[str] = None) -> int:
     """
-    Extrait les websites avec la granularité correcte
+    Estime le nombre d'appels API facturables d'une extraction
+    
+    Une fenêtre d'appel coûte un appel par couple (segment, groupe de métriques)
+    et un par couple (domaine, endpoint) ; les appels que le cache servirait ne
+    sont pas comptés (une relance d'une extraction terminée ne coûte rien).
+    
+    Args:
+        api_client: Instance du client API (catalogue de segments, cache)
+        periods: Périodes à extraire
+        segments: Extraire les segments
+        websites: Extraire les sites web
+        limit: Limite du nombre de segments
+        domains: Domaines à extraire (liste de manage_websites si absent)
+        
+    Returns:
+        Nombre d'appels facturables au plus
     """
-    logger.info(f"=== EXTRACTION WEBSITES ({len(periods)} périodes) ===")
-    
-    # Charger les domaines
-    if domains is None:
-        try:
-            from scripts.manage_websites import load_websites
-            domains = load_websites()
-            logger.info(f"{len(domains)} sites web chargés")
-        except:
-            domains = TARGET_DOMAINS
-            logger.warning(f"Utilisation de la liste par défaut: {len(domains)} sites")
-    
-    all_results = []
-    
-    for i, period in enumerate(periods):
-        logger.info(f"Période {i+1}/{len(periods)}: {period['start_date']} → {period['end_date']}")
-        
-        # Utiliser le format API approprié
-        websites_data = api_client.extract_all_websites(
-            domains=domains,
-            start_date=period['api_format'],
-            end_date=period['api_format']
+    catalog_segments = _catalog_segments(api_client, limit) if segments else []
+    domains = _load_domains(domains) if websites else []
+    
+    calls = []
+    for window in plan_request_windows(periods):
+        dates = (window['start_date'], window['end_date'])
+        calls.extend(
+            api_client.segment_group_request(segment.get('segment_id'), group, *dates,
+                                             granularity=window['granularity'])
+            for segment in catalog_segments
+            for group in SEGMENT_METRICS_GROUPS
+        )
+        calls.extend(
+            api_client.website_metric_request(domain, endpoint, *dates,
+                                              granularity=window['granularity'])
+            for domain in domains
+            for endpoint in WEBSITE_METRICS_ENDPOINTS.values()
         )
+    return sum(1 for endpoint, params in calls if not api_client.is_cached(endpoint, params))
+
+
+def extract_periods(api_client: SimilarWebAPI, periods: List[Dict],
+                    segments: bool = True, websites: bool = True,
+                    limit: int = None, domains: List[str] = None,
+                    max_workers: int = EXTRACTION_MAX_WORKERS,
+                    deadline: float = None,
+                    segments_sink: NdjsonResultSink = None,
+                    websites_sink: NdjsonResultSink = None) -> Dict:
+    """
+    Extrait segments et sites web de toutes les périodes en un seul passage
+    
+    Les jours contigus sont regroupés en fenêtres d'appel (voir plan_request_windows),
+    puis toutes les fenêtres sont aplaties en tâches (entité, fenêtre, endpoint)
+    dans un même ordonnanceur : pas de pause entre les fenêtres, seul le rate
+    limiter rythme les appels.
+    
+    Avec un sink, les enregistrements d'une fenêtre sont écrits dès qu'elle est
+    terminée au lieu d'être gardés en mémoire jusqu'à la fin.
+    
+    Args:
+        api_client: Instance du client API
+        periods: Périodes à extraire
+        segments: Extraire les segments
+        websites: Extraire les sites web
+        limit: Limite du nombre de segments
+        domains: Domaines à extraire (liste de manage_websites si absent)
+        max_workers: Nombre d'appels simultanés (1 = séquentiel)
+        deadline: Échéance (time.time()) au-delà de laquelle les appels sont abandonnés
+        segments_sink: Destination des enregistrements de segments (liste retournée sinon)
+        websites_sink: Destination des enregistrements de sites web (liste retournée sinon)
         
-        # Ajouter l'information de période à chaque website
-        for website in websites_data:
-            website['extraction_period'] = period
-            website['extraction_granularity'] = 'daily' if '-' in period['api_format'] and len(period['api_format']) > 7 else 'monthly'
+    Returns:
+        {'segments': [...], 'websites': [...], 'stats': {...}} ; les listes ne
+        contiennent que les enregistrements qui ne sont pas partis dans un sink
+    """
+    windows = plan_request_windows(periods)
+    scheduler = TaskScheduler(max_workers)
+    extracted = {'segments': [], 'websites': []}
+    stats = {'segments': {'total': 0, 'success': 0}, 'websites': {'total': 0, 'success': 0}}
+    
+    def emit(kind: str, records: List[Dict], sink: NdjsonResultSink, succeeded) -> None:
+        # Appelé par l'ordonnanceur, une fenêtre à la fois
+        stats[kind]['total'] += len(records)
+        stats[kind]['success'] += len([r for r in records if succeeded(r)])
+        if sink is not None:
+            sink.write_many(records)
+        else:
+            extracted[kind].extend(records)
+    
+    if segments:
+        catalog_segments = _catalog_segments(api_client, limit)
         
-        all_results.extend(websites_data)
+        logger.info(f"=== EXTRACTION SEGMENTS ({len(periods)} périodes, {len(windows)} fenêtres d'appel, "
+                    f"{len(catalog_segments)} segments) ===")
+        for window in windows:
+            api_client.schedule_segments(
+                scheduler, catalog_segments, window['start_date'], window['end_date'],
+                granularity=window['granularity'], deadline=deadline,
+                on_done=lambda data, window=window: emit(
+                    'segments', fan_out_segments(data, window), segments_sink, _segment_succeeded)
+            )
+    
+    if websites:
+        domains = _load_domains(domains)
         
-        # Pause entre les périodes
-        if i < len(periods) - 1:
-            time.sleep(2)
+        logger.info(f"=== EXTRACTION WEBSITES ({len(periods)} périodes, {len(windows)} fenêtres d'appel, "
+                    f"{len(domains)} sites) ===")
+        for window in windows:
+            api_client.schedule_websites(
+                scheduler, domains, window['start_date'], window['end_date'],
+                granularity=window['granularity'], deadline=deadline,
+                on_done=lambda data, window=window: emit(
+                    'websites', fan_out_websites(data, window), websites_sink, _website_succeeded)
+            )
+    
+    scheduler.run()
+    if scheduler.stats['expired']:
+        logger.warning(f"{scheduler.stats['expired']} appels abandonnés (échéance dépassée)")
+    
+    # Les fenêtres se terminent dans le désordre : trier les listes gardées en mémoire
+    for kind in extracted:
+        extracted[kind].sort(key=lambda r: r['extraction_period']['api_format'])
     
-    # Statistiques
-    stats = {
-        'total': len(all_results),
-        'success': len([w for w in all_results if any(w.get('metrics', {}).values())]),
-        'errors': len([w for w in all_results if not any(w.get('metrics', {}).values())])
-    }
+    if segments:
+        logger.info(f"Segments: {stats['segments']['success']}/{stats['segments']['total']} extraits avec succès")
+    if websites:
+        logger.info(f"Websites: {stats['websites']['success']}/{stats['websites']['total']} extraits avec succès")
+    
+    return {**extracted, 'stats': stats}
+
+
+def extract_segments_daily(api_client: SimilarWebAPI, periods: List[Dict], 
+                          limit: int = None,
+                          max_workers: int = EXTRACTION_MAX_WORKERS) -> List[Dict]:
+    """
+    Extrait les segments avec la granularité correcte
     
-    logger.info(f"Websites: {stats['success']}/{stats['total']} extraits avec succès")
+    Args:
+        api_client: Instance du client API
+        periods: Périodes à extraire
+        limit: Limite du nombre de segments
+        max_workers: Nombre d'appels simultanés (1 = séquentiel)
+        
+    Returns:
+        Un enregistrement par segment et par période
+    """
+    return extract_periods(api_client, periods, websites=False, limit=limit,
+                           max_workers=max_workers)['segments']
+
+
+def extract_websites_daily(api_client: SimilarWebAPI, periods: List[Dict],
+                          domains: List[str] = None,
+                          max_workers: int = EXTRACTION_MAX_WORKERS) -> List[Dict]:
+    """
+    Extrait les websites avec la granularité correcte
     
-    return all_results
+    Args:
+        api_client: Instance du client API
+        periods: Périodes à extraire
+        domains: Domaines à extraire (liste de manage_websites si absent)
+        max_workers: Nombre d'appels simultanés domaine × endpoint (1 = séquentiel)
+        
+    Returns:
+        Un enregistrement par site et par période
+    """
+    return extract_periods(api_client, periods, segments=False, domains=domains,
+                           max_workers=max_workers)['websites']
 
 
 def extract_for_automation(days_back: int = 7) -> Dict:
@@ -209,33 +461,27 @@ def extract_for_automation(days_back: int = 7) -> Dict:
     
     logger.info(f"{len(periods)} jours à extraire")
     
-    api_client = SimilarWebAPI()
+    # Priorité haute : l'automatisation peut puiser dans la réserve du quota
+    api_client = SimilarWebAPI(priority=PRIORITY_HIGH)
+    logger.info(f"Quota restant ce mois: {api_client.quota_ledger.remaining():,.0f} appels")
     results = {}
     
     try:
-        # Extraction segments
-        segments_data = extract_segments_daily(api_client, periods)
-        if segments_data:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"segments_daily_auto_{timestamp}.json"
-            save_results_to_json(segments_data, filename)
-            results['segments'] = {
-                'count': len(segments_data),
-                'success': len([s for s in segments_data if not s.get('error')]),
-                'file': filename
-            }
-        
-        # Extraction websites
-        websites_data = extract_websites_daily(api_client, periods)
-        if websites_data:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"websites_daily_auto_{timestamp}.json"
-            save_results_to_json(websites_data, filename)
-            results['websites'] = {
-                'count': len(websites_data),
-                'success': len([w for w in websites_data if any(w.get('metrics', {}).values())]),
-                'file': filename
-            }
+        # Segments et sites web dans un même ordonnanceur (priorité haute du client),
+        # écrits au fil des fenêtres terminées
+        deadline = (time.time() + AUTOMATION_DEADLINE_SECONDS) if AUTOMATION_DEADLINE_SECONDS else None
+        with open_result_sink('segment', 'segments_daily_auto') as segments_sink, \
+                open_result_sink('website', 'websites_daily_auto') as websites_sink:
+            extracted = extract_periods(api_client, periods, deadline=deadline,
+                                        segments_sink=segments_sink, websites_sink=websites_sink)
+        
+        for kind, sink in (('segments', segments_sink), ('websites', websites_sink)):
+            if extracted['stats'][kind]['total']:
+                results[kind] = {
+                    'count': extracted['stats'][kind]['total'],
+                    'success': extracted['stats'][kind]['success'],
+                    'files': sink.file_names()
+                }
         
         # Résumé
         summary = {
@@ -245,7 +491,11 @@ def extract_for_automation(days_back: int = 7) -> Dict:
             'period_end': end_date.isoformat(),
             'periods_count': len(periods),
             'granularity': 'daily',
-            'results': results
+            'results': results,
+            'cache': api_client.cache_stats(),
+            'segment_catalog': api_client.get_segment_catalog(user_only=True).summary(),
+            'quota': api_client.quota_summary(),
+            'api_metrics': api_client.report_metrics()
         }
         
         save_results_to_json(summary, 'daily_extraction_summary_latest.json')
@@ -267,8 +517,6 @@ def extract_for_automation(days_back: int = 7) -> Dict:
         return error_summary
 
 
-import time
-
 def main():
     """Fonction principale corrigée"""
     parser = argparse.ArgumentParser(description='Extraction SimilarWeb avec vraie granularité quotidienne')
@@ -286,6 +534,10 @@ def main():
                        help='Extraire seulement les segments')
     parser.add_argument('--websites-only', action='store_true', 
                        help='Extraire seulement les websites')
+    parser.add_argument('--workers', type=int, default=EXTRACTION_MAX_WORKERS,
+                       help='Nombre d\'appels API simultanés (1 = séquentiel)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Ignorer le cache disque des réponses API')
     
     args = parser.parse_args()
     
@@ -314,35 +566,35 @@ def main():
         
         logger.info(f"{len(periods)} périodes à extraire")
         
-        api_client = SimilarWebAPI()
+        api_client = SimilarWebAPI(use_cache=not args.no_cache, priority=PRIORITY_NORMAL)
+        # Refuser d'emblée une extraction que le quota ne peut pas couvrir (appels hors cache)
+        estimated_calls = estimate_extraction_calls(
+            api_client, periods,
+            segments=not args.websites_only,
+            websites=not args.segments_only,
+            limit=1 if args.test else None
+        )
+        logger.info(f"{estimated_calls} appels API au plus (hors réponses en cache)")
+        api_client.quota_ledger.check_budget(estimated_calls, PRIORITY_NORMAL)
         results = {}
         
-        # Extraction des segments
-        if not args.websites_only:
-            segments_data = extract_segments_daily(
+        # Segments et sites web dans un même ordonnanceur, écrits au fil des fenêtres terminées
+        with open_result_sink('segment', f"segments_{args.granularity}") as segments_sink, \
+                open_result_sink('website', f"websites_{args.granularity}") as websites_sink:
+            extracted = extract_periods(
                 api_client=api_client,
                 periods=periods,
-                limit=1 if args.test else None
-            )
-            
-            if segments_data:
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"segments_{args.granularity}_{timestamp}.json"
-                save_results_to_json(segments_data, filename)
-                results['segments'] = len(segments_data)
-        
-        # Extraction des websites
-        if not args.segments_only:
-            websites_data = extract_websites_daily(
-                api_client=api_client,
-                periods=periods
+                segments=not args.websites_only,
+                websites=not args.segments_only,
+                limit=1 if args.test else None,
+                max_workers=args.workers,
+                segments_sink=segments_sink,
+                websites_sink=websites_sink
             )
-            
-            if websites_data:
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"websites_{args.granularity}_{timestamp}.json"
-                save_results_to_json(websites_data, filename)
-                results['websites'] = len(websites_data)
+        
+        for kind in ('segments', 'websites'):
+            if extracted['stats'][kind]['total']:
+                results[kind] = extracted['stats'][kind]['total']
         
         # Résumé
         summary = {
@@ -351,6 +603,10 @@ def main():
             'granularity': args.granularity,
             'periods_processed': len(periods),
             'results': results,
+            'cache': api_client.cache_stats(),
+            'segment_catalog': api_client.get_segment_catalog(user_only=True).summary(),
+            'quota': api_client.quota_summary(),
+            'api_metrics': api_client.report_metrics(),
             'status': 'success'
         }
         
@@ -8,14 +8,19 @@ from datetime import datetime, timedelta
 import logging
 from typing import List, Dict, Tuple
 import argparse
+from contextlib import ExitStack
 from google.cloud import bigquery
 
 # Ajouter le chemin parent pour importer les modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config.config import *
 from scripts.similarweb_api import SimilarWebAPI
-from scripts.daily_extraction import extract_and_save_segments, extract_and_save_websites
+from scripts.quota_ledger import QuotaBudgetExceededError
+from scripts.backfill_journal import KIND_SEGMENT, KIND_WEBSITE
+from scripts.historical_backfill import open_period_sink, schedule_segments, schedule_websites
+from scripts.task_scheduler import TaskScheduler
 from scripts.manage_websites import load_websites
+from scripts.normalization import ENTITY_SEGMENT, ENTITY_WEBSITE, KEY_COLUMNS
 
 # Configuration du logging
 logging.basicConfig(
@@ -40,7 +45,7 @@ class DataAvailabilityChecker:
         self.api_client = SimilarWebAPI()
     
     def check_data_completeness(self, start_date: str, end_date: str, 
-                               check_type: str = 'both') -> Dict:
+                               check_type: str = 'both', source: str = 'bigquery') -> Dict:
         """
         Vérifie la complétude des données pour une période
         
@@ -48,6 +53,8 @@ class DataAvailabilityChecker:
             start_date: Date de début (YYYY-MM-DD)
             end_date: Date de fin (YYYY-MM-DD)
             check_type: 'segments', 'websites', or 'both'
+            source: 'bigquery' (tables) ou 'local' (lignes normalisées de data/parquet,
+                par exemple avant l'upload)
             
         Returns:
             Rapport de complétude
@@ -64,11 +71,17 @@ class DataAvailabilityChecker:
         expected_dates = self._generate_expected_dates(start_date, end_date)
         
         if check_type in ['segments', 'both']:
-            segments_data = self._check_segments_data(expected_dates)
+            if source == 'local':
+                segments_data = self._check_local_data(ENTITY_SEGMENT, expected_dates)
+            else:
+                segments_data = self._check_segments_data(expected_dates)
             report['segments'] = segments_data
         
         if check_type in ['websites', 'both']:
-            websites_data = self._check_websites_data(expected_dates)
+            if source == 'local':
+                websites_data = self._check_local_data(ENTITY_WEBSITE, expected_dates)
+            else:
+                websites_data = self._check_websites_data(expected_dates)
             report['websites'] = websites_data
         
         # Identifier les dates manquantes
@@ -211,13 +224,49 @@ class DataAvailabilityChecker:
             logger.error(f"Erreur lors de la vérification des sites web: {e}")
             return {'found_dates': [], 'details': {}, 'error': str(e)}
     
+    def _check_local_data(self, kind: str, expected_dates: List[str]) -> Dict:
+        """
+        Vérifie les lignes normalisées locales (même rapport que _check_*_data)
+        
+        Args:
+            kind: ENTITY_SEGMENT ou ENTITY_WEBSITE
+            expected_dates: Liste des dates attendues
+            
+        Returns:
+            Rapport du type d'entité
+        """
+        from scripts.parquet_sink import read_normalized
+        
+        key, count_name = KEY_COLUMNS[kind][0], f"{kind}_count"
+        try:
+            # Seules les partitions des mois attendus sont lues
+            frame = read_normalized(kind, min(expected_dates), max(expected_dates),
+                                    columns=[key, 'date', 'extraction_date'])
+            frame = frame[frame['date'].astype(str).isin(expected_dates)]
+            grouped = frame.groupby(frame['date'].astype(str)).agg(
+                count=(key, 'nunique'), total_rows=(key, 'size'),
+                extraction_days=('extraction_date', 'nunique'))
+            
+            return {
+                'found_dates': list(grouped.index),
+                'details': {
+                    day: {count_name: int(row['count']), 'total_rows': int(row['total_rows']),
+                          'extraction_days': int(row['extraction_days'])}
+                    for day, row in grouped.iterrows()
+                }
+            }
+            
+        except Exception as e:
+            logger.error(f"Erreur lors de la vérification locale ({kind}): {e}")
+            return {'found_dates': [], 'details': {}, 'error': str(e)}
+    
     def fill_missing_data(self, missing_dates: List[str], data_type: str = 'both',
                          limit_segments: int = None) -> Dict:
         """
         Récupère les données manquantes
         
         Args:
-            missing_dates: Liste des dates manquantes (format YYYY-MM-01)
+            missing_dates: Liste des dates manquantes (YYYY-MM-DD, regroupées par mois)
             data_type: 'segments', 'websites', or 'both'
             limit_segments: Limiter le nombre de segments
             
@@ -231,44 +280,63 @@ class DataAvailabilityChecker:
             'errors': []
         }
         
-        logger.info(f"Récupération de {len(missing_dates)} dates manquantes")
-        
+        # Un mois n'est demandé qu'une fois, quel que soit le nombre de jours manquants
+        dates_by_month = {}
         for date_str in missing_dates:
-            try:
-                # Convertir en format YYYY-MM pour l'API
+            dates_by_month.setdefault(date_str[:7], []).append(date_str)
+        
+        logger.info(f"Récupération de {len(missing_dates)} dates manquantes "
+                    f"({len(dates_by_month)} mois)")
+        
+        # Tous les mois dans un même ordonnanceur : pas de pause entre les mois
+        scheduler = TaskScheduler(EXTRACTION_MAX_WORKERS)
+        domains = load_websites() if data_type in ['websites', 'both'] else None
+        scheduled = []
+        
+        # Sinks des mois fermés quelle que soit l'issue de l'ordonnanceur
+        with ExitStack() as sinks:
+            for month in dates_by_month:
+                # Format YYYY-MM pour l'API
                 period = {
-                    'start_date': date_str[:7],  # YYYY-MM
-                    'end_date': date_str[:7]
+                    'start_date': month,
+                    'end_date': month
                 }
                 
-                logger.info(f"Récupération pour {period['start_date']}")
+                logger.info(f"Récupération planifiée pour {period['start_date']}")
                 
+                segment_stats = website_stats = None
                 if data_type in ['segments', 'both']:
-                    segment_stats = extract_and_save_segments(
-                        api_client=self.api_client,
-                        period=period,
-                        limit=limit_segments
-                    )
-                    stats['segments_extracted'] += segment_stats['success']
-                
+                    segment_stats = schedule_segments(
+                        scheduler, self.api_client, period,
+                        sinks.enter_context(open_period_sink(KIND_SEGMENT, period)),
+                        limit=limit_segments)
                 if data_type in ['websites', 'both']:
-                    # Charger la liste actuelle des sites web
-                    domains = load_websites()
-                    website_stats = extract_and_save_websites(
-                        api_client=self.api_client,
-                        period=period,
-                        domains=domains
-                    )
-                    stats['websites_extracted'] += website_stats['success']
-                
-                stats['dates_processed'] += 1
+                    website_stats = schedule_websites(
+                        scheduler, self.api_client, period,
+                        sinks.enter_context(open_period_sink(KIND_WEBSITE, period)),
+                        domains=domains)
+                scheduled.append((month, segment_stats, website_stats))
+            
+            try:
+                scheduler.run()
                 
-                # Pause entre les dates
-                time.sleep(3)
+            except QuotaBudgetExceededError as e:
+                logger.warning(f"Récupération interrompue: {e}")
+                stats['errors'].append({'date': None, 'error': str(e)})
                 
             except Exception as e:
-                logger.error(f"Erreur pour {date_str}: {e}")
-                stats['errors'].append({'date': date_str, 'error': str(e)})
+                logger.error(f"Erreur pendant la récupération: {e}")
+                stats['errors'].append({'date': None, 'error': str(e)})
+        
+        for month, segment_stats, website_stats in scheduled:
+            if segment_stats:
+                stats['segments_extracted'] += segment_stats['success']
+            if website_stats:
+                stats['websites_extracted'] += website_stats['success']
+            if (segment_stats or {}).get('success') or (website_stats or {}).get('success'):
+                stats['dates_processed'] += len(dates_by_month[month])
+            else:
+                stats['errors'].append({'date': month, 'error': 'Aucune donnée récupérée'})
         
         return stats
     
@@ -404,6 +472,8 @@ if __name__ == "__main__":
     parser_check.add_argument('--end-date', required=True, help='Date de fin (YYYY-MM-DD)')
     parser_check.add_argument('--type', choices=['segments', 'websites', 'both'], 
                             default='both', help='Type de données à vérifier')
+    parser_check.add_argument('--local', action='store_true',
+                            help='Vérifier les données normalisées locales (data/parquet) au lieu de BigQuery')
     
     # Commande fill
     parser_fill = subparsers.add_parser('fill', help='Récupérer les données manquantes')
@@ -429,7 +499,8 @@ if __name__ == "__main__":
         report = checker.check_data_completeness(
             args.start_date, 
             args.end_date,
-            args.type
+            args.type,
+            source='local' if args.local else 'bigquery'
         )
         
         print("\nRAPPORT DE COMPLÉTUDE DES DONNÉES")
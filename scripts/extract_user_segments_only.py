@@ -11,7 +11,7 @@ from datetime import datetime
 # Ajouter le chemin parent pour importer les modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.similarweb_api import SimilarWebAPI, save_results_to_json
-from scripts.daily_extraction import extract_and_save_segments
+from scripts.historical_backfill import extract_and_save_segments
 
 
 def main():
@@ -23,7 +23,7 @@ def main():
     
     # Vérifier d'abord combien de segments nous avons
     print("\nVérification des segments personnels...")
-    user_segments = api.get_custom_segments(user_only=True)
+    user_segments = api.get_segment_catalog(user_only=True).get_segments() or []
     print(f"{len(user_segments)} segments personnels trouvés")
     
     # Périodes à extraire
@@ -45,8 +45,7 @@ def main():
         stats = extract_and_save_segments(
             api_client=api,
             period={'start_date': period['start_date'], 'end_date': period['end_date']},
-            limit=None,  # Pas de limite, on veut tous les 88
-            user_only=True  # IMPORTANT: uniquement les segments de l'utilisateur
+            limit=None  # Pas de limite, on veut tous les 88 (segments utilisateur uniquement)
         )
         
         total_stats['segments_extracted'] += stats['success']
@@ -63,6 +62,9 @@ def main():
     print(f"   - Durée totale: {duration:.1f} minutes")
     print(f"   - Segments extraits: {total_stats['segments_extracted']}")
     print(f"   - Erreurs: {total_stats['errors']}")
+    cache_stats = api.cache_stats()
+    if cache_stats:
+        print(f"   - Cache API: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
     print(f"\nLes fichiers JSON sont dans le dossier 'data/'")
     
     # Créer un résumé des segments extraits
@@ -72,7 +74,11 @@ def main():
         'periods_extracted': periods,
         'total_segments_extracted': total_stats['segments_extracted'],
         'total_errors': total_stats['errors'],
-        'duration_minutes': duration
+        'duration_minutes': duration,
+        'cache': api.cache_stats(),
+        'segment_catalog': api.get_segment_catalog(user_only=True).summary(),
+        'quota': api.quota_summary(),
+        'api_metrics': api.report_metrics()
     }
     
     save_results_to_json(summary, 'user_segments_extraction_summary.json')
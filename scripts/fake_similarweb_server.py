@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+Serveur local imitant les endpoints SimilarWeb utilisés par SimilarWebAPI
+Séries temporelles synthétiques déterministes, latence, 429, rate limit et erreurs configurables
+
+Usage:
+    python scripts/fake_similarweb_server.py --port 8765 --segments 88 --latency-ms 150
+    SIMILARWEB_BASE_URL=http://127.0.0.1:8765/v1 python scripts/daily_extraction.py --start-date ...
+"""
+import argparse
+import calendar
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+import sys
+import os
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DESCRIBE_PATH = '/segment/traffic-and-engagement/describe/'
+SEGMENT_QUERY_RE = re.compile(r'^/segment/(?P<segment_id>[^/]+)/total-traffic-and-engagement/query$')
+WEBSITE_METRIC_RE = re.compile(r'^/website/(?P<domain>[^/]+)(?P<endpoint>/total-traffic-and-engagement/[^/]+)$')
+
+# Endpoint website -> (clé de la série, nom du champ valeur), au format lu par upload_to_bigquery
+WEBSITE_SERIES = {
+    '/total-traffic-and-engagement/visits': ('visits', 'visits'),
+    '/total-traffic-and-engagement/pages-per-visit': ('pages_per_visit', 'pages_per_visit'),
+    '/total-traffic-and-engagement/average-visit-duration': ('avg_visit_duration', 'average_visit_duration'),
+    '/total-traffic-and-engagement/bounce-rate': ('bounce_rate', 'bounce_rate'),
+    '/total-traffic-and-engagement/page-views': ('page_views', 'page_views'),
+}
+SPLIT_ENDPOINT = '/total-traffic-and-engagement/visits-split'
+
+
+def fake_segment_id(index: int) -> str:
+    """Identifiant de segment stable au format UUID"""
+    digest = hashlib.md5(f'segment-{index}'.encode('utf-8')).hexdigest()
+    return f'{digest[:8]}-{digest[8:12]}-{digest[12:16]}-{digest[16:20]}-{digest[20:32]}'
+
+
+def parse_api_date(value: str, end: bool = False) -> date:
+    """
+    Convertit une date de requête (YYYY-MM ou YYYY-MM-DD)
+
+    Args:
+        value: Date reçue dans les paramètres
+        end: Si True, YYYY-MM désigne le dernier jour du mois
+
+    Returns:
+        Date correspondante
+    """
+    if len(value) == 7:
+        year, month = int(value[:4]), int(value[5:7])
+        day = calendar.monthrange(year, month)[1] if end else 1
+        return date(year, month, day)
+    return datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+
+def series_dates(start_date: str, end_date: str, granularity: str) -> List[date]:
+    """Dates des points renvoyés pour une plage et une granularité"""
+    start = parse_api_date(start_date)
+    end = parse_api_date(end_date, end=True)
+    dates = []
+
+    if granularity == 'monthly':
+        current = start.replace(day=1)
+        while current <= end:
+            dates.append(current)
+            current = (current + timedelta(days=32)).replace(day=1)
+    else:
+        step = timedelta(days=7 if granularity == 'weekly' else 1)
+        current = start
+        while current <= end:
+            dates.append(current)
+            current += step
+
+    return dates
+
+
+def synthetic_value(entity: str, metric: str, day: date, granularity: str) -> float:
+    """
+    Valeur synthétique déterministe : niveau propre à l'entité, tendance,
+    saisonnalité hebdomadaire et bruit reproductible
+
+    Args:
+        entity: Segment ou domaine
+        metric: Nom de la métrique
+        day: Date du point
+        granularity: Granularité demandée
+
+    Returns:
+        Valeur du point
+    """
+    level_rng = random.Random(f'{entity}|{metric}')
+    point_rng = random.Random(f'{entity}|{metric}|{day.isoformat()}|{granularity}')
+    noise = 1 + point_rng.uniform(-0.1, 0.1)
+    season = 1 + 0.15 * math.sin(2 * math.pi * day.weekday() / 7)
+    trend = 1 + 0.0005 * (day - date(2024, 1, 1)).days
+
+    if metric in ('visits', 'page_views'):
+        value = level_rng.uniform(1e3, 1e6) * trend * season * noise
+        if metric == 'page_views':
+            value *= level_rng.uniform(2, 6)
+        if granularity == 'monthly':
+            value *= calendar.monthrange(day.year, day.month)[1]
+        elif granularity == 'weekly':
+            value *= 7
+        return round(value, 2)
+    if metric == 'share':
+        return round(level_rng.uniform(0.001, 0.2) * noise, 6)
+    if metric == 'bounce_rate':
+        return round(min(0.95, level_rng.uniform(0.3, 0.7) * noise), 4)
+    if metric == 'pages_per_visit':
+        return round(level_rng.uniform(2, 8) * noise, 4)
+    if metric in ('visit_duration', 'average_visit_duration'):
+        return round(level_rng.uniform(60, 600) * noise, 2)
+    if metric == 'unique_visitors':
+        return round(level_rng.uniform(5e2, 5e5) * trend * noise, 2)
+    if metric == 'desktop':
+        return round(level_rng.uniform(0.2, 0.8), 4)
+    return round(level_rng.uniform(0, 1) * noise, 4)
+
+
+def confidence_value(entity: str, day: date) -> float:
+    """Indice de confiance déterministe d'un point"""
+    return round(random.Random(f'{entity}|confidence|{day.isoformat()}').uniform(0.5, 1.0), 2)
+
+
+class FakeSimilarWebState:
+    """Paramètres du serveur, rate limit par clé et compteurs de requêtes"""
+
+    def __init__(self, segments: int = 88, user_segments: int = None,
+                 latency_ms: float = 0, latency_jitter: float = 0.5,
+                 rate_limit: float = 0, burst: int = 10,
+                 throttle_rate: float = 0, error_rate: float = 0,
+                 retry_after: float = 1, seed: int = 0):
+        """
+        Initialise l'état du serveur
+
+        Args:
+            segments: Nombre de segments du compte
+            user_segments: Segments renvoyés avec userOnlySegments=true (tous si None)
+            latency_ms: Latence médiane des réponses en millisecondes
+            latency_jitter: Sigma de la loi log-normale de la latence (0 = latence fixe)
+            rate_limit: Requêtes/seconde autorisées par clé (0 = illimité)
+            burst: Taille du token bucket de chaque clé
+            throttle_rate: Probabilité d'un 429 aléatoire
+            error_rate: Probabilité d'une erreur 503
+            retry_after: Retry-After (secondes) des 429 aléatoires
+            seed: Graine des tirages de latence et d'erreurs
+        """
+        self.segments = [
+            {
+                'segment_id': fake_segment_id(i),
+                'segment_name': f'Segment synthétique {i + 1:04d}',
+                'domain': f'site{i % 50:02d}.example',
+                'creation_time': '2024-01-01T00:00:00',
+                'segment_last_updated': '2024-01-01T00:00:00'
+            }
+            for i in range(segments)
+        ]
+        self.user_segments = segments if user_segments is None else min(user_segments, segments)
+        self.latency_ms = latency_ms
+        self.latency_jitter = latency_jitter
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self.stats = {'requests': 0, 'ok': 0, 'throttled': 0, 'errors': 0, 'not_found': 0,
+                      'data_points': 0, 'by_family': {}}
+
+    def draw_latency(self) -> float:
+        """Tire une latence en secondes"""
+        if self.latency_ms <= 0:
+            return 0.0
+        with self._lock:
+            factor = self._rng.lognormvariate(0, self.latency_jitter) if self.latency_jitter else 1.0
+        return self.latency_ms * factor / 1000
+
+    def draw_failure(self) -> Optional[int]:
+        """Tire un 429 ou un 503 aléatoire selon les taux configurés"""
+        with self._lock:
+            draw = self._rng.random()
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 503
+        return None
+
+    def take_token(self, api_key: str) -> float:
+        """
+        Consomme un jeton du bucket de la clé
+
+        Returns:
+            0 si la requête passe, sinon le délai avant le prochain jeton
+        """
+        if self.rate_limit <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(api_key, (float(self.burst), now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate_limit)
+            if tokens < 1:
+                self._buckets[api_key] = (tokens, now)
+                return (1 - tokens) / self.rate_limit
+            self._buckets[api_key] = (tokens - 1, now)
+            return 0.0
+
+    def count(self, outcome: str, family: str, data_points: int = 0) -> None:
+        """Met à jour les compteurs exposés par /__stats"""
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats[outcome] += 1
+            self.stats['data_points'] += data_points
+            self.stats['by_family'][family] = self.stats['by_family'].get(family, 0) + 1
+
+    def snapshot(self) -> Dict:
+        """Copie des compteurs"""
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+    def reset(self) -> None:
+        """Remet les compteurs et les buckets à zéro"""
+        with self._lock:
+            self._buckets.clear()
+            self.stats = {'requests': 0, 'ok': 0, 'throttled': 0, 'errors': 0, 'not_found': 0,
+                          'data_points': 0, 'by_family': {}}
+
+
+def build_segment_payload(segment_id: str, params: Dict[str, str]) -> Tuple[Dict, int]:
+    """Réponse d'une requête segment (un groupe de métriques)"""
+    granularity = params.get('granularity', DEFAULT_GRANULARITY)
+    metrics = [m.strip().replace('-', '_') for m in params.get('metrics', 'visits').split(',') if m.strip()]
+    points = []
+
+    for day in series_dates(params['start_date'], params['end_date'], granularity):
+        point = {'date': day.isoformat()}
+        for metric in metrics:
+            point[metric] = synthetic_value(segment_id, metric, day, granularity)
+        point['confidence'] = confidence_value(segment_id, day)
+        points.append(point)
+
+    payload = {
+        'meta': {
+            'request': {key: value for key, value in params.items() if key != 'api_key'},
+            'status': 'Success',
+            'last_updated': date.today().isoformat()
+        },
+        'segments': points
+    }
+    return payload, len(points)
+
+
+def build_website_payload(domain: str, endpoint: str, params: Dict[str, str]) -> Tuple[Dict, int]:
+    """Réponse d'un endpoint website au format attendu par l'uploader"""
+    granularity = params.get('granularity', DEFAULT_GRANULARITY)
+    dates = series_dates(params['start_date'], params['end_date'], granularity)
+    meta = {
+        'request': {key: value for key, value in params.items() if key != 'api_key'},
+        'status': 'Success',
+        'last_updated': date.today().isoformat()
+    }
+
+    if endpoint == SPLIT_ENDPOINT:
+        points = []
+        for day in dates:
+            desktop = synthetic_value(domain, 'desktop', day, granularity)
+            points.append({
+                'date': day.isoformat(),
+                'data': [
+                    {'device': 'desktop', 'value': desktop},
+                    {'device': 'mobile', 'value': round(1 - desktop, 4)}
+                ]
+            })
+        return {'meta': meta, 'data': points}, len(points)
+
+    series_key, field = WEBSITE_SERIES[endpoint]
+    points = [
+        {
+            'date': day.isoformat(),
+            field: synthetic_value(domain, field, day, granularity),
+            'confidence': confidence_value(domain, day)
+        }
+        for day in dates
+    ]
+    return {'meta': meta, series_key: points}, len(points)
+
+
+class FakeSimilarWebHandler(BaseHTTPRequestHandler):
+    """Routage des requêtes GET vers les générateurs de réponses"""
+
+    server_version = 'FakeSimilarWeb/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status: int, payload: Dict, headers: Dict[str, str] = None) -> None:
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        state: FakeSimilarWebState = self.server.state
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path[len('/v1'):] if url.path.startswith('/v1/') else url.path
+
+        if path == '/__stats':
+            self._send_json(200, state.snapshot())
+            return
+
+        segment_match = SEGMENT_QUERY_RE.match(path)
+        website_match = WEBSITE_METRIC_RE.match(path)
+        if path == DESCRIBE_PATH:
+            family = 'segment_describe'
+        elif segment_match:
+            family = 'segment_query'
+        elif website_match and (website_match.group('endpoint') in WEBSITE_SERIES
+                                or website_match.group('endpoint') == SPLIT_ENDPOINT):
+            family = 'website'
+        else:
+            state.count('not_found', 'unknown')
+            self._send_json(404, {'meta': {'status': 'Error', 'error_message': 'Not found'}})
+            return
+
+        if not params.get('api_key'):
+            state.count('errors', family)
+            self._send_json(401, {'meta': {'status': 'Error', 'error_message': 'Missing api_key'}})
+            return
+
+        time.sleep(state.draw_latency())
+
+        wait = state.take_token(params['api_key'])
+        failure = 429 if wait > 0 else state.draw_failure()
+        if failure == 429:
+            state.count('throttled', family)
+            retry_after = wait if wait > 0 else state.retry_after
+            self._send_json(429, {'meta': {'status': 'Error', 'error_message': 'Rate limit'}},
+                            {'Retry-After': f'{max(retry_after, 0.01):.2f}'})
+            return
+        if failure == 503:
+            state.count('errors', family)
+            self._send_json(503, {'meta': {'status': 'Error', 'error_message': 'Unavailable'}})
+            return
+
+        try:
+            if family == 'segment_describe':
+                count = state.user_segments if params.get('userOnlySegments') == 'true' else len(state.segments)
+                payload, points = {'response': {'segments': state.segments[:count]}}, 0
+            elif family == 'segment_query':
+                payload, points = build_segment_payload(segment_match.group('segment_id'), params)
+            else:
+                payload, points = build_website_payload(website_match.group('domain'),
+                                                        website_match.group('endpoint'), params)
+        except (KeyError, ValueError) as e:
+            state.count('errors', family)
+            self._send_json(400, {'meta': {'status': 'Error', 'error_message': f'Bad request: {e}'}})
+            return
+
+        state.count('ok', family, points)
+        self._send_json(200, payload)
+
+
+def start_fake_server(host: str = '127.0.0.1', port: int = 0,
+                      **state_options) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Démarre le serveur dans un thread d'arrière-plan
+
+    Args:
+        host: Adresse d'écoute
+        port: Port (0 = port libre choisi par le système)
+        **state_options: Paramètres de FakeSimilarWebState
+
+    Returns:
+        (serveur, base_url à utiliser comme SIMILARWEB_BASE_URL)
+    """
+    server = ThreadingHTTPServer((host, port), FakeSimilarWebHandler)
+    server.daemon_threads = True
+    server.state = FakeSimilarWebState(**state_options)
+
+    thread = threading.Thread(target=server.serve_forever, name='fake-similarweb', daemon=True)
+    thread.start()
+
+    base_url = f'http://{host}:{server.server_address[1]}/v1'
+    logger.info(f"Serveur SimilarWeb local démarré: {base_url}")
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serveur local imitant l\'API SimilarWeb')
+    parser.add_argument('--host', default='127.0.0.1', help='Adresse d\'écoute')
+    parser.add_argument('--port', type=int, default=8765, help='Port d\'écoute')
+    parser.add_argument('--segments', type=int, default=88, help='Nombre de segments du compte')
+    parser.add_argument('--user-segments', type=int, help='Segments renvoyés avec userOnlySegments=true')
+    parser.add_argument('--latency-ms', type=float, default=150, help='Latence médiane (ms)')
+    parser.add_argument('--latency-jitter', type=float, default=0.5,
+                        help='Sigma log-normal de la latence (0 = latence fixe)')
+    parser.add_argument('--rate-limit', type=float, default=0, help='Requêtes/s par clé (0 = illimité)')
+    parser.add_argument('--burst', type=int, default=10, help='Taille du bucket de chaque clé')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='Probabilité d\'un 429 aléatoire')
+    parser.add_argument('--error-rate', type=float, default=0, help='Probabilité d\'une erreur 503')
+    parser.add_argument('--retry-after', type=float, default=1, help='Retry-After des 429 aléatoires (s)')
+    parser.add_argument('--seed', type=int, default=0, help='Graine des tirages aléatoires')
+
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), FakeSimilarWebHandler)
+    server.daemon_threads = True
+    server.state = FakeSimilarWebState(
+        segments=args.segments,
+        user_segments=args.user_segments,
+        latency_ms=args.latency_ms,
+        latency_jitter=args.latency_jitter,
+        rate_limit=args.rate_limit,
+        burst=args.burst,
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        seed=args.seed
+    )
+
+    logger.info(f"Serveur SimilarWeb local sur http://{args.host}:{args.port}/v1")
+    logger.info(f"   export SIMILARWEB_BASE_URL=http://{args.host}:{args.port}/v1")
+    logger.info(f"   Compteurs: http://{args.host}:{args.port}/v1/__stats")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Arrêt du serveur")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
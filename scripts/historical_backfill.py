@@ -5,15 +5,23 @@ VERSION CORRIGÉE - Compatible avec daily_extraction.py actuel
 import sys
 import os
 from datetime import datetime
-import time
 import logging
 from typing import List, Dict, Tuple
 import argparse
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import ExitStack
 
 # Ajouter le chemin parent pour importer les modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config.config import *
-from scripts.similarweb_api import SimilarWebAPI, save_results_to_json
+from scripts.similarweb_api import SimilarWebAPI
+from scripts.quota_ledger import PRIORITY_LOW, QuotaBudgetExceededError
+from scripts.backfill_journal import KIND_SEGMENT, KIND_WEBSITE, BackfillJournal
+from scripts.task_scheduler import TaskScheduler
+from scripts.result_sink import open_result_sink
+from scripts.rate_limiter import set_rate_limit_state_dir
+from scripts.api_metrics import merge_metrics_snapshots
 
 # Configuration du logging
 logging.basicConfig(
@@ -62,94 +70,237 @@ def get_historical_periods() -> List[Dict[str, str]]:
     return periods
 
 
-def extract_and_save_segments(api_client: SimilarWebAPI, period: Dict[str, str], 
-                             limit: int = None) -> Dict:
+def open_period_sink(kind: str, period: Dict[str, str]):
     """
-    Extrait et sauvegarde les segments pour une période donnée
+    Ouvre les fichiers de sortie d'un mois du backfill
+    
+    Le sink est fermé par le code qui exécute l'ordonnanceur, une fois run()
+    terminé ou interrompu (budget épuisé, erreur).
+    
+    Args:
+        kind: KIND_SEGMENT ou KIND_WEBSITE
+        period: Dictionnaire avec start_date et end_date
+    """
+    prefix = 'segments_extraction' if kind == KIND_SEGMENT else 'websites_extraction'
+    return open_result_sink(kind, f"{prefix}_{period['start_date'][:7].replace('-', '')}",
+                            granularity=DEFAULT_GRANULARITY)
+
+
+def _segment_partial(segment_data: Dict) -> bool:
+    """Segment dont une partie des groupes de métriques a échoué"""
+    return (not segment_data.get('error')
+            and len(segment_data.get('metric_groups_succeeded', [])) < len(SEGMENT_METRICS_GROUPS))
+
+
+def _website_partial(website_data: Dict) -> bool:
+    """Site web dont une partie des métriques a échoué"""
+    metrics = website_data.get('metrics', {}).values()
+    return any(metrics) and not all(metrics)
+
+
+def schedule_segments(scheduler: TaskScheduler, api_client: SimilarWebAPI,
+                      period: Dict[str, str], sink, limit: int = None,
+                      journal: BackfillJournal = None,
+                      flush_every: int = BACKFILL_FLUSH_EVERY) -> Dict:
+    """
+    Ajoute à l'ordonnanceur l'extraction des segments d'une période
+    
+    Chaque lot de flush_every segments est ajouté aux fichiers de sortie du mois dès
+    qu'il est terminé ; avec un journal, il est journalisé et les segments déjà
+    extraits sont ignorés. Un segment partiel (groupe de métriques en échec) n'est
+    ni écrit ni journalisé : sa ligne complète viendra d'une reprise, et une ligne
+    partielle plus ancienne la masquerait à l'upload.
     
     Args:
+        scheduler: Ordonnanceur partagé par les périodes en cours
         api_client: Instance du client API
         period: Dictionnaire avec start_date et end_date
+        sink: Destination des lots (voir open_period_sink), fermée par l'appelant
         limit: Limite du nombre de segments
+        journal: Journal de reprise (None = pas de reprise)
+        flush_every: Entités par lot écrit (et journalisé)
         
     Returns:
-        Statistiques de l'extraction
+        Statistiques de la période, complétées au fil des lots terminés
     """
-    logger.info(f"Extraction segments pour {period['start_date'][:7]}")
+    # Convertir les dates au format YYYY-MM pour l'API
+    start_month = period['start_date'][:7]  # YYYY-MM
+    end_month = period['end_date'][:7]      # YYYY-MM
+    
+    # Segments du catalogue (mémorisé, un seul describe par exécution)
+    segments = api_client.get_segment_catalog(user_only=True).get_segments() or []
+    if limit:
+        segments = segments[:limit]
+    
+    stats = {'total': len(segments), 'success': 0, 'errors': 0, 'partial': 0, 'skipped': 0}
+    
+    if journal is not None:
+        pending_ids = set(journal.pending(KIND_SEGMENT, start_month,
+                                         [s.get('segment_id') for s in segments],
+                                         SEGMENT_METRICS_GROUPS))
+        stats['skipped'] = len(segments) - len(pending_ids)
+        segments = [s for s in segments if s.get('segment_id') in pending_ids]
+        if stats['skipped']:
+            logger.info(f"Reprise: {stats['skipped']} segments déjà extraits pour {start_month}")
+    
+    chunks = [segments[i:i + flush_every] for i in range(0, len(segments), flush_every)]
+    
+    def save_chunk(segments_data: List[Dict]) -> None:
+        succeeded = [s for s in segments_data if not s.get('error')]
+        stats['success'] += len(succeeded)
+        stats['errors'] += len(segments_data) - len(succeeded)
+        # Segments dont certains groupes de métriques ont échoué : retenus, le mois reste ouvert
+        written = [s for s in segments_data if not _segment_partial(s)]
+        stats['partial'] += len(segments_data) - len(written)
+        
+        # Lignes synchronisées avant le journal : un crash entre les deux refait le lot, sans perte
+        sink.write_many(written)
+        sink.flush()
+        
+        if journal is not None:
+            journal.record(KIND_SEGMENT, start_month,
+                           {s['segment_id']: s.get('metric_groups_succeeded', [])
+                            for s in written if not s.get('error')},
+                           file=sink.current_file)
+    
+    for chunk in chunks:
+        api_client.schedule_segments(scheduler, chunk, start_month, end_month, on_done=save_chunk)
+    
+    return stats
+
+
+def schedule_websites(scheduler: TaskScheduler, api_client: SimilarWebAPI,
+                      period: Dict[str, str], sink, domains: List[str] = None,
+                      journal: BackfillJournal = None,
+                      flush_every: int = BACKFILL_FLUSH_EVERY) -> Dict:
+    """
+    Ajoute à l'ordonnanceur l'extraction des sites web d'une période
+    
+    Avec un journal, chaque métrique réussie d'un domaine est une unité terminée ;
+    un domaine n'est réextrait que s'il lui manque des métriques (les métriques
+    déjà obtenues sont alors servies par le cache des réponses). Comme pour les
+    segments, un domaine partiel n'est écrit qu'une fois complet.
     
+    Args:
+        scheduler: Ordonnanceur partagé par les périodes en cours
+        api_client: Instance du client API  
+        period: Dictionnaire avec start_date et end_date
+        sink: Destination des lots (voir open_period_sink), fermée par l'appelant
+        domains: Domaines à extraire (liste de manage_websites si absent)
+        journal: Journal de reprise (None = pas de reprise)
+        flush_every: Entités par lot écrit (et journalisé)
+        
+    Returns:
+        Statistiques de la période, complétées au fil des lots terminés
+    """
     # Convertir les dates au format YYYY-MM pour l'API
     start_month = period['start_date'][:7]  # YYYY-MM
     end_month = period['end_date'][:7]      # YYYY-MM
     
-    # Extraction des segments
-    segments_data = api_client.extract_all_segments(
-        start_date=start_month,
-        end_date=end_month,
-        limit=limit,
-        user_only=True  # Utiliser seulement les segments utilisateur
-    )
+    # Charger la liste des sites web
+    if domains is None:
+        try:
+            from scripts.manage_websites import load_websites
+            domains = load_websites()
+            logger.info(f"{len(domains)} sites web chargés")
+        except (OSError, ValueError) as e:
+            domains = TARGET_DOMAINS
+            logger.warning(f"Liste des sites web illisible ({e}), "
+                           f"utilisation de la liste par défaut: {len(domains)} sites")
+    
+    # Un domaine en double ne doit pas coûter deux séries d'appels
+    domains = list(dict.fromkeys(domains))
+    
+    metric_names = list(WEBSITE_METRICS_ENDPOINTS.keys())
+    stats = {'total': len(domains), 'success': 0, 'errors': 0, 'partial': 0, 'skipped': 0}
+    
+    if journal is not None:
+        pending = journal.pending(KIND_WEBSITE, start_month, domains, metric_names)
+        stats['skipped'] = len(domains) - len(pending)
+        domains = pending
+        if stats['skipped']:
+            logger.info(f"Reprise: {stats['skipped']} sites web déjà extraits pour {start_month}")
+    
+    chunks = [domains[i:i + flush_every] for i in range(0, len(domains), flush_every)]
+    
+    def save_chunk(websites_data: List[Dict]) -> None:
+        succeeded = len([w for w in websites_data if any(w.get('metrics', {}).values())])
+        stats['success'] += succeeded
+        stats['errors'] += len(websites_data) - succeeded
+        written = [w for w in websites_data if not _website_partial(w)]
+        stats['partial'] += len(websites_data) - len(written)
+        
+        sink.write_many(written)
+        sink.flush()
+        
+        if journal is not None:
+            journal.record(KIND_WEBSITE, start_month, {
+                w['domain']: [name for name, payload in w.get('metrics', {}).items() if payload]
+                for w in written
+            }, file=sink.current_file)
     
-    # Statistiques
-    stats = {
-        'total': len(segments_data),
-        'success': len([s for s in segments_data if not s.get('error')]),
-        'errors': len([s for s in segments_data if s.get('error')])
-    }
+    for chunk in chunks:
+        api_client.schedule_websites(scheduler, chunk, start_month, end_month, on_done=save_chunk)
+    
+    return stats
+
+
+def extract_and_save_segments(api_client: SimilarWebAPI, period: Dict[str, str], 
+                             limit: int = None,
+                             max_workers: int = EXTRACTION_MAX_WORKERS,
+                             journal: BackfillJournal = None,
+                             flush_every: int = BACKFILL_FLUSH_EVERY) -> Dict:
+    """
+    Extrait et sauvegarde les segments pour une période donnée
     
-    # Sauvegarde avec timestamp
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"segments_extraction_{start_month.replace('-', '')}_{timestamp}.json"
-    save_results_to_json(segments_data, filename)
+    Args:
+        api_client: Instance du client API
+        period: Dictionnaire avec start_date et end_date
+        limit: Limite du nombre de segments
+        max_workers: Nombre d'appels simultanés (1 = séquentiel)
+        journal: Journal de reprise (None = pas de reprise)
+        flush_every: Entités par lot écrit (et journalisé)
+        
+    Returns:
+        Statistiques de l'extraction
+    """
+    logger.info(f"Extraction segments pour {period['start_date'][:7]}")
+    
+    scheduler = TaskScheduler(max_workers)
+    with open_period_sink(KIND_SEGMENT, period) as sink:
+        stats = schedule_segments(scheduler, api_client, period, sink, limit, journal, flush_every)
+        scheduler.run()
     
     logger.info(f"Segments {period['start_date'][:7]}: {stats['success']}/{stats['total']} extraits")
     
     return stats
 
 
-def extract_and_save_websites(api_client: SimilarWebAPI, period: Dict[str, str]) -> Dict:
+def extract_and_save_websites(api_client: SimilarWebAPI, period: Dict[str, str],
+                              domains: List[str] = None,
+                              max_workers: int = EXTRACTION_MAX_WORKERS,
+                              journal: BackfillJournal = None,
+                              flush_every: int = BACKFILL_FLUSH_EVERY) -> Dict:
     """
     Extrait et sauvegarde les sites web pour une période donnée
     
     Args:
         api_client: Instance du client API  
         period: Dictionnaire avec start_date et end_date
+        domains: Domaines à extraire (liste de manage_websites si absent)
+        max_workers: Nombre d'appels simultanés domaine × endpoint (1 = séquentiel)
+        journal: Journal de reprise (None = pas de reprise)
+        flush_every: Entités par lot écrit (et journalisé)
         
     Returns:
         Statistiques de l'extraction
     """
     logger.info(f"Extraction websites pour {period['start_date'][:7]}")
     
-    # Convertir les dates au format YYYY-MM pour l'API
-    start_month = period['start_date'][:7]  # YYYY-MM
-    end_month = period['end_date'][:7]      # YYYY-MM
-    
-    # Charger la liste des sites web
-    try:
-        from scripts.manage_websites import load_websites
-        domains = load_websites()
-        logger.info(f"{len(domains)} sites web chargés")
-    except:
-        domains = TARGET_DOMAINS
-        logger.warning(f"Utilisation de la liste par défaut: {len(domains)} sites")
-    
-    # Extraction des sites web
-    websites_data = api_client.extract_all_websites(
-        domains=domains,
-        start_date=start_month,
-        end_date=end_month
-    )
-    
-    # Statistiques
-    stats = {
-        'total': len(websites_data),
-        'success': len([w for w in websites_data if any(w.get('metrics', {}).values())]),
-        'errors': len([w for w in websites_data if not any(w.get('metrics', {}).values())])
-    }
-    
-    # Sauvegarde avec timestamp
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"websites_extraction_{start_month.replace('-', '')}_{timestamp}.json"
-    save_results_to_json(websites_data, filename)
+    scheduler = TaskScheduler(max_workers)
+    with open_period_sink(KIND_WEBSITE, period) as sink:
+        stats = schedule_websites(scheduler, api_client, period, sink, domains, journal, flush_every)
+        scheduler.run()
     
     logger.info(f"Websites {period['start_date'][:7]}: {stats['success']}/{stats['total']} extraits")
     
@@ -160,11 +311,11 @@ def estimate_api_calls(periods: List[Dict], segments_count: int, websites_count:
     """
     Estime le nombre d'appels API nécessaires
     """
-    # 3 appels par segment (avec les nouvelles métriques)
-    segment_calls = len(periods) * segments_count * 3
+    # Un appel par groupe de métriques pour chaque segment
+    segment_calls = len(periods) * segments_count * len(SEGMENT_METRICS_GROUPS)
     
-    # 6 appels par site web
-    website_calls = len(periods) * websites_count * 6
+    # Un appel par endpoint pour chaque site web
+    website_calls = len(periods) * websites_count * len(WEBSITE_METRICS_ENDPOINTS)
     
     total_calls = segment_calls + website_calls
     
@@ -180,8 +331,154 @@ def estimate_api_calls(periods: List[Dict], segments_count: int, websites_count:
     }
 
 
+def _period_complete(segment_stats: Dict, website_stats: Dict) -> bool:
+    """Indique si toutes les unités d'un mois ont été extraites (aucun échec, même partiel)"""
+    return all(stats['errors'] == 0 and stats.get('partial', 0) == 0
+               for stats in (segment_stats, website_stats))
+
+
+def _init_backfill_worker(rate_limit_dir: str) -> None:
+    """Initialise un processus worker : ses limiteurs sont partagés avec les autres workers"""
+    set_rate_limit_state_dir(rate_limit_dir)
+
+
+def backfill_period_worker(period: Dict[str, str], limit_segments: int = None,
+                           domains: List[str] = None,
+                           max_workers: int = EXTRACTION_MAX_WORKERS,
+                           use_cache: bool = API_CACHE_ENABLED,
+                           journal_path: str = BACKFILL_JOURNAL_PATH) -> Dict:
+    """
+    Extrait un mois dans un processus worker du backfill
+    
+    Le quota (registre SQLite), le cache des réponses et le journal sont des
+    fichiers communs aux processus ; le débit est partagé par les limiteurs
+    inter-processus configurés par _init_backfill_worker.
+    
+    Returns:
+        Statistiques du mois, métriques API du worker et état de pause
+    """
+    api_client = SimilarWebAPI(use_cache=use_cache, priority=PRIORITY_LOW)
+    journal = BackfillJournal(journal_path)
+    scheduler = TaskScheduler(max_workers)
+    
+    # Sinks fermés quelle que soit l'issue de l'ordonnanceur (lots écrits, manifeste Parquet)
+    with ExitStack() as sinks:
+        result = {
+            'period': period,
+            'segments': schedule_segments(scheduler, api_client, period,
+                                          sinks.enter_context(open_period_sink(KIND_SEGMENT, period)),
+                                          limit_segments, journal),
+            'websites': schedule_websites(scheduler, api_client, period,
+                                          sinks.enter_context(open_period_sink(KIND_WEBSITE, period)),
+                                          domains, journal),
+            'paused': False,
+            'error': None
+        }
+        
+        try:
+            scheduler.run()
+        except QuotaBudgetExceededError as e:
+            result['paused'] = True
+            result['error'] = str(e)
+        except Exception as e:
+            logger.error(f"Erreur pour la période {period['start_date'][:7]}: {e}")
+            result['error'] = str(e)
+        finally:
+            result['api_metrics'] = api_client.metrics.snapshot()
+            api_client.close()
+    
+    return result
+
+
+def _run_backfill_processes(periods: List[Dict], processes: int, period_calls: int,
+                            ledger, journal: BackfillJournal, stats: Dict,
+                            limit_segments: int, domains: List[str],
+                            max_workers: int, use_cache: bool) -> List[Dict]:
+    """
+    Répartit les mois du backfill sur un pool de processus
+    
+    Un mois n'est lancé que si le budget le couvre ; dès qu'un processus se
+    libère, il prend le mois suivant. Met à jour stats et le journal.
+    
+    Returns:
+        Métriques API de chaque worker
+    """
+    rate_limit_dir = API_RATE_LIMIT_STATE_DIR or os.path.join(DATA_PATH, 'rate_limits')
+    logger.info(f"Backfill sur {processes} processus (limiteurs partagés dans {rate_limit_dir})")
+    
+    context = multiprocessing.get_context('spawn')
+    pending = list(periods)
+    running = {}
+    worker_metrics = []
+    
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=_init_backfill_worker,
+                             initargs=(rate_limit_dir,)) as executor:
+        while pending or running:
+            # Remplir les processus libres tant que le budget couvre un mois de plus
+            while pending and len(running) < processes and not stats['paused']:
+                if not ledger.can_spend(period_calls * (len(running) + 1), PRIORITY_LOW):
+                    logger.warning(f"Backfill mis en pause avant {pending[0]['start_date'][:7]}: "
+                                   f"{ledger.remaining():,.0f} appels restants, "
+                                   f"~{period_calls:,} nécessaires par mois")
+                    stats['paused'] = True
+                    break
+                
+                period = pending.pop(0)
+                logger.info(f"Période lancée: {period['start_date'][:7]}")
+                future = executor.submit(backfill_period_worker, period, limit_segments, domains,
+                                         max_workers, use_cache, journal.path)
+                running[future] = period
+            
+            if not running:
+                break
+            
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                period = running.pop(future)
+                month = period['start_date'][:7]
+                
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Processus en échec pour la période {month}: {e}")
+                    stats['errors'] += 1
+                    continue
+                
+                worker_metrics.append(result['api_metrics'])
+                segment_stats, website_stats = result['segments'], result['websites']
+                stats['segments_extracted'] += segment_stats['success']
+                stats['segments_skipped'] += segment_stats['skipped']
+                stats['websites_extracted'] += website_stats['success']
+                stats['websites_skipped'] += website_stats['skipped']
+                
+                if result['paused']:
+                    logger.warning(f"Backfill mis en pause pendant {month}: {result['error']}")
+                    stats['paused'] = True
+                    continue
+                if result['error']:
+                    stats['errors'] += 1
+                    continue
+                
+                logger.info(f"Période {month}: "
+                            f"segments {segment_stats['success']}/{segment_stats['total']}, "
+                            f"websites {website_stats['success']}/{website_stats['total']}")
+                
+                # Un mois avec des échecs (même partiels) reste ouvert : la reprise retentera ses unités manquantes
+                if _period_complete(segment_stats, website_stats):
+                    journal.mark_period_done(month)
+                
+                stats['periods_processed'] += 1
+    
+    return worker_metrics
+
+
 def run_backfill(start_year: int = 2024, end_month: str = None, 
-                 limit_segments: int = None, batch_size: int = 3):
+                 limit_segments: int = None, batch_size: int = 3,
+                 max_workers: int = EXTRACTION_MAX_WORKERS, use_cache: bool = API_CACHE_ENABLED,
+                 assume_yes: bool = False, domains: List[str] = None,
+                 api_client: SimilarWebAPI = None, journal: BackfillJournal = None,
+                 resume: bool = True, processes: int = BACKFILL_PROCESSES):
     """
     Exécute le backfill historique
     
@@ -190,14 +487,30 @@ def run_backfill(start_year: int = 2024, end_month: str = None,
         end_month: Mois de fin au format YYYY-MM (automatique si None)
         limit_segments: Limiter le nombre de segments (None = tous)
         batch_size: Nombre de mois à traiter par batch
+        max_workers: Nombre d'appels API simultanés (segments et sites web)
+        use_cache: Si False, ignore le cache disque des réponses API
+        assume_yes: Si True, pas de confirmation interactive
+        domains: Sites web à extraire (liste de manage_websites si absent)
+        api_client: Client API à utiliser (créé en priorité basse si absent)
+        journal: Journal de reprise (celui de BACKFILL_JOURNAL_PATH si absent)
+        resume: Si False, repart d'un journal vide au lieu de reprendre
+        processes: Nombre de processus (> 1 : un mois par processus, limiteurs et quota partagés)
     """
     logger.info("Démarrage du backfill historique")
     
-    # Initialiser le client API
-    api_client = SimilarWebAPI()
+    # Initialiser le client API (priorité basse : la réserve du quota reste à l'automatisation)
+    if api_client is None:
+        api_client = SimilarWebAPI(use_cache=use_cache, priority=PRIORITY_LOW)
+    ledger = api_client.quota_ledger
+    
+    # Journal de reprise : les unités déjà extraites ne sont pas redemandées
+    if journal is None:
+        journal = BackfillJournal()
+    if not resume:
+        journal.reset()
     
-    # Récupérer le nombre de segments
-    segments = api_client.get_custom_segments(user_only=True)
+    # Récupérer le nombre de segments (catalogue réutilisé ensuite par chaque mois)
+    segments = api_client.get_segment_catalog(user_only=True).get_segments()
     if not segments:
         logger.error("Impossible de récupérer les segments")
         return
@@ -205,14 +518,16 @@ def run_backfill(start_year: int = 2024, end_month: str = None,
     segments_count = len(segments) if not limit_segments else min(limit_segments, len(segments))
     
     # Charger la liste dynamique des sites web
-    try:
-        from scripts.manage_websites import load_websites
-        domains = load_websites()
-        websites_count = len(domains)
-        logger.info(f"{websites_count} sites web chargés depuis la configuration")
-    except:
-        websites_count = len(TARGET_DOMAINS)
-        logger.warning(f"Utilisation de la liste par défaut: {websites_count} sites")
+    if domains is None:
+        try:
+            from scripts.manage_websites import load_websites
+            domains = load_websites()
+            logger.info(f"{len(domains)} sites web chargés depuis la configuration")
+        except (OSError, ValueError) as e:
+            domains = TARGET_DOMAINS
+            logger.warning(f"Liste des sites web illisible ({e}), "
+                           f"utilisation de la liste par défaut: {len(domains)} sites")
+    websites_count = len(domains)
     
     # Générer les périodes
     periods = get_historical_periods()
@@ -226,6 +541,16 @@ def run_backfill(start_year: int = 2024, end_month: str = None,
     if end_month:
         periods = [p for p in periods if p['start_date'][:7] <= end_month]
     
+    # Ne garder que les mois pas encore terminés lors d'une exécution précédente
+    done_periods = [p for p in periods if journal.is_period_done(p['start_date'][:7])]
+    if done_periods:
+        logger.info(f"Reprise: {len(done_periods)} mois déjà terminés ignorés")
+        periods = [p for p in periods if not journal.is_period_done(p['start_date'][:7])]
+    
+    if not periods:
+        logger.info("Aucun mois à extraire, backfill déjà terminé")
+        return {'periods_processed': 0, 'journal': journal.summary()}
+    
     # Estimation
     estimation = estimate_api_calls(periods, segments_count, websites_count)
     
@@ -236,64 +561,127 @@ def run_backfill(start_year: int = 2024, end_month: str = None,
     logger.info(f"   - Appels API totaux: {estimation['total_calls']:,}")
     logger.info(f"   - Temps estimé: {estimation['estimated_time_minutes']} minutes")
     
+    # Budget disponible pour un backfill (hors réserve de l'automatisation)
+    available = ledger.remaining() - ledger.reserve
+    logger.info(f"   - Quota disponible: {max(available, 0):,.0f} appels "
+                f"(réserve de {ledger.reserve:,} exclue)")
+    
+    if available <= 0:
+        logger.error("Quota mensuel insuffisant pour lancer un backfill")
+        return
+    
+    if estimation['total_calls'] > available:
+        logger.warning("Le quota ne couvre pas tout le backfill, il sera mis en pause "
+                       "avant d'entamer la réserve")
+    
     logger.info(f"\nPériodes à extraire:")
     for period in periods:
         logger.info(f"   - {period['start_date'][:7]}")
     
     # Confirmation
-    response = input(f"\nVoulez-vous continuer avec {len(periods)} mois? (y/n): ")
-    if response.lower() != 'y':
-        logger.info("Backfill annulé")
-        return
+    if not assume_yes:
+        response = input(f"\nVoulez-vous continuer avec {len(periods)} mois? (y/n): ")
+        if response.lower() != 'y':
+            logger.info("Backfill annulé")
+            return
     
     # Statistiques globales
     stats = {
         'periods_processed': 0,
         'segments_extracted': 0,
         'websites_extracted': 0,
+        'segments_skipped': 0,
+        'websites_skipped': 0,
         'errors': 0,
+        'paused': False,
         'start_time': datetime.now()
     }
     
-    # Traiter par batch
-    for i in range(0, len(periods), batch_size):
-        batch = periods[i:i + batch_size]
-        logger.info(f"\nBATCH {i//batch_size + 1}/{(len(periods) + batch_size - 1)//batch_size}")
-        
-        for period in batch:
-            try:
-                logger.info(f"\nPériode: {period['start_date'][:7]}")
+    # Coût estimé d'une période, vérifié avant de l'entamer
+    period_calls = estimation['total_calls'] // max(len(periods), 1)
+    
+    worker_metrics = []
+    if processes > 1:
+        # Un mois par processus : un mois lent ne retient pas les autres
+        worker_metrics = _run_backfill_processes(
+            periods, processes, period_calls, ledger, journal, stats,
+            limit_segments, domains, max_workers, use_cache
+        )
+    else:
+        # Traiter par batch : les mois d'un batch partagent un même ordonnanceur,
+        # aucune pause fixe (seul le rate limiter rythme les appels)
+        for i in range(0, len(periods), batch_size):
+            batch = periods[i:i + batch_size]
+            logger.info(f"\nBATCH {i//batch_size + 1}/{(len(periods) + batch_size - 1)//batch_size}")
+            
+            # Ne lancer que les mois que le budget peut couvrir
+            affordable = 0
+            while (affordable < len(batch)
+                   and ledger.can_spend(period_calls * (affordable + 1), PRIORITY_LOW)):
+                affordable += 1
+            if affordable < len(batch):
+                logger.warning(f"Backfill mis en pause avant {batch[affordable]['start_date'][:7]}: "
+                               f"{ledger.remaining():,.0f} appels restants, "
+                               f"~{period_calls:,} nécessaires par mois")
+                stats['paused'] = True
+                batch = batch[:affordable]
+            
+            scheduler = TaskScheduler(max_workers)
+            batch_stats = []
+            interrupted = failed = False
+            
+            # Sinks du batch fermés quelle que soit l'issue de l'ordonnanceur
+            with ExitStack() as sinks:
+                for period in batch:
+                    logger.info(f"Période planifiée: {period['start_date'][:7]}")
+                    batch_stats.append((
+                        period,
+                        schedule_segments(scheduler, api_client, period,
+                                          sinks.enter_context(open_period_sink(KIND_SEGMENT, period)),
+                                          limit_segments, journal),
+                        schedule_websites(scheduler, api_client, period,
+                                          sinks.enter_context(open_period_sink(KIND_WEBSITE, period)),
+                                          domains, journal)
+                    ))
                 
-                # Extraction des segments
-                segment_stats = extract_and_save_segments(
-                    api_client=api_client,
-                    period=period,
-                    limit=limit_segments
-                )
+                try:
+                    scheduler.run()
+                    
+                except QuotaBudgetExceededError as e:
+                    # Les lots déjà terminés sont écrits et journalisés, la reprise fera le reste
+                    logger.warning(f"Backfill mis en pause pendant le batch: {e}")
+                    stats['paused'] = interrupted = True
+                    
+                except Exception as e:
+                    logger.error(f"Erreur pendant le batch {i//batch_size + 1}: {e}")
+                    stats['errors'] += len(batch)
+                    failed = True
+            
+            if failed:
+                continue
+            
+            for period, segment_stats, website_stats in batch_stats:
                 stats['segments_extracted'] += segment_stats['success']
-                
-                # Extraction des sites web
-                website_stats = extract_and_save_websites(
-                    api_client=api_client,
-                    period=period
-                )
+                stats['segments_skipped'] += segment_stats['skipped']
                 stats['websites_extracted'] += website_stats['success']
+                stats['websites_skipped'] += website_stats['skipped']
                 
-                stats['periods_processed'] += 1
+                if interrupted:
+                    continue
                 
-                # Pause entre les périodes
-                logger.info(f"   Pause de 5 secondes...")
-                time.sleep(5)
+                logger.info(f"Période {period['start_date'][:7]}: "
+                            f"segments {segment_stats['success']}/{segment_stats['total']}, "
+                            f"websites {website_stats['success']}/{website_stats['total']}")
                 
-            except Exception as e:
-                logger.error(f"Erreur pour la période {period['start_date'][:7]}: {e}")
-                stats['errors'] += 1
-                continue
+                # Un mois avec des échecs (même partiels) reste ouvert : la reprise retentera ses unités manquantes
+                if _period_complete(segment_stats, website_stats):
+                    journal.mark_period_done(period['start_date'][:7])
+                
+                stats['periods_processed'] += 1
+            
+            if stats['paused']:
+                break
         
-        # Pause plus longue entre les batchs
-        if i + batch_size < len(periods):
-            logger.info(f"\nPause de 30 secondes entre les batchs...")
-            time.sleep(30)
     
     # Résumé final
     duration = (datetime.now() - stats['start_time']).total_seconds() / 60
@@ -305,6 +693,26 @@ def run_backfill(start_year: int = 2024, end_month: str = None,
     logger.info(f"   - Segments extraits: {stats['segments_extracted']}")
     logger.info(f"   - Sites web extraits: {stats['websites_extracted']}")
     logger.info(f"   - Erreurs: {stats['errors']}")
+    if stats['segments_skipped'] or stats['websites_skipped']:
+        logger.info(f"   - Déjà extraits (reprise): {stats['segments_skipped']} segments, "
+                    f"{stats['websites_skipped']} sites web")
+    
+    stats['cache'] = api_client.cache_stats()
+    stats['segment_catalog'] = api_client.get_segment_catalog(user_only=True).summary()
+    stats['quota'] = api_client.quota_summary()
+    stats['api_metrics'] = api_client.report_metrics()
+    if worker_metrics:
+        stats['api_metrics'] = merge_metrics_snapshots([stats['api_metrics']] + worker_metrics)
+    stats['journal'] = journal.summary()
+    if stats['cache']:
+        logger.info(f"   - Cache API: {stats['cache']['hits']} hits / {stats['cache']['misses']} misses")
+    logger.info(f"   - Quota: {stats['quota']['used']:,.0f}/{stats['quota']['quota']:,} appels ce mois")
+    logger.info(f"   - Débit API: {stats['api_metrics']['calls_per_second']} appels/s, "
+                f"{stats['api_metrics']['sleep_seconds']}s d'attente, "
+                f"{stats['api_metrics']['rate_limited']} réponses 429")
+    if stats['paused']:
+        logger.info("   - Backfill en pause (quota), relancer le mois prochain : "
+                    "la reprise repart du journal")
     
     logger.info(f"\nFichiers créés dans le dossier 'data/'")
     logger.info(f"   - Utilisez: python scripts/upload_to_bigquery.py --type all")
@@ -322,6 +730,16 @@ if __name__ == "__main__":
                         help='Limiter le nombre de segments')
     parser.add_argument('--batch-size', type=int, default=3,
                         help='Nombre de mois par batch')
+    parser.add_argument('--workers', type=int, default=EXTRACTION_MAX_WORKERS,
+                        help='Nombre d\'appels API simultanés (1 = séquentiel)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignorer le cache disque des réponses API')
+    parser.add_argument('--yes', action='store_true',
+                        help='Lancer sans confirmation interactive')
+    parser.add_argument('--processes', type=int, default=BACKFILL_PROCESSES,
+                        help='Nombre de processus (un mois par processus, 1 = un seul processus)')
+    parser.add_argument('--fresh', action='store_true',
+                        help='Ignorer le journal de reprise et tout réextraire')
     
     args = parser.parse_args()
     
@@ -329,5 +747,10 @@ if __name__ == "__main__":
         start_year=args.year,
         end_month=args.end_month,
         limit_segments=args.limit_segments,
-        batch_size=args.batch_size
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+        use_cache=not args.no_cache,
+        assume_yes=args.yes,
+        resume=not args.fresh,
+        processes=args.processes
     )
\ No newline at end of file
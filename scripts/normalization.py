@@ -0,0 +1,349 @@
+"""
+Normalisation des enregistrements d'extraction en lignes de faits
+Les payloads bruts (segments, métriques de sites web) sont aplatis une seule fois,
+juste après l'extraction, en lignes (entité, date) avec granularité et confidence :
+mêmes colonnes que les tables BigQuery, réutilisées par l'upload, le checker et l'analyse
+"""
+import logging
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+
+logger = logging.getLogger(__name__)
+
+ENTITY_SEGMENT = 'segment'
+ENTITY_WEBSITE = 'website'
+
+SEGMENT_COLUMNS = [
+    'segment_id', 'segment_name', 'date', 'granularity',
+    'visits', 'share', 'bounce_rate', 'pages_per_visit', 'visit_duration',
+    'page_views', 'unique_visitors', 'confidence', 'extraction_date'
+]
+
+WEBSITE_COLUMNS = [
+    'domain', 'date', 'granularity',
+    'visits', 'bounce_rate', 'pages_per_visit', 'avg_visit_duration', 'page_views',
+    'unique_visitors', 'desktop_share', 'mobile_share', 'confidence', 'extraction_date'
+]
+
+COLUMNS = {ENTITY_SEGMENT: SEGMENT_COLUMNS, ENTITY_WEBSITE: WEBSITE_COLUMNS}
+
+# Clé d'unicité d'une ligne par type d'entité (dédoublonnage à l'upload)
+KEY_COLUMNS = {ENTITY_SEGMENT: ('segment_id', 'date'), ENTITY_WEBSITE: ('domain', 'date')}
+
+# Champs numériques d'un point de segment (mêmes noms dans la ligne)
+SEGMENT_METRIC_FIELDS = [
+    'visits', 'share', 'bounce_rate', 'pages_per_visit', 'visit_duration',
+    'page_views', 'unique_visitors'
+]
+
+# Métriques de site web jointes à la série des visites : (métrique, champ du point)
+WEBSITE_JOINED_METRICS = [
+    ('bounce_rate', 'bounce_rate'),
+    ('pages_per_visit', 'pages_per_visit'),
+    ('avg_visit_duration', 'average_visit_duration'),
+    ('page_views', 'page_views'),
+]
+
+
+def _normalize_dates(dates: List, granularity: pd.Series) -> pd.Series:
+    """
+    Date exacte de chaque point : YYYY-MM-DD gardée, YYYY-MM complétée au 1er
+    seulement en granularité mensuelle, tout le reste (ou date impossible) à None
+    """
+    dates = pd.Series([value if isinstance(value, str) else '' for value in dates], dtype=object)
+    lengths = dates.str.len()
+    monthly = (lengths == 7) & (granularity == 'monthly').to_numpy()
+    if monthly.any():
+        dates[monthly] = dates[monthly] + '-01'
+    dates[~((lengths == 10) | monthly)] = None
+    # Les dates impossibles (2024-13-40...) sont écartées comme les formats invalides
+    parsed = pd.to_datetime(dates, format='%Y-%m-%d', errors='coerce')
+    dates[parsed.isna()] = None
+    return dates
+
+
+def normalize_segments(records: Iterable[Dict], granularity: str = 'unknown',
+                       extraction_date: str = None) -> pd.DataFrame:
+    """
+    Aplatit des enregistrements de segments en lignes (une par segment et par date)
+
+    Seuls les identifiants sont répétés en Python ; dates, conversions numériques
+    et filtre (visites ou part de marché > 0) sont vectorisés.
+
+    Args:
+        records: Enregistrements produits par l'extraction (les erreurs sont ignorées)
+        granularity: Granularité des enregistrements qui ne la précisent pas
+        extraction_date: Date d'extraction (aujourd'hui si absente)
+
+    Returns:
+        DataFrame aux colonnes SEGMENT_COLUMNS (NaN/None pour les valeurs absentes)
+    """
+    points, segment_ids, segment_names, granularities = [], [], [], []
+
+    for record in records:
+        data = record.get('data')
+        if record.get('error') or not data or 'segments' not in data:
+            continue
+        record_points = [point for point in data['segments'] if isinstance(point, dict)]
+        points.extend(record_points)
+        segment_ids.extend([record.get('segment_id', '')] * len(record_points))
+        segment_names.extend([record.get('segment_name', '')] * len(record_points))
+        granularities.extend([record.get('extraction_granularity', granularity)] * len(record_points))
+
+    if not points:
+        return pd.DataFrame(columns=SEGMENT_COLUMNS)
+
+    # Une passe par colonne sur les points (plus rapide qu'un DataFrame de dicts)
+    frame = pd.DataFrame({
+        'segment_id': segment_ids,
+        'segment_name': segment_names,
+        'granularity': granularities,
+    })
+    frame['date'] = _normalize_dates([point.get('date') for point in points], frame['granularity'])
+    for field in SEGMENT_METRIC_FIELDS:
+        frame[field] = pd.Series([point.get(field) for point in points], dtype='float64')
+    # La confidence des segments est une chaîne dans BigQuery
+    frame['confidence'] = [None if value is None else str(value)
+                           for value in (point.get('confidence') for point in points)]
+    frame['extraction_date'] = extraction_date or date.today().isoformat()
+
+    keep = frame['date'].notna() & ((frame['visits'] > 0) | (frame['share'] > 0))
+    return frame.loc[keep, SEGMENT_COLUMNS].reset_index(drop=True)
+
+
+class _DateCodes:
+    """Codes entiers des dates brutes, partagés par toutes les séries d'une normalisation"""
+
+    def __init__(self):
+        self.codes = {}
+        self._last = (None, None)
+
+    def encode(self, dates: List) -> np.ndarray:
+        # Les séries d'un enregistrement (et d'une même période) ont presque toujours les mêmes dates
+        if dates != self._last[0]:
+            codes = self.codes
+            self._last = (dates, np.array([codes.setdefault(value, len(codes)) for value in dates],
+                                          dtype=np.int64))
+        return self._last[1]
+
+    def values(self) -> np.ndarray:
+        """Date brute de chaque code"""
+        values = np.empty(len(self.codes), dtype=object)
+        for value, code in self.codes.items():
+            values[code] = value
+        return values
+
+
+def _read_series(columns: Dict[str, List], owner: int, points: Optional[List[Dict]],
+                 date_codes: _DateCodes) -> None:
+    """
+    Ajoute une série aux colonnes, en tableaux numpy (indice de l'enregistrement,
+    code de la date, un float64 par champ) : les points bruts ne sont pas conservés
+    """
+    points = points or []
+    columns['owner'].append(np.full(len(points), owner, dtype=np.int64))
+    columns['date'].append(date_codes.encode([point.get('date') for point in points]))
+    for field, values in columns.items():
+        if field not in ('owner', 'date'):
+            values.append(np.array([point.get(field) for point in points], dtype='float64'))
+
+
+def _concat(columns: Dict[str, List]) -> Dict[str, np.ndarray]:
+    return {name: np.concatenate(values) if values else np.array([], dtype=np.int64)
+            for name, values in columns.items()}
+
+
+def _device_shares(points: Optional[List[Dict]]) -> Dict[str, List]:
+    """Part desktop et mobile de chaque point de split (la dernière entrée du device l'emporte)"""
+    points = points or []
+    shares = {'desktop': [None] * len(points), 'mobile': [None] * len(points)}
+    for position, point in enumerate(points):
+        for device_data in point.get('data', []):
+            share = shares.get(device_data.get('device', ''))
+            if share is not None:
+                share[position] = device_data.get('value', 0)
+    return shares
+
+
+def _match_series(exact: np.ndarray, by_month: np.ndarray, width: int,
+                  series: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Position, pour chaque ligne, du premier point de la série de son enregistrement
+    daté du jour de la ligne (clé exact) ou de son mois (clé by_month), -1 si aucun
+    """
+    point_keys = series['owner'] * width + series['date']
+    # Premier point de chaque clé, puis le plus tôt dans la série des deux correspondances
+    unique_keys, first = np.unique(point_keys, return_index=True)
+    if not len(unique_keys):
+        return np.full(len(exact), -1)
+    missing = len(point_keys)
+
+    def lookup(row_keys):
+        index = np.minimum(np.searchsorted(unique_keys, row_keys), len(unique_keys) - 1)
+        return np.where((unique_keys[index] == row_keys) & (row_keys >= 0), first[index], missing)
+
+    positions = np.minimum(lookup(exact), lookup(by_month))
+    return np.where(positions == missing, -1, positions)
+
+
+def _take(values: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """values[positions], NaN là où positions vaut -1"""
+    taken = np.full(len(positions), np.nan)
+    found = positions >= 0
+    taken[found] = values[positions[found]]
+    return taken
+
+
+def normalize_websites(records: Iterable[Dict], granularity: str = 'unknown',
+                       extraction_date: str = None) -> pd.DataFrame:
+    """
+    Aplatit des enregistrements de sites web en lignes (une par domaine et par date)
+
+    Les dates de référence sont celles de la série des visites. Comme pour les
+    segments, seule la lecture des points passe par Python : chaque série est
+    convertie à la lecture en tableaux (dates codées en entiers, valeurs en
+    float64). Dates, conversions et jointure de chaque autre série (métriques,
+    split desktop/mobile) sur (enregistrement, date ou mois) sont vectorisées.
+
+    Args:
+        records: Enregistrements produits par l'extraction
+        granularity: Granularité des enregistrements qui ne la précisent pas
+        extraction_date: Date d'extraction (aujourd'hui si absente)
+
+    Returns:
+        DataFrame aux colonnes WEBSITE_COLUMNS (NaN/None pour les valeurs absentes)
+    """
+    date_codes = _DateCodes()
+    domains, granularities = [], []
+    visits = {'owner': [], 'date': [], 'visits': [], 'confidence': []}
+    joined = {name: {'owner': [], 'date': [], field: [], 'confidence': []}
+              for name, field in WEBSITE_JOINED_METRICS}
+    split = {'owner': [], 'date': []}
+    split_shares = {'desktop': [], 'mobile': []}
+
+    for record in records:
+        metrics = record.get('metrics') or {}
+        visits_data = metrics.get('visits') or {}
+        if 'visits' not in visits_data:
+            continue
+        owner = len(domains)
+        domains.append(record.get('domain', ''))
+        granularities.append(record.get('extraction_granularity', granularity))
+        _read_series(visits, owner, visits_data['visits'], date_codes)
+        for name, _ in WEBSITE_JOINED_METRICS:
+            _read_series(joined[name], owner, (metrics.get(name) or {}).get(name), date_codes)
+        split_points = (metrics.get('desktop_mobile_split') or {}).get('data')
+        _read_series(split, owner, split_points, date_codes)
+        for device, shares in _device_shares(split_points).items():
+            split_shares[device].append(np.array(shares, dtype='float64'))
+
+    visits = _concat(visits)
+    if not len(visits['owner']):
+        return pd.DataFrame(columns=WEBSITE_COLUMNS)
+
+    # Date de chaque ligne : chaque date brute n'est normalisée qu'une fois par granularité
+    raw_dates = date_codes.values()
+    owners = visits['owner']
+    row_granularities = np.array(granularities, dtype=object)[owners]
+    monthly = row_granularities == 'monthly'
+    dates = np.empty(len(owners), dtype=object)
+    for is_monthly in (True, False):
+        rows = monthly == is_monthly
+        if rows.any():
+            # Seule la granularité mensuelle complète les dates YYYY-MM
+            flags = pd.Series(['monthly' if is_monthly else ''] * len(raw_dates))
+            dates[rows] = _normalize_dates(list(raw_dates), flags).to_numpy()[visits['date'][rows]]
+
+    keep = pd.notna(dates)
+    owners, dates = owners[keep], dates[keep]
+    frame = pd.DataFrame({
+        'domain': pd.Series(np.array(domains, dtype=object)[owners], dtype=object),
+        'date': pd.Series(dates, dtype=object),
+        'granularity': pd.Series(row_granularities[keep], dtype=object),
+        'visits': visits['visits'][keep],
+    })
+    # Confidence des visites, à défaut celle de la première métrique jointe qui en a une.
+    # Toujours un float : l'ancien uploader envoyait la chaîne de la métrique jointe,
+    # que la colonne FLOAT de BigQuery convertissait en la même valeur
+    confidence = visits['confidence'][keep]
+
+    # Clés (enregistrement, date) des lignes dans l'espace des dates brutes des séries
+    row_codes, unique_dates = pd.factorize(dates)
+    codes = date_codes.codes
+    width = len(codes)
+    exact_codes = np.array([codes.get(value, -1) for value in unique_dates], dtype=np.int64)[row_codes]
+    month_codes = np.array([codes.get(value[:7], -1) for value in unique_dates], dtype=np.int64)[row_codes]
+    exact = np.where(exact_codes >= 0, owners * width + exact_codes, -1)
+    by_month = np.where(month_codes >= 0, owners * width + month_codes, -1)
+
+    for name, field in WEBSITE_JOINED_METRICS:
+        series = _concat(joined[name])
+        positions = _match_series(exact, by_month, width, series)
+        frame[name] = _take(series[field], positions)
+        missing = np.isnan(confidence)
+        if missing.any():
+            confidence[missing] = _take(series['confidence'], positions[missing])
+
+    positions = _match_series(exact, by_month, width, _concat(split))
+    for device, shares in _concat(split_shares).items():
+        frame[f'{device}_share'] = _take(shares, positions)
+
+    frame['unique_visitors'] = np.nan
+    frame['confidence'] = confidence
+    frame['extraction_date'] = extraction_date or date.today().isoformat()
+    return frame[WEBSITE_COLUMNS]
+
+
+NORMALIZERS = {ENTITY_SEGMENT: normalize_segments, ENTITY_WEBSITE: normalize_websites}
+
+
+def normalize_records(kind: str, records: Iterable[Dict], granularity: str = 'unknown',
+                      extraction_date: str = None) -> pd.DataFrame:
+    """
+    Aplatit des enregistrements d'extraction selon leur type
+
+    Args:
+        kind: ENTITY_SEGMENT ou ENTITY_WEBSITE
+        records: Enregistrements produits par l'extraction
+        granularity: Granularité des enregistrements qui ne la précisent pas
+        extraction_date: Date d'extraction (aujourd'hui si absente)
+
+    Returns:
+        DataFrame aux colonnes COLUMNS[kind]
+    """
+    if kind not in NORMALIZERS:
+        raise ValueError(f"Type d'entité inconnu: {kind}")
+    return NORMALIZERS[kind](records, granularity, extraction_date)
+
+
+def columns_to_rows(columns: Dict[str, List]) -> List[Dict]:
+    """Assemble des colonnes (listes de même longueur) en lignes"""
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def frame_to_rows(frame: pd.DataFrame) -> List[Dict]:
+    """
+    Convertit des lignes normalisées en dictionnaires prêts pour BigQuery
+
+    Returns:
+        Une liste de lignes, valeurs absentes à None
+    """
+    if frame.empty:
+        return []
+    columns = {}
+    for name in frame.columns:
+        values = frame[name]
+        # NaN -> None colonne par colonne (to_dict ligne par ligne est bien plus lent)
+        columns[name] = values.tolist() if not values.hasnans else \
+            values.astype(object).where(values.notna(), None).tolist()
+    return columns_to_rows(columns)
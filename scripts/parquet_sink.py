@@ -0,0 +1,266 @@
+"""
+Écriture des résultats d'extraction en Parquet partitionné
+Les enregistrements sont normalisés en lignes (scripts/normalization.py) et écrits
+par partition entity=<type>/granularity=<granularité>/month=<YYYY-MM> : des
+fichiers compacts, lisibles colonne par colonne par l'uploader et l'analyse
+"""
+import itertools
+import logging
+import os
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+from scripts.normalization import (COLUMNS, ENTITY_SEGMENT, ENTITY_WEBSITE,
+                                   frame_to_rows, normalize_records)
+
+logger = logging.getLogger(__name__)
+
+PARQUET_EXTENSION = '.parquet'
+
+# Numéro des sinks du processus : deux sinks ouverts la même seconde n'écrivent pas le même fichier
+_SINK_SEQUENCE = itertools.count(1)
+
+# Schémas des lignes (mêmes colonnes que les tables BigQuery) ; les identifiants
+# très répétés sont encodés en dictionnaire (granularity reste une chaîne : elle est
+# aussi clé de partition et doit avoir le même type pour les lecteurs hive)
+SEGMENT_SCHEMA = pa.schema([
+    ('segment_id', pa.dictionary(pa.int32(), pa.string())),
+    ('segment_name', pa.dictionary(pa.int32(), pa.string())),
+    ('date', pa.date32()),
+    ('granularity', pa.string()),
+    ('visits', pa.float64()),
+    ('share', pa.float64()),
+    ('bounce_rate', pa.float64()),
+    ('pages_per_visit', pa.float64()),
+    ('visit_duration', pa.float64()),
+    ('page_views', pa.float64()),
+    ('unique_visitors', pa.float64()),
+    ('confidence', pa.dictionary(pa.int32(), pa.string())),
+    ('extraction_date', pa.date32()),
+])
+
+WEBSITE_SCHEMA = pa.schema([
+    ('domain', pa.dictionary(pa.int32(), pa.string())),
+    ('date', pa.date32()),
+    ('granularity', pa.string()),
+    ('visits', pa.float64()),
+    ('bounce_rate', pa.float64()),
+    ('pages_per_visit', pa.float64()),
+    ('avg_visit_duration', pa.float64()),
+    ('page_views', pa.float64()),
+    ('unique_visitors', pa.float64()),
+    ('desktop_share', pa.float64()),
+    ('mobile_share', pa.float64()),
+    ('confidence', pa.float64()),
+    ('extraction_date', pa.date32()),
+])
+
+SCHEMAS = {ENTITY_SEGMENT: SEGMENT_SCHEMA, ENTITY_WEBSITE: WEBSITE_SCHEMA}
+
+class ParquetResultSink:
+    """
+    Dataset Parquet alimenté au fil de l'extraction, partitionné par type,
+    granularité et mois
+
+    Les lignes normalisées sont gardées en DataFrames et écrites à chaque
+    flush() (ou au-delà de max_rows lignes en attente) dans un nouveau fichier
+    <directory>/entity=<kind>/granularity=<g>/month=<YYYY-MM>/part-<ts>-<pid>-<sink>-<n>.parquet.
+    Chaque fichier est écrit sous un nom temporaire puis renommé : un lecteur ne
+    voit jamais de fichier partiel. Utilisable depuis plusieurs threads.
+    """
+
+    def __init__(self, kind: str, directory: str = PARQUET_DATA_PATH,
+                 granularity: str = 'unknown', max_rows: int = PARQUET_SINK_MAX_ROWS):
+        """
+        Initialise le sink
+
+        Args:
+            kind: ENTITY_SEGMENT ou ENTITY_WEBSITE
+            directory: Racine du dataset Parquet
+            granularity: Granularité des enregistrements qui ne la précisent pas
+            max_rows: Lignes en attente au-delà desquelles les partitions sont écrites
+        """
+        if kind not in SCHEMAS:
+            raise ValueError(f"Type d'entité inconnu: {kind}")
+
+        self.kind = kind
+        self.directory = directory
+        self.granularity = granularity
+        self.max_rows = max(1, max_rows)
+        self.schema = SCHEMAS[kind]
+        self.timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self._file_prefix = f"part-{self.timestamp}-{os.getpid()}-{next(_SINK_SEQUENCE)}"
+
+        self.files: List[str] = []
+        self.records = 0
+        self.rows = 0
+        self._frames: List[pd.DataFrame] = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    @property
+    def current_file(self) -> Optional[str]:
+        """Dernier fichier écrit, relatif à la racine du dataset"""
+        return os.path.relpath(self.files[-1], self.directory) if self.files else None
+
+    def file_names(self) -> List[str]:
+        """Fichiers écrits, relatifs à la racine du dataset"""
+        return [os.path.relpath(path, self.directory) for path in self.files]
+
+    def write(self, record: Dict) -> None:
+        """Ajoute un enregistrement"""
+        self.write_many([record])
+
+    def write_many(self, records: Iterable[Dict]) -> int:
+        """
+        Normalise des enregistrements en lignes et les met en attente
+
+        Args:
+            records: Enregistrements produits par l'extraction
+
+        Returns:
+            Nombre d'enregistrements traités
+        """
+        records = list(records)
+        frame = normalize_records(self.kind, records, self.granularity)
+
+        with self._lock:
+            if not frame.empty:
+                self._frames.append(frame)
+                self._buffered += len(frame)
+            self.records += len(records)
+
+            if self._buffered >= self.max_rows:
+                self._write_partitions()
+        return len(records)
+
+    def _to_table(self, frame: pd.DataFrame) -> pa.Table:
+        """Convertit des lignes normalisées au schéma Parquet (dates ISO -> date32)"""
+        arrays = []
+        for field in self.schema:
+            values = pa.array(frame[field.name], from_pandas=True,
+                              type=pa.string() if pa.types.is_date(field.type) else field.type)
+            if pa.types.is_date(field.type):
+                values = pc.cast(pc.strptime(values, format='%Y-%m-%d', unit='s'), field.type)
+            arrays.append(values)
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def _write_partitions(self) -> None:
+        """Écrit un fichier par partition en attente (verrou déjà pris)"""
+        if not self._frames:
+            return
+
+        frame = pd.concat(self._frames, ignore_index=True)
+        self._frames = []
+        self._buffered = 0
+
+        for (granularity, month), partition_frame in frame.groupby(
+                [frame['granularity'], frame['date'].str[:7]], sort=True):
+            partition = os.path.join(self.directory, f"entity={self.kind}",
+                                     f"granularity={granularity}", f"month={month}")
+            os.makedirs(partition, exist_ok=True)
+            path = os.path.join(partition, f"{self._file_prefix}-{len(self.files) + 1:05d}{PARQUET_EXTENSION}")
+
+            table = self._to_table(partition_frame)
+            pq.write_table(table, path + '.tmp', compression=PARQUET_COMPRESSION)
+            os.replace(path + '.tmp', path)
+            self.files.append(path)
+            self.rows += table.num_rows
+
+    def flush(self) -> None:
+        """Écrit sur disque les lignes en attente"""
+        with self._lock:
+            self._write_partitions()
+
+    def close(self) -> List[str]:
+        """
+        Écrit les lignes en attente
+
+        Returns:
+            Fichiers écrits, relatifs à la racine du dataset
+        """
+        self.flush()
+        if self.files:
+            logger.info(f"{self.rows} lignes ({self.records} enregistrements) écrites dans "
+                        f"{len(self.files)} fichier(s) Parquet sous "
+                        f"{os.path.join(self.directory, f'entity={self.kind}')}")
+        return self.file_names()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_parquet_rows(path: str, kind: str = None) -> List[Dict]:
+    """
+    Relit un fichier Parquet du dataset en lignes prêtes pour BigQuery
+
+    Args:
+        path: Fichier .parquet
+        kind: Type d'entité attendu (un fichier d'un autre type donne une liste vide)
+
+    Returns:
+        Lignes avec les dates au format YYYY-MM-DD
+    """
+    # ParquetFile : pas de déduction des colonnes de partition depuis le chemin
+    parquet_file = pq.ParquetFile(path)
+    if kind is not None and parquet_file.schema_arrow.names != SCHEMAS[kind].names:
+        logger.warning(f"{path}: schéma différent de celui des lignes '{kind}', ignoré")
+        return []
+
+    table = parquet_file.read()
+    for index, field in enumerate(table.schema):
+        if pa.types.is_date(field.type):
+            # date32 -> 'YYYY-MM-DD'
+            table = table.set_column(index, field.name, pc.cast(table.column(index), pa.string()))
+    # Conversion colonne par colonne via pandas (to_pylist ligne par ligne est bien plus lent)
+    return frame_to_rows(table.to_pandas())
+
+
+def read_normalized(kind: str, start_date: str = None, end_date: str = None,
+                    directory: str = PARQUET_DATA_PATH, columns: List[str] = None) -> pd.DataFrame:
+    """
+    Charge les lignes normalisées d'un type d'entité depuis le dataset partitionné
+
+    Seules les partitions des mois couverts par [start_date, end_date] sont lues.
+
+    Args:
+        kind: ENTITY_SEGMENT ou ENTITY_WEBSITE
+        start_date: Première date incluse (YYYY-MM-DD), sans borne si absente
+        end_date: Dernière date incluse (YYYY-MM-DD), sans borne si absente
+        directory: Racine du dataset Parquet
+        columns: Colonnes à charger (toutes celles de la ligne si absent)
+
+    Returns:
+        DataFrame des lignes (vide si le dataset n'existe pas encore)
+    """
+    columns = columns or COLUMNS[kind]
+    root = os.path.join(directory, f"entity={kind}")
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=columns)
+
+    dataset = ds.dataset(root, format='parquet', partitioning='hive', schema=SCHEMAS[kind].append(
+        pa.field('month', pa.string())), exclude_invalid_files=True)
+
+    condition = None
+    for bound, month_test, date_test in (
+            (start_date, lambda m: ds.field('month') >= m, lambda d: ds.field('date') >= d),
+            (end_date, lambda m: ds.field('month') <= m, lambda d: ds.field('date') <= d)):
+        if bound:
+            test = month_test(bound[:7]) & date_test(date.fromisoformat(bound))
+            condition = test if condition is None else condition & test
+
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
@@ -0,0 +1,268 @@
+"""
+Registre local des appels à l'API SimilarWeb et contrôle du budget mensuel
+Chaque appel (y compris les hits de cache, à coût nul) est journalisé dans SQLite
+"""
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+import sys
+import os
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+
+logger = logging.getLogger(__name__)
+
+# Priorités des extractions : la réserve du quota est gardée pour 'high'
+PRIORITY_HIGH = 'high'      # Automatisation quotidienne
+PRIORITY_NORMAL = 'normal'  # Extractions manuelles
+PRIORITY_LOW = 'low'        # Backfills historiques
+
+
+class QuotaBudgetExceededError(Exception):
+    """Le budget mensuel ne permet plus de lancer d'appels à cette priorité"""
+
+
+class QuotaLedger:
+    """
+    Registre SQLite des appels API avec une API de budget
+
+    - PRIORITY_LOW doit laisser intacte la réserve du mois
+    - PRIORITY_NORMAL peut consommer jusqu'au quota
+    - PRIORITY_HIGH n'est jamais bloquée (seulement signalée au-delà du quota)
+
+    Les appels sont écrits par lots (flush_rows lignes ou flush_seconds) et le
+    budget s'appuie sur un total du mois tenu en mémoire : la somme SQL n'est
+    relue qu'au changement de mois et toutes les refresh_seconds (consommation
+    des autres processus).
+    """
+
+    def __init__(self, path: str = API_QUOTA_LEDGER_PATH,
+                 monthly_quota: int = API_MONTHLY_QUOTA,
+                 reserve: int = API_QUOTA_RESERVE,
+                 flush_rows: int = API_QUOTA_FLUSH_ROWS,
+                 flush_seconds: float = API_QUOTA_FLUSH_SECONDS,
+                 refresh_seconds: float = API_QUOTA_REFRESH_SECONDS):
+        """
+        Initialise le registre
+
+        Args:
+            path: Chemin du fichier SQLite
+            monthly_quota: Nombre d'appels facturables par mois
+            reserve: Appels gardés pour l'automatisation quotidienne
+            flush_rows: Appels en attente au-delà desquels ils sont écrits
+            flush_seconds: Délai maximum avant l'écriture des appels en attente
+            refresh_seconds: Intervalle de relecture du total du mois
+        """
+        self.path = path
+        self.monthly_quota = monthly_quota
+        self.reserve = reserve
+        self.flush_rows = max(1, flush_rows)
+        self.flush_seconds = flush_seconds
+        self.refresh_seconds = refresh_seconds
+
+        self._pending = []
+        self._flushed_at = time.monotonic()
+        # Total du mois en mémoire : (mois, coût, instant de la dernière relecture)
+        self._used_month = None
+        self._used_total = 0.0
+        self._used_refreshed_at = 0.0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS api_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                month TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                family TEXT NOT NULL,
+                status INTEGER,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                cost REAL NOT NULL DEFAULT 0,
+                cached INTEGER NOT NULL DEFAULT 0,
+                priority TEXT,
+                api_key_id TEXT
+            )
+        """)
+        self._migrate()
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_api_calls_month ON api_calls(month)')
+        self._conn.commit()
+
+        # Les appels encore en attente sont écrits à la sortie du processus
+        atexit.register(self.flush)
+
+    def _migrate(self) -> None:
+        """Ajoute les colonnes apparues après la création d'un registre existant"""
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(api_calls)')}
+        if 'api_key_id' not in columns:
+            self._conn.execute('ALTER TABLE api_calls ADD COLUMN api_key_id TEXT')
+
+    @staticmethod
+    def current_month() -> str:
+        """Mois de facturation courant (YYYY-MM)"""
+        return datetime.now().strftime('%Y-%m')
+
+    def record(self, endpoint: str, family: str, status: Optional[int],
+               bytes_received: int = 0, cost: float = 0, cached: bool = False,
+               priority: str = None, api_key_id: str = None) -> None:
+        """
+        Journalise un appel
+
+        Args:
+            endpoint: Endpoint appelé
+            family: Famille d'endpoints (voir get_endpoint_family)
+            status: Code HTTP (None pour une erreur réseau)
+            bytes_received: Taille de la réponse
+            cost: Coût en unités de quota
+            cached: True si la réponse vient du cache
+            priority: Priorité de l'extraction à l'origine de l'appel
+            api_key_id: Identifiant de la clé API qui a servi l'appel (None pour le cache)
+        """
+        month = self.current_month()
+
+        with self._lock:
+            self._pending.append((time.time(), month, endpoint, family, status,
+                                  bytes_received, cost, int(cached), priority, api_key_id))
+            if month == self._used_month:
+                self._used_total += cost
+
+            if (len(self._pending) >= self.flush_rows
+                    or time.monotonic() - self._flushed_at >= self.flush_seconds):
+                self._flush()
+
+    def _flush(self) -> None:
+        """Écrit les appels en attente en une transaction (verrou déjà pris)"""
+        self._flushed_at = time.monotonic()
+        if not self._pending:
+            return
+
+        self._conn.executemany(
+            'INSERT INTO api_calls (ts, month, endpoint, family, status, bytes, cost, cached, '
+            'priority, api_key_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', self._pending)
+        self._conn.commit()
+        self._pending = []
+
+    def flush(self) -> None:
+        """Écrit sur disque les appels en attente"""
+        with self._lock:
+            self._flush()
+
+    def used(self, month: str = None) -> float:
+        """Quota consommé sur le mois (mois courant par défaut)"""
+        current = self.current_month()
+        month = month or current
+
+        with self._lock:
+            if month != current:
+                self._flush()
+                return self._conn.execute(
+                    'SELECT COALESCE(SUM(cost), 0) FROM api_calls WHERE month = ?', (month,)).fetchone()[0]
+
+            # Total en mémoire, relu au changement de mois et périodiquement (autres processus)
+            if (self._used_month != month
+                    or time.monotonic() - self._used_refreshed_at >= self.refresh_seconds):
+                self._flush()
+                self._used_total = self._conn.execute(
+                    'SELECT COALESCE(SUM(cost), 0) FROM api_calls WHERE month = ?', (month,)).fetchone()[0]
+                self._used_month = month
+                self._used_refreshed_at = time.monotonic()
+            return self._used_total
+
+    def used_by_key(self, month: str = None) -> Dict[str, float]:
+        """Quota consommé sur le mois par chaque clé API"""
+        with self._lock:
+            self._flush()
+            rows = self._conn.execute(
+                'SELECT api_key_id, COALESCE(SUM(cost), 0) FROM api_calls '
+                'WHERE month = ? AND api_key_id IS NOT NULL GROUP BY api_key_id',
+                (month or self.current_month(),)).fetchall()
+        return dict(rows)
+
+    def remaining(self, month: str = None) -> float:
+        """Quota restant sur le mois"""
+        return self.monthly_quota - self.used(month)
+
+    def can_spend(self, calls: int = 1, priority: str = PRIORITY_NORMAL) -> bool:
+        """
+        Indique si des appels peuvent être lancés à cette priorité
+
+        Args:
+            calls: Nombre d'appels envisagés
+            priority: Priorité de l'extraction
+
+        Returns:
+            True si le budget le permet
+        """
+        if priority == PRIORITY_HIGH:
+            return True
+
+        floor = self.reserve if priority == PRIORITY_LOW else 0
+        return self.remaining() - calls >= floor
+
+    def check_budget(self, calls: int = 1, priority: str = PRIORITY_NORMAL) -> None:
+        """
+        Lève QuotaBudgetExceededError si le budget ne permet pas ces appels
+
+        Args:
+            calls: Nombre d'appels envisagés
+            priority: Priorité de l'extraction
+        """
+        if not self.can_spend(calls, priority):
+            raise QuotaBudgetExceededError(
+                f"Quota insuffisant pour {calls} appels en priorité {priority}: "
+                f"{self.remaining():.0f} restants (réserve {self.reserve})")
+
+        if priority == PRIORITY_HIGH and self.remaining() - calls < 0:
+            logger.warning(f"Quota mensuel dépassé ({self.used():.0f}/{self.monthly_quota})")
+
+    def summary(self, month: str = None) -> Dict:
+        """Retourne la consommation du mois pour les rapports d'exécution"""
+        month = month or self.current_month()
+
+        with self._lock:
+            self._flush()
+            rows = self._conn.execute(
+                'SELECT family, COUNT(*), COALESCE(SUM(cost), 0), COALESCE(SUM(bytes), 0), SUM(cached) '
+                'FROM api_calls WHERE month = ? GROUP BY family', (month,)).fetchall()
+        by_key = self.used_by_key(month)
+
+        used = sum(row[2] for row in rows)
+        return {
+            'month': month,
+            'quota': self.monthly_quota,
+            'reserve': self.reserve,
+            'used': used,
+            'remaining': self.monthly_quota - used,
+            'by_family': {
+                family: {'calls': calls, 'cost': cost, 'bytes': size, 'cached': cached}
+                for family, calls, cost, size, cached in rows
+            },
+            'by_key': by_key
+        }
+
+
+_shared_ledger = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_quota_ledger() -> QuotaLedger:
+    """
+    Retourne le registre unique du processus
+
+    Returns:
+        Instance partagée de QuotaLedger
+    """
+    global _shared_ledger
+
+    with _shared_lock:
+        if _shared_ledger is None:
+            _shared_ledger = QuotaLedger()
+        return _shared_ledger
@@ -0,0 +1,381 @@
+"""
+Limiteur de débit adaptatif (token bucket + AIMD) pour l'API SimilarWeb
+Partagé par tous les clients SimilarWebAPI du processus, ou entre processus
+via un fichier d'état verrouillé (API_RATE_LIMIT_STATE_DIR)
+"""
+import json
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+import sys
+import os
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de limiteur inter-processus
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Convertit un header Retry-After en nombre de secondes
+
+    Args:
+        value: Valeur du header (secondes ou date HTTP)
+
+    Returns:
+        Délai en secondes ou None si absent/illisible
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _get_header(headers: Optional[Mapping], *names: str) -> Optional[str]:
+    """Retourne la première valeur trouvée parmi plusieurs noms de header"""
+    if not headers:
+        return None
+
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+class TokenBucketRateLimiter:
+    """
+    Token bucket thread-safe dont le débit s'adapte aux réponses de l'API
+
+    Le débit baisse de façon multiplicative à chaque 429 et remonte de façon
+    additive tant que les appels réussissent (AIMD).
+    """
+
+    def __init__(self, rate: float = API_RATE_LIMIT_RPS,
+                 burst: int = API_RATE_LIMIT_BURST,
+                 min_rate: float = API_RATE_LIMIT_MIN_RPS,
+                 max_rate: float = API_RATE_LIMIT_MAX_RPS,
+                 increase_step: float = API_RATE_LIMIT_INCREASE_STEP,
+                 increase_interval: float = API_RATE_LIMIT_INCREASE_INTERVAL,
+                 decrease_factor: float = API_RATE_LIMIT_DECREASE_FACTOR):
+        """
+        Initialise le limiteur
+
+        Args:
+            rate: Débit initial en requêtes par seconde
+            burst: Nombre maximum de jetons accumulables
+            min_rate: Débit plancher après les baisses
+            max_rate: Débit plafond après les hausses
+            increase_step: Requêtes/s ajoutées à chaque palier sans 429
+            increase_interval: Durée d'un palier en secondes
+            decrease_factor: Facteur appliqué au débit sur un 429
+        """
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = max(1, burst)
+        self.increase_step = increase_step
+        self.increase_interval = increase_interval
+        self.decrease_factor = decrease_factor
+
+        self._rate = min(max(rate, min_rate), max_rate)
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._last_adjust = self._last_refill
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        self._throttled_count = 0
+
+    @property
+    def rate(self) -> float:
+        """Débit courant en requêtes par seconde"""
+        return self._rate
+
+    def _refill(self, now: float) -> None:
+        """Ajoute les jetons accumulés depuis le dernier appel"""
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self._rate)
+            self._last_refill = now
+
+    def reserve(self, tokens: int = 1) -> float:
+        """
+        Réserve des jetons sans attendre
+
+        Args:
+            tokens: Nombre de jetons à consommer
+
+        Returns:
+            Délai en secondes à attendre avant d'envoyer la requête
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+
+            wait = max(0.0, self._blocked_until - now)
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self._rate)
+            return wait
+
+    def available_in(self, tokens: int = 1) -> float:
+        """
+        Délai avant que des jetons soient disponibles, sans les consommer
+
+        Args:
+            tokens: Nombre de jetons souhaités
+
+        Returns:
+            Délai en secondes (0 si disponibles tout de suite)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            wait = max(0.0, self._blocked_until - now)
+            if self._tokens < tokens:
+                wait = max(wait, (tokens - self._tokens) / self._rate)
+            return wait
+
+    def acquire(self, tokens: int = 1) -> float:
+        """
+        Attend qu'un jeton soit disponible
+
+        Args:
+            tokens: Nombre de jetons à consommer
+
+        Returns:
+            Temps d'attente effectif en secondes
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def on_success(self, headers: Optional[Mapping] = None) -> None:
+        """
+        Signale une réponse réussie (hausse additive + lecture des headers de quota)
+
+        Args:
+            headers: Headers de la réponse HTTP
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_adjust >= self.increase_interval:
+                self._refill(now)
+                self._rate = min(self.max_rate, self._rate + self.increase_step)
+                self._last_adjust = now
+
+            # Quota de la fenêtre courante épuisé : attendre la réinitialisation
+            remaining = _get_header(headers, 'X-RateLimit-Remaining', 'RateLimit-Remaining')
+            reset = _get_header(headers, 'X-RateLimit-Reset', 'RateLimit-Reset')
+            if remaining is not None and reset is not None:
+                try:
+                    if int(float(remaining)) <= 0:
+                        reset_seconds = float(reset)
+                        # Certains serveurs renvoient un timestamp epoch plutôt qu'un délai
+                        if reset_seconds > 10 ** 9:
+                            reset_seconds = max(0.0, reset_seconds - time.time())
+                        self._blocked_until = max(self._blocked_until, now + reset_seconds)
+                except ValueError:
+                    pass
+
+    def on_rate_limited(self, headers: Optional[Mapping] = None,
+                        default_delay: float = RETRY_DELAY * 2) -> float:
+        """
+        Signale un 429 : baisse multiplicative du débit et blocage jusqu'au Retry-After
+
+        Args:
+            headers: Headers de la réponse 429
+            default_delay: Délai utilisé si aucun Retry-After n'est fourni
+
+        Returns:
+            Délai de blocage appliqué en secondes
+        """
+        delay = parse_retry_after(_get_header(headers, 'Retry-After'))
+        if delay is None:
+            delay = default_delay
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._rate = max(self.min_rate, self._rate * self.decrease_factor)
+            self._tokens = min(self._tokens, 0.0)
+            self._blocked_until = max(self._blocked_until, now + delay)
+            self._last_adjust = now
+            self._throttled_count += 1
+
+        logger.warning(f"Débit réduit à {self._rate:.2f} req/s (pause de {delay:.1f}s)")
+        return delay
+
+    def snapshot(self) -> Dict:
+        """Retourne l'état courant du limiteur"""
+        with self._lock:
+            return {
+                'rate': round(self._rate, 3),
+                'burst': self.burst,
+                'tokens': round(self._tokens, 3),
+                'blocked_for': round(max(0.0, self._blocked_until - time.monotonic()), 3),
+                'throttled_count': self._throttled_count
+            }
+
+
+class _FileStateLock:
+    """
+    Verrou du limiteur inter-processus
+
+    À l'entrée : verrou du processus puis flock exclusif sur le fichier d'état,
+    dont l'état du bucket est rechargé ; à la sortie : l'état est réécrit puis
+    le fichier déverrouillé. Les méthodes du token bucket s'exécutent donc
+    inchangées sur un état commun à tous les processus.
+    """
+
+    def __init__(self, limiter: 'FileLockedRateLimiter'):
+        self._limiter = limiter
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            self._fd = os.open(self._limiter.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            self._limiter._load(os.read(self._fd, 4096))
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            data = self._limiter._dump()
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            os.ftruncate(self._fd, 0)
+            os.write(self._fd, data)
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+
+class FileLockedRateLimiter(TokenBucketRateLimiter):
+    """
+    Token bucket AIMD partagé entre processus d'une même machine
+
+    L'état (jetons, débit, blocage Retry-After) vit dans un petit fichier JSON
+    verrouillé par fcntl.flock : les workers d'un backfill multi-processus
+    consomment les mêmes jetons et un 429 ralentit tous les processus.
+    Les horodatages utilisent time.monotonic(), commun aux processus d'un même boot.
+    """
+
+    _STATE_FIELDS = ('_rate', '_tokens', '_last_refill', '_last_adjust',
+                     '_blocked_until', '_throttled_count')
+
+    def __init__(self, path: str, **kwargs):
+        """
+        Initialise le limiteur
+
+        Args:
+            path: Fichier d'état partagé (créé au premier appel)
+            **kwargs: Paramètres de TokenBucketRateLimiter (utilisés si le fichier est neuf)
+        """
+        if fcntl is None:
+            raise RuntimeError("Limiteur inter-processus indisponible sur cette plateforme (fcntl)")
+
+        super().__init__(**kwargs)
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = _FileStateLock(self)
+
+    def _load(self, raw: bytes) -> None:
+        """Recharge l'état écrit par le dernier processus (verrou déjà pris)"""
+        if not raw:
+            return
+
+        try:
+            state = json.loads(raw)
+        except ValueError:
+            logger.warning(f"État du limiteur illisible ({self.path}), réinitialisé")
+            return
+
+        # Horodatages d'un boot précédent : l'état n'a plus de sens
+        if state.get('_last_refill', 0) > time.monotonic():
+            return
+
+        for field in self._STATE_FIELDS:
+            if field in state:
+                setattr(self, field, state[field])
+
+    def _dump(self) -> bytes:
+        """Sérialise l'état courant (verrou déjà pris)"""
+        return json.dumps({field: getattr(self, field) for field in self._STATE_FIELDS}).encode('utf-8')
+
+
+_state_dir = API_RATE_LIMIT_STATE_DIR
+
+
+def set_rate_limit_state_dir(path: str) -> None:
+    """
+    Active (ou désactive avec '') le partage des limiteurs entre processus
+
+    Les limiteurs déjà créés dans le processus sont conservés : à appeler
+    au démarrage d'un worker, avant tout appel API.
+
+    Args:
+        path: Dossier des fichiers d'état, un par limiteur
+    """
+    global _state_dir
+    _state_dir = path
+
+
+_shared_rate_limiters: Dict[str, TokenBucketRateLimiter] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_rate_limiter(name: str = 'default') -> TokenBucketRateLimiter:
+    """
+    Retourne le limiteur unique du processus pour un nom donné (créé au premier appel)
+
+    Si un dossier d'état est configuré, le limiteur est aussi partagé avec les
+    autres processus (FileLockedRateLimiter).
+
+    Args:
+        name: Nom du limiteur (un par clé API)
+
+    Returns:
+        Instance partagée de TokenBucketRateLimiter
+    """
+    with _shared_lock:
+        if name not in _shared_rate_limiters:
+            if _state_dir:
+                _shared_rate_limiters[name] = FileLockedRateLimiter(os.path.join(_state_dir, f'{name}.json'))
+            else:
+                _shared_rate_limiters[name] = TokenBucketRateLimiter()
+        return _shared_rate_limiters[name]
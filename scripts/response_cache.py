@@ -0,0 +1,259 @@
+"""
+Cache disque des réponses de l'API SimilarWeb
+Évite de re-télécharger des payloads identiques d'une exécution à l'autre
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+import sys
+import os
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+
+logger = logging.getLogger(__name__)
+
+
+def get_period_end(params: Dict) -> Optional[date]:
+    """
+    Retourne le dernier jour couvert par une requête
+
+    Args:
+        params: Paramètres de la requête (end_date au format YYYY-MM ou YYYY-MM-DD)
+
+    Returns:
+        Date de fin de période ou None si la requête n'est pas datée
+    """
+    end_date = str(params.get('end_date') or '')
+
+    try:
+        if len(end_date) == 10:
+            return datetime.strptime(end_date, '%Y-%m-%d').date()
+        if len(end_date) == 7:
+            year, month = int(end_date[:4]), int(end_date[5:7])
+            return date(year, month, monthrange(year, month)[1])
+    except ValueError:
+        pass
+
+    return None
+
+
+class ResponseCache:
+    """
+    Cache SQLite des réponses JSON, avec éviction LRU bornée en taille
+
+    Les périodes closes (au-delà de la fenêtre de révision SimilarWeb)
+    n'expirent jamais ; les périodes récentes ont un TTL court.
+    """
+
+    def __init__(self, path: str = API_CACHE_PATH,
+                 max_bytes: int = API_CACHE_MAX_BYTES,
+                 recent_ttl: int = API_CACHE_RECENT_TTL,
+                 revision_days: int = API_REVISION_WINDOW_DAYS):
+        """
+        Initialise le cache
+
+        Args:
+            path: Chemin du fichier SQLite
+            max_bytes: Taille maximum des payloads stockés avant éviction
+            recent_ttl: Durée de vie en secondes des périodes encore révisables
+            revision_days: Nombre de jours pendant lesquels SimilarWeb révise les données
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.recent_ttl = recent_ttl
+        self.revision_days = revision_days
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)')
+        self._conn.commit()
+
+        self._total_bytes = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(endpoint: str, params: Optional[Dict], base_url: str = '') -> str:
+        """
+        Construit la clé de cache (hôte + endpoint + paramètres normalisés, sans api_key)
+
+        Args:
+            endpoint: Endpoint de l'API
+            params: Paramètres de la requête
+            base_url: URL de base de l'API (deux hôtes ne partagent pas leurs réponses)
+
+        Returns:
+            Empreinte SHA-256 de la requête
+        """
+        normalized = {
+            str(k): str(v) for k, v in (params or {}).items()
+            if k != 'api_key' and v is not None
+        }
+        raw = json.dumps({'base_url': base_url.rstrip('/'), 'endpoint': endpoint, 'params': normalized},
+                         sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _expires_at(self, params: Optional[Dict], now: float) -> Optional[float]:
+        """Calcule l'expiration d'une entrée (None = n'expire jamais)"""
+        period_end = get_period_end(params or {})
+        if period_end is not None:
+            revision_limit = date.today() - timedelta(days=self.revision_days)
+            if period_end < revision_limit:
+                return None
+        return now + self.recent_ttl
+
+    def get(self, endpoint: str, params: Optional[Dict], base_url: str = '') -> Optional[Dict]:
+        """
+        Retourne la réponse en cache si elle existe et n'a pas expiré
+
+        Args:
+            endpoint: Endpoint de l'API
+            params: Paramètres de la requête
+            base_url: URL de base de l'API
+
+        Returns:
+            Réponse JSON ou None
+        """
+        key = self.make_key(endpoint, params, base_url)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT payload, expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+
+            if row is None or (row[1] is not None and row[1] <= now):
+                self.misses += 1
+                return None
+
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def contains(self, endpoint: str, params: Optional[Dict], base_url: str = '') -> bool:
+        """
+        Indique si une réponse non expirée est en cache, sans compter de hit ni de miss
+
+        Args:
+            endpoint: Endpoint de l'API
+            params: Paramètres de la requête
+            base_url: URL de base de l'API
+
+        Returns:
+            True si get() servirait la requête
+        """
+        key = self.make_key(endpoint, params, base_url)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+        return row is not None and (row[0] is None or row[0] > time.time())
+
+    def set(self, endpoint: str, params: Optional[Dict], payload: Dict,
+            base_url: str = '') -> None:
+        """
+        Enregistre une réponse
+
+        Args:
+            endpoint: Endpoint de l'API
+            params: Paramètres de la requête
+            payload: Réponse JSON à stocker
+            base_url: URL de base de l'API
+        """
+        key = self.make_key(endpoint, params, base_url)
+        raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+        size = len(raw.encode('utf-8'))
+        now = time.time()
+
+        with self._lock:
+            previous = self._conn.execute(
+                'SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, endpoint, raw, size, now, self._expires_at(params, now), now)
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            self.writes += 1
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Supprime les entrées les moins récemment utilisées (verrou déjà pris)"""
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            'SELECT key, size FROM responses ORDER BY last_access ASC').fetchall()
+
+        to_delete = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            to_delete.append((key,))
+            self._total_bytes -= size
+
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', to_delete)
+        self.evictions += len(to_delete)
+        logger.info(f"Cache API: {len(to_delete)} entrées évincées (LRU)")
+
+    def stats(self) -> Dict:
+        """Retourne les compteurs du cache pour les résumés d'exécution"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'size_bytes': self._total_bytes
+        }
+
+    def close(self) -> None:
+        """Ferme la connexion SQLite"""
+        with self._lock:
+            self._conn.close()
+
+
+_shared_response_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_response_cache() -> ResponseCache:
+    """
+    Retourne le cache unique du processus (créé au premier appel)
+
+    Returns:
+        Instance partagée de ResponseCache
+    """
+    global _shared_response_cache
+
+    with _shared_lock:
+        if _shared_response_cache is None:
+            _shared_response_cache = ResponseCache()
+        return _shared_response_cache
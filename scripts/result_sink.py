@@ -0,0 +1,279 @@
+"""
+Écriture en flux des résultats d'extraction (NDJSON)
+Une ligne JSON compacte par entité et par période, écrite dès que le résultat arrive :
+la mémoire reste bornée et un arrêt brutal ne perd que les lignes non synchronisées
+"""
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Set
+import sys
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+
+logger = logging.getLogger(__name__)
+
+NDJSON_EXTENSION = '.ndjson'
+
+
+class NdjsonResultSink:
+    """
+    Fichier NDJSON alimenté au fil de l'eau, avec rotation par taille
+
+    Les fichiers s'appellent <prefix>_<timestamp>_partNNN.ndjson ; les lignes
+    sont synchronisées sur disque tous les fsync_every enregistrements et à
+    chaque flush(). Utilisable depuis plusieurs threads.
+    """
+
+    def __init__(self, prefix: str, directory: str = DATA_PATH,
+                 fsync_every: int = RESULT_SINK_FSYNC_EVERY,
+                 max_bytes: int = RESULT_SINK_MAX_BYTES):
+        """
+        Initialise le sink (le premier fichier est créé à la première écriture)
+
+        Args:
+            prefix: Début du nom des fichiers (ex: 'segments_daily_auto')
+            directory: Dossier de sortie
+            fsync_every: Enregistrements écrits entre deux fsync
+            max_bytes: Taille au-delà de laquelle un nouveau fichier est ouvert
+        """
+        self.prefix = prefix
+        self.directory = directory
+        self.fsync_every = max(1, fsync_every)
+        self.max_bytes = max_bytes
+        self.timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+        self.files: List[str] = []
+        self.records = 0
+        self._file = None
+        self._file_bytes = 0
+        self._unsynced = 0
+        self._lock = threading.Lock()
+
+    @property
+    def current_file(self) -> str:
+        """Nom du fichier en cours d'écriture (None avant la première écriture)"""
+        return os.path.basename(self.files[-1]) if self.files else None
+
+    def _open_next(self) -> None:
+        """Ferme le fichier courant et ouvre le suivant (verrou déjà pris)"""
+        self._close_file()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory,
+                            f"{self.prefix}_{self.timestamp}_part{len(self.files) + 1:03d}{NDJSON_EXTENSION}")
+        self._file = open(path, 'a', encoding='utf-8')
+        self._file_bytes = 0
+        self.files.append(path)
+
+    def _sync(self) -> None:
+        """Force les lignes écrites sur disque (verrou déjà pris)"""
+        if self._file is not None and self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def _close_file(self) -> None:
+        """Synchronise et ferme le fichier courant (verrou déjà pris)"""
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def write(self, record: Dict) -> None:
+        """Ajoute un enregistrement"""
+        self.write_many([record])
+
+    def write_many(self, records: Iterable[Dict]) -> int:
+        """
+        Ajoute des enregistrements
+
+        Args:
+            records: Enregistrements à écrire (un par ligne)
+
+        Returns:
+            Nombre d'enregistrements écrits
+        """
+        written = 0
+        with self._lock:
+            for record in records:
+                line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+                size = len(line.encode('utf-8'))
+
+                if self._file is None or (self._file_bytes and self._file_bytes + size > self.max_bytes):
+                    self._open_next()
+
+                self._file.write(line)
+                self._file_bytes += size
+                self._unsynced += 1
+                self.records += 1
+                written += 1
+
+                if self._unsynced >= self.fsync_every:
+                    self._sync()
+        return written
+
+    def flush(self) -> None:
+        """Synchronise sur disque les enregistrements déjà écrits"""
+        with self._lock:
+            self._sync()
+
+    def file_names(self) -> List[str]:
+        """Noms des fichiers écrits"""
+        return [os.path.basename(path) for path in self.files]
+
+    def close(self) -> List[str]:
+        """
+        Synchronise et ferme le fichier courant
+
+        Returns:
+            Noms des fichiers écrits
+        """
+        with self._lock:
+            self._close_file()
+
+        if self.files:
+            logger.info(f"{self.records} enregistrements écrits dans {len(self.files)} fichier(s) "
+                        f"{self.prefix}_{self.timestamp}_part*{NDJSON_EXTENSION}")
+        return self.file_names()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class MultiResultSink:
+    """Écrit les mêmes enregistrements dans plusieurs sinks (ex: NDJSON et Parquet)"""
+
+    def __init__(self, sinks: List[Any]):
+        self.sinks = list(sinks)
+
+    @property
+    def files(self) -> List[str]:
+        return [path for sink in self.sinks for path in sink.files]
+
+    @property
+    def current_file(self) -> str:
+        """Fichier courant du premier sink"""
+        return self.sinks[0].current_file
+
+    def file_names(self) -> List[str]:
+        return [name for sink in self.sinks for name in sink.file_names()]
+
+    def write(self, record: Dict) -> None:
+        self.write_many([record])
+
+    def write_many(self, records: Iterable[Dict]) -> int:
+        records = list(records)
+        for sink in self.sinks:
+            sink.write_many(records)
+        return len(records)
+
+    def flush(self) -> None:
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self) -> List[str]:
+        names = [name for sink in self.sinks for name in sink.close()]
+
+        # Fichiers NDJSON fermés : toutes leurs lignes sont aussi dans le dataset normalisé
+        raw_sinks = [sink for sink in self.sinks if isinstance(sink, NdjsonResultSink)]
+        raw = [path for sink in raw_sinks for path in sink.files]
+        if raw and len(raw_sinks) < len(self.sinks):
+            normalized = [path for sink in self.sinks if sink not in raw_sinks for path in sink.files]
+            record_normalized_sources(raw, normalized)
+        return names
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_result_sink(kind: str, prefix: str, output_format: str = RESULT_OUTPUT_FORMAT,
+                     granularity: str = 'unknown'):
+    """
+    Ouvre la destination des résultats d'extraction selon le format configuré
+
+    Args:
+        kind: 'segment' ou 'website'
+        prefix: Début du nom des fichiers NDJSON
+        output_format: 'ndjson', 'parquet' ou 'both'
+        granularity: Granularité des enregistrements qui ne la précisent pas (Parquet)
+
+    Returns:
+        Sink exposant write_many(), flush(), close(), files et current_file
+    """
+    if output_format not in ('ndjson', 'parquet', 'both'):
+        raise ValueError(f"Format de sortie inconnu: {output_format}")
+
+    sinks = []
+    if output_format in ('ndjson', 'both'):
+        sinks.append(NdjsonResultSink(prefix))
+    if output_format in ('parquet', 'both'):
+        # pyarrow n'est importé que si la sortie Parquet est demandée
+        from scripts.parquet_sink import ParquetResultSink
+        sinks.append(ParquetResultSink(kind, granularity=granularity))
+
+    return sinks[0] if len(sinks) == 1 else MultiResultSink(sinks)
+
+
+def record_normalized_sources(raw_files: List[str], normalized_files: List[str],
+                              path: str = PARQUET_SOURCES_PATH) -> None:
+    """
+    Enregistre des fichiers bruts dont toutes les lignes sont aussi dans le dataset normalisé
+
+    Args:
+        raw_files: Fichiers NDJSON fermés
+        normalized_files: Fichiers Parquet écrits avec eux
+        path: Fichier JSON Lines des correspondances
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    entry = {
+        'ts': datetime.now().isoformat(),
+        'raw': [os.path.abspath(f) for f in raw_files],
+        'normalized': [os.path.abspath(f) for f in normalized_files]
+    }
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+
+def load_normalized_sources(path: str = PARQUET_SOURCES_PATH) -> Set[str]:
+    """
+    Fichiers bruts (chemins absolus) déjà couverts par le dataset normalisé
+
+    Returns:
+        Ensemble vide si aucune correspondance n'a été enregistrée
+    """
+    if not os.path.exists(path):
+        return set()
+    return {raw for entry in iter_ndjson(path) for raw in entry.get('raw', [])}
+
+
+def iter_ndjson(path: str) -> Iterator[Any]:
+    """
+    Relit un fichier NDJSON enregistrement par enregistrement
+
+    Une ligne illisible (dernière ligne tronquée par un arrêt brutal) est ignorée.
+
+    Args:
+        path: Fichier .ndjson
+
+    Yields:
+        Enregistrements dans l'ordre du fichier
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warning(f"Ligne {line_number} illisible dans {path}, ignorée")
@@ -0,0 +1,240 @@
+"""
+Politique de retry (backoff exponentiel avec full jitter) et circuit breaker
+par famille d'endpoints pour l'API SimilarWeb
+"""
+import logging
+import random
+import threading
+import time
+from typing import Dict, List
+import sys
+import os
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+
+logger = logging.getLogger(__name__)
+
+# Statuts HTTP pour lesquels une nouvelle tentative a du sens (hors 429, géré par le rate limiter)
+RETRYABLE_STATUS_CODES = {500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """
+    Appel refusé sans toucher l'API : le circuit de sa famille d'endpoints est ouvert
+
+    open_until est l'instant (time.monotonic()) à partir duquel redemander a
+    une chance d'aboutir : les ordonnanceurs remettent l'appel en file jusque-là
+    """
+
+    def __init__(self, family: str, open_until: float):
+        super().__init__(f"Circuit {family} ouvert")
+        self.family = family
+        self.open_until = open_until
+
+
+class RetryPolicy:
+    """Backoff exponentiel avec full jitter : délai aléatoire dans [0, min(max, base * 2^n)]"""
+
+    def __init__(self, max_retries: int = MAX_RETRIES,
+                 base_delay: float = RETRY_BACKOFF_BASE,
+                 max_delay: float = RETRY_BACKOFF_MAX):
+        """
+        Initialise la politique
+
+        Args:
+            max_retries: Nombre de nouvelles tentatives après le premier appel
+            base_delay: Délai de base en secondes
+            max_delay: Plafond du délai en secondes
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Calcule le délai avant la tentative suivante
+
+        Args:
+            attempt: Numéro de la tentative qui vient d'échouer (0 = premier appel)
+
+        Returns:
+            Délai en secondes
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker à trois états (closed / open / half-open)
+
+    Après failure_threshold échecs consécutifs, le circuit s'ouvre et les
+    appels échouent immédiatement. Après recovery_timeout, un appel test
+    est autorisé : un succès referme le circuit, un échec le rouvre.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str,
+                 failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = CIRCUIT_RECOVERY_TIMEOUT):
+        """
+        Initialise le circuit
+
+        Args:
+            name: Nom de la famille d'endpoints protégée
+            failure_threshold: Nombre d'échecs consécutifs avant ouverture
+            recovery_timeout: Durée d'ouverture en secondes avant un appel test
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+        self.rejected_count = 0
+
+    @property
+    def state(self) -> str:
+        """État courant du circuit"""
+        with self._lock:
+            self._update_state(time.monotonic())
+            return self._state
+
+    @property
+    def open_until(self) -> float:
+        """
+        Instant (time.monotonic()) où le circuit laissera passer un appel
+
+        Circuit ouvert : fin du délai de récupération. Appel test en cours :
+        dans CIRCUIT_PROBE_POLL secondes, le temps d'en connaître l'issue.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._update_state(now)
+            if self._state == self.OPEN:
+                return self._opened_at + self.recovery_timeout
+            if self._state == self.HALF_OPEN and self._probe_in_flight:
+                return now + min(CIRCUIT_PROBE_POLL, self.recovery_timeout)
+            return now
+
+    def _update_state(self, now: float) -> None:
+        """Passe de open à half-open une fois le délai écoulé (verrou déjà pris)"""
+        if self._state == self.OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        """
+        Indique si un appel peut partir
+
+        Returns:
+            False si le circuit est ouvert (ou si l'appel test est déjà en cours)
+        """
+        with self._lock:
+            self._update_state(time.monotonic())
+
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            self.rejected_count += 1
+            return False
+
+    def record_success(self) -> None:
+        """Signale un appel réussi (referme le circuit)"""
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit {self.name} refermé")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self) -> None:
+        """
+        Libère l'appel test sans verdict (429, clé refusée, budget) : le
+        prochain appel pourra servir de test à sa place
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """Signale un échec (panne réseau ou erreur 5xx)"""
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit {self.name} ouvert après {self._failures} échecs, "
+                                   f"appels suspendus {self.recovery_timeout}s")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        """Retourne l'état du circuit pour les rapports"""
+        return {
+            'state': self.state,
+            'consecutive_failures': self._failures,
+            'rejected': self.rejected_count
+        }
+
+
+class CircuitBreakerRegistry:
+    """Un circuit breaker par famille d'endpoints"""
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = CIRCUIT_RECOVERY_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, family: str) -> CircuitBreaker:
+        """Retourne (en le créant si besoin) le circuit d'une famille d'endpoints"""
+        with self._lock:
+            if family not in self._breakers:
+                self._breakers[family] = CircuitBreaker(
+                    family, self.failure_threshold, self.recovery_timeout)
+            return self._breakers[family]
+
+    def open_families(self) -> List[str]:
+        """Liste des familles dont le circuit n'est pas fermé"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [b.name for b in breakers if b.state != CircuitBreaker.CLOSED]
+
+    def snapshot(self) -> Dict:
+        """Retourne l'état de tous les circuits"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {b.name: b.snapshot() for b in breakers}
+
+
+_shared_registry = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_circuit_breakers() -> CircuitBreakerRegistry:
+    """
+    Retourne le registre de circuits unique du processus
+
+    Returns:
+        Instance partagée de CircuitBreakerRegistry
+    """
+    global _shared_registry
+
+    with _shared_lock:
+        if _shared_registry is None:
+            _shared_registry = CircuitBreakerRegistry()
+        return _shared_registry
@@ -0,0 +1,182 @@
+"""
+Catalogue des segments personnalisés mémorisé avec un TTL
+Évite d'appeler /segment/traffic-and-engagement/describe/ à chaque période
+"""
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+import sys
+import os
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentCatalog:
+    """
+    Liste des segments récupérée une fois par exécution et persistée entre exécutions
+
+    Compare chaque nouvelle version du catalogue à la précédente pour signaler
+    les segments ajoutés ou supprimés.
+    """
+
+    def __init__(self, fetch: Optional[Callable[[], Optional[List[Dict]]]] = None,
+                 user_only: bool = True,
+                 ttl: int = SEGMENT_CATALOG_TTL,
+                 path: str = None):
+        """
+        Initialise le catalogue
+
+        Args:
+            fetch: Fonction qui interroge l'API (ex: api.get_custom_segments)
+            user_only: Catalogue des segments utilisateur uniquement ou de tous les segments
+            ttl: Durée de validité du catalogue en secondes
+            path: Fichier JSON de persistance (dérivé de user_only si absent)
+        """
+        self.fetch = fetch
+        self.user_only = user_only
+        self.ttl = ttl
+        self.path = path or os.path.join(
+            DATA_PATH, f"segment_catalog_{'user' if user_only else 'all'}.json")
+
+        self._segments = None
+        self._fetched_at = None
+        self._lock = threading.Lock()
+        # Un seul describe par expiration : les appelants concurrents attendent le premier
+        self._refresh_lock = threading.Lock()
+
+        self.changes = {'added': [], 'removed': []}
+
+    @property
+    def segments(self) -> Optional[List[Dict]]:
+        """Dernière version connue du catalogue (sans appel API)"""
+        return self._segments
+
+    def _is_fresh(self, fetched_at: Optional[datetime]) -> bool:
+        """Indique si un catalogue récupéré à fetched_at est encore valide"""
+        return fetched_at is not None and datetime.now() - fetched_at < timedelta(seconds=self.ttl)
+
+    def _load(self) -> Optional[Dict]:
+        """Charge le catalogue persisté (None si absent ou illisible)"""
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            data['fetched_at'] = datetime.fromisoformat(data['fetched_at'])
+            return data
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Catalogue de segments illisible ({self.path}): {e}")
+            return None
+
+    def _save(self) -> None:
+        """Persiste le catalogue courant"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'fetched_at': self._fetched_at.isoformat(),
+                'user_only': self.user_only,
+                'segments': self._segments,
+                'changes': self.changes
+            }, f, indent=2, ensure_ascii=False)
+
+    def fresh_segments(self) -> Optional[List[Dict]]:
+        """
+        Retourne le catalogue en mémoire ou persisté s'il est encore valide
+
+        Returns:
+            Liste des segments ou None s'il faut interroger l'API
+        """
+        with self._lock:
+            if self._segments is not None and self._is_fresh(self._fetched_at):
+                return self._segments
+
+            persisted = self._load()
+            if persisted and self._is_fresh(persisted['fetched_at']):
+                self._segments = persisted['segments']
+                self._fetched_at = persisted['fetched_at']
+                logger.info(f"Catalogue de segments chargé depuis {self.path} "
+                            f"({len(self._segments)} segments)")
+                return self._segments
+
+        return None
+
+    def update(self, segments: Optional[List[Dict]]) -> Optional[List[Dict]]:
+        """
+        Enregistre une nouvelle version du catalogue et calcule les changements
+
+        Args:
+            segments: Segments renvoyés par l'API (None en cas d'échec)
+
+        Returns:
+            Catalogue à utiliser (l'ancien en cas d'échec de l'API)
+        """
+        with self._lock:
+            previous = self._load()
+            previous_segments = previous['segments'] if previous else None
+
+            if segments is None:
+                # Mieux vaut un catalogue périmé que pas de catalogue
+                if previous_segments is not None:
+                    logger.warning("API indisponible, utilisation du catalogue de segments périmé")
+                    self._segments = previous_segments
+                    self._fetched_at = previous['fetched_at']
+                return self._segments
+
+            if previous_segments is not None:
+                old_ids = {s.get('segment_id') for s in previous_segments}
+                new_ids = {s.get('segment_id') for s in segments}
+                self.changes = {
+                    'added': [s for s in segments if s.get('segment_id') not in old_ids],
+                    'removed': [s for s in previous_segments if s.get('segment_id') not in new_ids]
+                }
+                for segment in self.changes['added']:
+                    logger.info(f"Nouveau segment: {segment.get('segment_name', 'N/A')}")
+                for segment in self.changes['removed']:
+                    logger.info(f"Segment supprimé: {segment.get('segment_name', 'N/A')}")
+
+            self._segments = segments
+            self._fetched_at = datetime.now()
+            self._save()
+
+            return self._segments
+
+    def get_segments(self, force_refresh: bool = False) -> Optional[List[Dict]]:
+        """
+        Retourne le catalogue, en n'interrogeant l'API que s'il a expiré
+
+        Args:
+            force_refresh: Si True, ignore le TTL et interroge l'API
+
+        Returns:
+            Liste des segments ou None si aucun catalogue n'est disponible
+        """
+        if not force_refresh:
+            segments = self.fresh_segments()
+            if segments is not None:
+                return segments
+
+        with self._refresh_lock:
+            # Un autre appelant a pu rafraîchir le catalogue pendant l'attente du verrou
+            if not force_refresh:
+                segments = self.fresh_segments()
+                if segments is not None:
+                    return segments
+
+            return self.update(self.fetch())
+
+    def summary(self) -> Dict:
+        """Retourne un résumé du catalogue pour les rapports d'exécution"""
+        return {
+            'segments': len(self._segments) if self._segments is not None else 0,
+            'fetched_at': self._fetched_at.isoformat() if self._fetched_at else None,
+            'added': [s.get('segment_id') for s in self.changes['added']],
+            'removed': [s.get('segment_id') for s in self.changes['removed']]
+        }
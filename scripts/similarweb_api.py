@@ -3,16 +3,29 @@ Module principal pour les appels à l'API SimilarWeb
 Basé sur les scripts validés du notebook d'exploration
 """
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import json
 import logging
-from typing import Dict, List, Optional, Any
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import os
 
 # Ajouter le chemin parent pour importer la config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config.config import *
+from scripts.rate_limiter import TokenBucketRateLimiter
+from scripts.api_key_pool import ApiKeyPool, get_shared_api_key_pool
+from scripts.api_metrics import ApiMetrics, get_shared_api_metrics
+from scripts.response_cache import ResponseCache, get_shared_response_cache
+from scripts.segment_catalog import SegmentCatalog
+from scripts.task_scheduler import TaskScheduler
+from scripts.single_flight import SingleFlight, get_shared_single_flight
+from scripts.retry_policy import (RETRYABLE_STATUS_CODES, CircuitBreakerRegistry, CircuitOpenError,
+                                  RetryPolicy, get_shared_circuit_breakers)
+from scripts.quota_ledger import (PRIORITY_NORMAL, QuotaBudgetExceededError, QuotaLedger,
+                                  get_shared_quota_ledger)
 
 # Configuration du logging
 logging.basicConfig(
@@ -22,71 +35,329 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def get_endpoint_family(endpoint: str) -> str:
+    """
+    Regroupe les endpoints par famille (pour les circuits, métriques et quotas)
+    
+    Args:
+        endpoint: Endpoint de l'API (ex: /website/amazon.fr/total-traffic-and-engagement/visits)
+        
+    Returns:
+        Nom de famille: segment_describe, segment_query ou website_<métrique>
+    """
+    parts = [p for p in endpoint.split('/') if p]
+    
+    if parts and parts[0] == 'segment':
+        return 'segment_describe' if 'describe' in parts else 'segment_query'
+    if parts and parts[0] == 'website' and len(parts) >= 3:
+        return 'website_' + parts[-1].replace('-', '_')
+    return 'other'
+
+
+def create_http_session(pool_connections: int = HTTP_POOL_CONNECTIONS,
+                        pool_maxsize: int = HTTP_POOL_MAXSIZE,
+                        pool_block: bool = HTTP_POOL_BLOCK) -> requests.Session:
+    """
+    Crée une session HTTP avec un pool de connexions keep-alive
+    
+    Les connexions TCP/TLS vers api.similarweb.com sont réutilisées d'un appel
+    à l'autre au lieu d'être renégociées à chaque requête.
+    
+    Args:
+        pool_connections: Nombre d'hôtes distincts gardés dans le pool
+        pool_maxsize: Nombre maximum de connexions ouvertes par hôte
+        pool_block: Si True, attend qu'une connexion se libère au lieu d'en ouvrir une de plus
+        
+    Returns:
+        Session requests configurée
+    """
+    session = requests.Session()
+    
+    # Les retries sont gérés par _make_request, pas par urllib3
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+        max_retries=0
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(API_HEADERS)
+    
+    return session
+
+
 class SimilarWebAPI:
     """Classe pour gérer les interactions avec l'API SimilarWeb"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, pool_maxsize: int = None,
+                 rate_limiter: TokenBucketRateLimiter = None,
+                 cache: ResponseCache = None, use_cache: bool = API_CACHE_ENABLED,
+                 single_flight: SingleFlight = None,
+                 retry_policy: RetryPolicy = None,
+                 circuit_breakers: CircuitBreakerRegistry = None,
+                 quota_ledger: QuotaLedger = None,
+                 priority: str = PRIORITY_NORMAL,
+                 key_pool: ApiKeyPool = None,
+                 metrics: ApiMetrics = None,
+                 base_url: str = None):
         """
         Initialise le client API
         
         Args:
-            api_key: Clé API SimilarWeb (utilise la config par défaut si non fournie)
+            api_key: Clé API SimilarWeb (pool SIMILARWEB_API_KEYS partagé si non fournie)
+            pool_maxsize: Connexions keep-alive maximum par hôte (HTTP_POOL_MAXSIZE par défaut)
+            rate_limiter: Limiteur de débit imposé (un limiteur partagé par clé par défaut)
+            cache: Cache des réponses (cache disque partagé par défaut)
+            use_cache: Si False, toutes les requêtes partent vers l'API
+            single_flight: Groupe de déduplication des requêtes en vol (partagé par défaut)
+            retry_policy: Politique de retry (backoff exponentiel + jitter)
+            circuit_breakers: Circuits par famille d'endpoints (registre partagé par défaut)
+            quota_ledger: Registre des appels et du budget mensuel (registre partagé par défaut)
+            priority: Priorité des extractions de ce client (high, normal, low)
+            key_pool: Pool de clés API (remplace api_key et rate_limiter)
+            metrics: Registre des métriques d'appels (registre partagé par défaut)
+            base_url: URL de l'API (SIMILARWEB_BASE_URL par défaut)
         """
-        self.api_key = api_key or SIMILARWEB_API_KEY
-        self.base_url = SIMILARWEB_BASE_URL
+        self.base_url = base_url or SIMILARWEB_BASE_URL
         self.headers = API_HEADERS.copy()
         
-    def _make_request(self, endpoint: str, params: Dict = None, retry_count: int = 0) -> Optional[Dict]:
+        # Session partagée par toutes les méthodes extract_*
+        self.session = create_http_session(pool_maxsize=pool_maxsize or HTTP_POOL_MAXSIZE)
+        
+        # Cache disque des réponses (None si désactivé)
+        self.cache = (cache or get_shared_response_cache()) if use_cache else None
+        
+        # Requêtes identiques simultanées fusionnées en un seul appel, entre toutes les instances
+        self.single_flight = single_flight or get_shared_single_flight()
+        
+        # Retry avec backoff et circuits par famille d'endpoints
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breakers = circuit_breakers or get_shared_circuit_breakers()
+        
+        # Chaque appel est journalisé ; le budget est vérifié avant chaque appel réseau
+        self.quota_ledger = quota_ledger or get_shared_quota_ledger()
+        self.priority = priority
+        
+        # Appels répartis sur les clés API, chaque clé ayant son propre limiteur partagé
+        if key_pool is None:
+            if api_key or rate_limiter or quota_ledger:
+                key_pool = ApiKeyPool([api_key] if api_key else None,
+                                      quota_ledger=self.quota_ledger, rate_limiter=rate_limiter)
+            else:
+                key_pool = get_shared_api_key_pool()
+        self.key_pool = key_pool
+        self.api_key = key_pool.keys[0].api_key
+        self.rate_limiter = key_pool.keys[0].rate_limiter
+        
+        # Latences, volumes, retries et attentes par famille d'endpoints
+        self.metrics = metrics or get_shared_api_metrics()
+        
+        # Catalogues de segments mémorisés (clé: user_only)
+        self._segment_catalogs = {}
+    
+    def close(self) -> None:
+        """Ferme la session HTTP, libère les connexions du pool et écrit le registre des appels"""
+        self.session.close()
+        self.quota_ledger.flush()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def is_cached(self, endpoint: str, params: Dict) -> bool:
+        """Indique si la requête serait servie par le cache (False si désactivé)"""
+        return self.cache is not None and self.cache.contains(endpoint, params, self.base_url)
+    
+    def cache_stats(self) -> Dict:
+        """Retourne les compteurs hit/miss du cache (vide si désactivé)"""
+        return self.cache.stats() if self.cache is not None else {}
+    
+    def quota_summary(self) -> Dict:
+        """Retourne la consommation du quota sur le mois courant et l'état des clés"""
+        summary = self.quota_ledger.summary()
+        summary['keys'] = self.key_pool.snapshot()
+        return summary
+    
+    def report_metrics(self) -> Dict:
+        """
+        Retourne les métriques d'appels pour les résumés d'exécution
+        et les exporte au format Prometheus si API_METRICS_PROMETHEUS_PATH est défini
         """
-        Effectue une requête à l'API avec gestion des erreurs et retry
+        if API_METRICS_PROMETHEUS_PATH:
+            try:
+                self.metrics.write_prometheus(API_METRICS_PROMETHEUS_PATH)
+            except OSError as e:
+                logger.warning(f"Export Prometheus impossible: {e}")
+        return self.metrics.snapshot()
+        
+    def _make_request(self, endpoint: str, params: Dict = None) -> Optional[Dict]:
+        """
+        Effectue une requête à l'API (cache, puis déduplication des appels en vol)
         
         Args:
             endpoint: Endpoint de l'API (sans le base_url)
             params: Paramètres de la requête
-            retry_count: Nombre de tentatives déjà effectuées
             
         Returns:
-            Réponse JSON ou None en cas d'erreur
+            Réponse JSON ou None en cas d'erreur. Les appelants simultanés d'une
+            même requête reçoivent le même objet : il ne doit pas être modifié.
+            
+        Raises:
+            QuotaBudgetExceededError: si le budget mensuel est épuisé pour cette priorité
+            CircuitOpenError: si le circuit de la famille d'endpoints est ouvert
         """
-        if params is None:
-            params = {}
+        params = dict(params or {})
         
-        # Ajouter la clé API aux paramètres
-        params['api_key'] = self.api_key
+        # Servir depuis le cache disque si la réponse est déjà connue
+        if self.cache is not None:
+            cached = self.cache.get(endpoint, params, self.base_url)
+            if cached is not None:
+                logger.info(f"Cache API: {endpoint}")
+                family = get_endpoint_family(endpoint)
+                self.quota_ledger.record(endpoint, family, 200, cached=True, priority=self.priority)
+                self.metrics.record_cache_hit(family)
+                return cached
         
+        key = ResponseCache.make_key(endpoint, params, self.base_url)
+        # Un budget refusé à la priorité du premier appelant ne vaut pas pour les autres
+        return self.single_flight.do(key, lambda: self._fetch(endpoint, params),
+                                     retry_on=(QuotaBudgetExceededError,))
+    
+    def _fetch(self, endpoint: str, params: Dict) -> Optional[Dict]:
+        """
+        Effectue l'appel réseau avec retry (backoff exponentiel + jitter) et circuit breaker
+        
+        Les 429 sont absorbés par le rate limiter, les pannes réseau et 5xx sont
+        retentées, les autres erreurs HTTP échouent immédiatement. Si le circuit
+        de la famille d'endpoints est ouvert, l'appel est refusé sans toucher l'API
+        (CircuitOpenError) : l'ordonnanceur le remet en file jusqu'à sa réouverture.
+        
+        Args:
+            endpoint: Endpoint de l'API (sans le base_url)
+            params: Paramètres de la requête
+            
+        Returns:
+            Réponse JSON ou None en cas d'erreur
+            
+        Raises:
+            QuotaBudgetExceededError: si le budget mensuel est épuisé pour cette priorité
+            CircuitOpenError: si le circuit de la famille d'endpoints est ouvert
+        """
         # Construire l'URL complète
         url = f"{self.base_url}{endpoint}"
         
-        try:
-            logger.info(f"Appel API: {endpoint}")
-            response = requests.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
+        family = get_endpoint_family(endpoint)
+        breaker = self.circuit_breakers.get(family)
+        max_retries = self.retry_policy.max_retries
+        
+        for attempt in range(max_retries + 1):
+            if attempt:
+                self.metrics.record_retry(family)
+            
+            # Budget vérifié avant le circuit : un refus ne retient pas l'appel test
+            self.quota_ledger.check_budget(1, self.priority)
             
-            # Respecter le rate limit
-            time.sleep(API_RATE_LIMIT_DELAY)
+            if not breaker.allow_request():
+                logger.warning(f"Circuit {family} ouvert, appel reporté: {endpoint}")
+                raise CircuitOpenError(family, breaker.open_until)
             
-            return response.json()
+            # Choisir une clé et respecter son rate limit (attend un jeton de son token bucket)
+            try:
+                key, wait = self.key_pool.reserve()
+            except QuotaBudgetExceededError:
+                breaker.release_probe()
+                raise
+            if wait > 0:
+                time.sleep(wait)
+                self.metrics.record_sleep(family, wait)
+            params['api_key'] = key.api_key
             
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 429:  # Rate limit
-                logger.warning(f"Rate limit atteint, attente de {RETRY_DELAY * 2} secondes...")
-                time.sleep(RETRY_DELAY * 2)
+            started = time.monotonic()
+            try:
+                logger.info(f"Appel API: {endpoint}")
+                response = self.session.get(url, headers=self.headers, params=params,
+                                            timeout=API_REQUEST_TIMEOUT)
+            except requests.exceptions.RequestException as e:
+                self.metrics.record_call(family, time.monotonic() - started)
+                self.quota_ledger.record(endpoint, family, None, priority=self.priority,
+                                         api_key_id=key.key_id)
+                breaker.record_failure()
+                logger.error(f"Erreur de requête: {e}")
                 
-                if retry_count < MAX_RETRIES:
-                    return self._make_request(endpoint, params, retry_count + 1)
-                    
-            logger.error(f"Erreur HTTP {e.response.status_code}: {e}")
-            return None
+                if attempt < max_retries:
+                    delay = self.retry_policy.backoff(attempt)
+                    logger.info(f"Nouvelle tentative ({attempt + 1}/{max_retries}) dans {delay:.1f}s...")
+                    time.sleep(delay)
+                    self.metrics.record_sleep(family, delay)
+                    continue
+                return None
+            
+            # elapsed s'arrête à la réception des headers : c'est le time-to-first-byte
+            self.metrics.record_call(family, time.monotonic() - started,
+                                     ttfb=response.elapsed.total_seconds(),
+                                     bytes_received=len(response.content),
+                                     status=response.status_code)
+            
+            cost = API_CALL_COST if response.status_code < 400 else 0
+            self.quota_ledger.record(
+                endpoint, family, response.status_code, len(response.content),
+                cost=cost, priority=self.priority, api_key_id=key.key_id
+            )
+            self.key_pool.record_cost(key, cost)
+            
+            if response.status_code == 429:  # Rate limit
+                # Le limiteur de cette clé bloque ses prochains appels jusqu'au Retry-After
+                delay = self.key_pool.on_rate_limited(key, response.headers)
+                self.metrics.record_rate_limited(family)
+                breaker.release_probe()
+                logger.warning(f"Rate limit atteint (clé {key.key_id}), reprise dans {delay:.1f} secondes...")
+                continue
             
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Erreur de requête: {e}")
+            if response.status_code == 401:
+                # Clé refusée : l'appel repart sur une autre clé s'il en reste
+                if self.key_pool.disable(key, 'clé refusée (HTTP 401)'):
+                    breaker.release_probe()
+                    continue
             
-            if retry_count < MAX_RETRIES:
-                logger.info(f"Nouvelle tentative ({retry_count + 1}/{MAX_RETRIES})...")
-                time.sleep(RETRY_DELAY)
-                return self._make_request(endpoint, params, retry_count + 1)
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                breaker.record_failure()
+                logger.error(f"Erreur HTTP {response.status_code} sur {endpoint}")
                 
-            return None
+                if attempt < max_retries:
+                    delay = self.retry_policy.backoff(attempt)
+                    logger.info(f"Nouvelle tentative ({attempt + 1}/{max_retries}) dans {delay:.1f}s...")
+                    time.sleep(delay)
+                    self.metrics.record_sleep(family, delay)
+                    continue
+                return None
+            
+            # Le serveur a répondu : le circuit peut rester fermé
+            breaker.record_success()
+            
+            if response.status_code >= 400:
+                logger.error(f"Erreur HTTP {response.status_code} sur {endpoint}: {response.text[:200]}")
+                return None
+            
+            key.rate_limiter.on_success(response.headers)
+            
+            parse_started = time.monotonic()
+            try:
+                payload = response.json()
+            except ValueError as e:
+                logger.error(f"Réponse JSON invalide pour {endpoint}: {e}")
+                return None
+            self.metrics.record_parse(family, time.monotonic() - parse_started)
+            
+            if self.cache is not None:
+                self.cache.set(endpoint, params, payload, self.base_url)
+            
+            return payload
+        
+        logger.error(f"Abandon après {max_retries + 1} tentatives: {endpoint}")
+        return None
     
     def get_custom_segments(self, user_only: bool = True) -> Optional[List[Dict]]:
         """
@@ -105,7 +376,11 @@ class SimilarWebAPI:
         if user_only:
             params['userOnlySegments'] = 'true'
         
-        response = self._make_request('/segment/traffic-and-engagement/describe/', params)
+        try:
+            response = self._make_request('/segment/traffic-and-engagement/describe/', params)
+        except CircuitOpenError as e:
+            logger.warning(f"{e}: describe non disponible")
+            response = None
         
         if response and 'response' in response:
             segments = response['response'].get('segments', [])
@@ -115,51 +390,129 @@ class SimilarWebAPI:
             logger.error("Impossible de récupérer les segments")
             return None
     
+    def get_segment_catalog(self, user_only: bool = True) -> SegmentCatalog:
+        """
+        Retourne le catalogue de segments mémorisé de ce client
+        
+        Args:
+            user_only: Si True, catalogue des segments créés par l'utilisateur
+            
+        Returns:
+            Catalogue partagé par toutes les extractions du client
+        """
+        if user_only not in self._segment_catalogs:
+            self._segment_catalogs[user_only] = SegmentCatalog(
+                fetch=lambda: self.get_custom_segments(user_only=user_only),
+                user_only=user_only
+            )
+        return self._segment_catalogs[user_only]
+    
     def get_segment_data(self, segment_id: str, start_date: str, end_date: str, 
                         country: str = DEFAULT_COUNTRY, 
-                        granularity: str = DEFAULT_GRANULARITY) -> Optional[Dict]:
+                        granularity: str = DEFAULT_GRANULARITY,
+                        parallel_groups: bool = True) -> Optional[Dict]:
         """
         Récupère les données de trafic pour un segment spécifique
-        Fait plusieurs appels pour récupérer toutes les métriques + confidence
+        Fait un appel par groupe de métriques (en parallèle) puis joint les points par date
+        
+        Args:
+            segment_id: Identifiant du segment
+            start_date: Date de début
+            end_date: Date de fin
+            country: Code pays
+            granularity: Granularité demandée à l'API
+            parallel_groups: Si False, les groupes sont récupérés l'un après l'autre
+            
+        Returns:
+            Données combinées ou None si aucun groupe n'a répondu
         """
-        from config.config import SEGMENT_METRICS_GROUPS
+        # Hors ordonnanceur, un groupe dont le circuit est ouvert compte comme un échec
+        def fetch_group(metrics_group: str) -> Optional[Dict]:
+            try:
+                return self._fetch_segment_group(segment_id, metrics_group, start_date, end_date,
+                                                 country, granularity)
+            except CircuitOpenError as e:
+                logger.warning(f"{e}: groupe {metrics_group} ignoré pour {segment_id}")
+                return None
         
-        combined_data = None
-        all_segments_data = []
+        if not parallel_groups or len(SEGMENT_METRICS_GROUPS) < 2:
+            group_results = [fetch_group(metrics_group) for metrics_group in SEGMENT_METRICS_GROUPS]
+            return self._combine_segment_groups(group_results)
         
-        # Faire un appel pour chaque groupe de métriques
-        for metrics_group in SEGMENT_METRICS_GROUPS:
-            params = {
-                'start_date': start_date,
-                'end_date': end_date,
-                'country': country,
-                'granularity': granularity,
-                'metrics': metrics_group
-            }
-            
-            endpoint = f'/segment/{segment_id}/total-traffic-and-engagement/query'
-            result = self._make_request(endpoint, params)
+        # Latence d'un segment ~ l'appel le plus lent, le débit reste piloté par le rate limiter
+        with ThreadPoolExecutor(max_workers=len(SEGMENT_METRICS_GROUPS)) as executor:
+            futures = [executor.submit(fetch_group, metrics_group)
+                       for metrics_group in SEGMENT_METRICS_GROUPS]
+            group_results = [future.result() for future in futures]
+        
+        return self._combine_segment_groups(group_results)
+    
+    def _fetch_segment_group(self, segment_id: str, metrics_group: str,
+                             start_date: str, end_date: str,
+                             country: str = DEFAULT_COUNTRY,
+                             granularity: str = DEFAULT_GRANULARITY) -> Optional[Dict]:
+        """
+        Récupère un groupe de métriques (un appel API) pour un segment
+        
+        Returns:
+            Réponse JSON brute ou None en cas d'erreur
             
-            if result and 'segments' in result:
-                all_segments_data.append(result['segments'][0])
+        Raises:
+            CircuitOpenError: si le circuit des requêtes segment est ouvert
+        """
+        return self._make_request(*self.segment_group_request(
+            segment_id, metrics_group, start_date, end_date, country, granularity))
+    
+    @staticmethod
+    def segment_group_request(segment_id: str, metrics_group: str,
+                              start_date: str, end_date: str,
+                              country: str = DEFAULT_COUNTRY,
+                              granularity: str = DEFAULT_GRANULARITY) -> Tuple[str, Dict]:
+        """Endpoint et paramètres de l'appel d'un groupe de métriques d'un segment"""
+        params = {
+            'start_date': start_date,
+            'end_date': end_date,
+            'country': country,
+            'granularity': granularity,
+            'metrics': metrics_group
+        }
+        
+        return f'/segment/{segment_id}/total-traffic-and-engagement/query', params
+    
+    @staticmethod
+    def _combine_segment_groups(group_results: List[Optional[Dict]]) -> Optional[Dict]:
+        """
+        Combine les réponses des différents groupes de métriques d'un segment
         
-        # Combiner toutes les métriques
-        if all_segments_data:
-            # Prendre le premier résultat comme base
-            combined_segment = all_segments_data[0].copy()
+        Args:
+            group_results: Réponses brutes, une par groupe (None si échec)
             
-            # Ajouter les métriques des autres appels
-            for segment_data in all_segments_data[1:]:
-                for key, value in segment_data.items():
-                    if key not in combined_segment:
-                        combined_segment[key] = value
+        Returns:
+            Données combinées au format {'meta': ..., 'segments': [...]} ou None
+        """
+        points_by_date = {}
+        
+        # Joindre les points de chaque groupe par date (un point par jour/mois)
+        for result in group_results:
+            if not result or not result.get('segments'):
+                continue
             
-            combined_data = {
-                'meta': {},
-                'segments': [combined_segment]
-            }
+            for point in result['segments']:
+                if not isinstance(point, dict):
+                    continue
+                
+                combined_point = points_by_date.setdefault(point.get('date'), {})
+                for key, value in point.items():
+                    if combined_point.get(key) is None:
+                        combined_point[key] = value
         
-        return combined_data
+        if not points_by_date:
+            return None
+        
+        return {
+            'meta': {},
+            'segments': [points_by_date[d] for d in sorted(points_by_date, key=lambda d: str(d or ''))]
+        }
     
     def get_website_metric(self, domain: str, metric_endpoint: str, 
                           start_date: str, end_date: str,
@@ -178,7 +531,19 @@ class SimilarWebAPI:
             
         Returns:
             Données de la métrique ou None en cas d'erreur
+            
+        Raises:
+            CircuitOpenError: si le circuit des endpoints website est ouvert
         """
+        return self._make_request(*self.website_metric_request(
+            domain, metric_endpoint, start_date, end_date, country, granularity))
+    
+    @staticmethod
+    def website_metric_request(domain: str, metric_endpoint: str,
+                               start_date: str, end_date: str,
+                               country: str = DEFAULT_COUNTRY,
+                               granularity: str = DEFAULT_GRANULARITY) -> Tuple[str, Dict]:
+        """Endpoint et paramètres de l'appel d'une métrique d'un site web"""
         params = {
             'start_date': start_date,
             'end_date': end_date,
@@ -188,11 +553,12 @@ class SimilarWebAPI:
             'format': 'json'
         }
         
-        endpoint = f'/website/{domain}{metric_endpoint}'
-        return self._make_request(endpoint, params)
+        return f'/website/{domain}{metric_endpoint}', params
     
     def extract_all_segments(self, start_date: str, end_date: str, 
-                           limit: int = None, user_only: bool = True) -> List[Dict]:
+                           limit: int = None, user_only: bool = True,
+                           max_workers: int = 1,
+                           granularity: str = DEFAULT_GRANULARITY) -> List[Dict]:
         """
         Extrait les données pour tous les segments personnalisés
         
@@ -201,52 +567,147 @@ class SimilarWebAPI:
             end_date: Date de fin (format YYYY-MM)
             limit: Nombre maximum de segments à traiter (None = tous)
             user_only: Si True, récupère uniquement les segments créés par l'utilisateur
+            max_workers: Nombre d'appels simultanés (1 = extraction séquentielle)
+            granularity: Granularité demandée à l'API
             
         Returns:
-            Liste des résultats pour chaque segment
+            Liste des résultats pour chaque segment, dans l'ordre du catalogue
         """
-        results = []
-        
-        # Récupérer la liste des segments
-        segments = self.get_custom_segments(user_only=user_only)
+        # Récupérer la liste des segments (catalogue mémorisé, un seul describe par exécution)
+        segments = self.get_segment_catalog(user_only).get_segments()
         if not segments:
-            return results
+            return []
         
         # Limiter si demandé
         if limit:
             segments = segments[:limit]
         
+        return self.extract_segments(segments, start_date, end_date, max_workers, granularity)
+    
+    def extract_segments(self, segments: List[Dict], start_date: str, end_date: str,
+                         max_workers: int = 1,
+                         granularity: str = DEFAULT_GRANULARITY) -> List[Dict]:
+        """
+        Extrait les données d'une liste de segments du catalogue
+        
+        Args:
+            segments: Segments à extraire (entrées du catalogue)
+            start_date: Date de début
+            end_date: Date de fin
+            max_workers: Nombre d'appels simultanés (1 = extraction séquentielle)
+            granularity: Granularité demandée à l'API
+            
+        Returns:
+            Liste des résultats dans le même ordre que segments
+        """
+        results = []
+        
         logger.info(f"Extraction de {len(segments)} segments...")
         
+        if max_workers and max_workers > 1:
+            return self._extract_segments_concurrently(segments, start_date, end_date,
+                                                       max_workers, granularity)
+        
         for i, segment in enumerate(segments):
-            segment_id = segment.get('segment_id')
-            segment_name = segment.get('segment_name', 'N/A')
+            logger.info(f"Extraction {i+1}/{len(segments)}: {segment.get('segment_name', 'N/A')}")
             
-            logger.info(f"Extraction {i+1}/{len(segments)}: {segment_name}")
+            data = self.get_segment_data(segment.get('segment_id'), start_date, end_date,
+                                         granularity=granularity)
+            results.append(self._build_segment_result(segment, data))
+        
+        return results
+    
+    def _extract_segments_concurrently(self, segments: List[Dict], start_date: str,
+                                       end_date: str, max_workers: int,
+                                       granularity: str = DEFAULT_GRANULARITY) -> List[Dict]:
+        """
+        Extrait les segments via l'ordonnanceur (pool de threads borné)
+        
+        Returns:
+            Liste des résultats dans le même ordre que segments
+        """
+        logger.info(f"Mode concurrent: {max_workers} workers, "
+                    f"{len(segments) * len(SEGMENT_METRICS_GROUPS)} appels")
+        
+        scheduler = TaskScheduler(max_workers)
+        key = self.schedule_segments(scheduler, segments, start_date, end_date, granularity)
+        return scheduler.run()[key]
+    
+    def schedule_segments(self, scheduler: TaskScheduler, segments: List[Dict],
+                          start_date: str, end_date: str,
+                          granularity: str = DEFAULT_GRANULARITY,
+                          priority: str = None, deadline: float = None,
+                          on_done: Callable[[List[Dict]], None] = None) -> Hashable:
+        """
+        Ajoute à l'ordonnanceur une tâche par couple (segment, groupe de métriques)
+        
+        Args:
+            scheduler: Ordonnanceur partagé par toute l'exécution
+            segments: Segments à extraire (entrées du catalogue)
+            start_date: Date de début
+            end_date: Date de fin
+            granularity: Granularité demandée à l'API
+            priority: Priorité des tâches (celle du client si absente)
+            deadline: Échéance (time.time()) des tâches
+            on_done: Appelé avec les enregistrements quand tous les segments sont extraits
             
-            data = self.get_segment_data(segment_id, start_date, end_date)
+        Returns:
+            Clé du groupe dans le résultat de scheduler.run()
+        """
+        def build(segment: Dict, payloads: Dict) -> Dict:
+            data = self._combine_segment_groups([payloads[g] for g in SEGMENT_METRICS_GROUPS])
+            result = self._build_segment_result(segment, data)
+            # Groupes qui ont renvoyé des points : les autres sont à redemander
+            result['metric_groups_succeeded'] = [
+                g for g in SEGMENT_METRICS_GROUPS if payloads[g] and payloads[g].get('segments')]
+            return result
+        
+        return scheduler.add_job(
+            'segment', f"{start_date} to {end_date}", segments, SEGMENT_METRICS_GROUPS,
+            fetch=lambda segment, group: self._fetch_segment_group(
+                segment.get('segment_id'), group, start_date, end_date, granularity=granularity),
+            build=build,
+            entity_id=lambda segment: segment.get('segment_id'),
+            priority=priority or self.priority,
+            deadline=deadline,
+            on_done=on_done
+        )
+    
+    @staticmethod
+    def _build_segment_result(segment: Dict, data: Optional[Dict]) -> Dict:
+        """
+        Construit l'enregistrement de sortie d'un segment
+        
+        Args:
+            segment: Segment issu du catalogue
+            data: Données combinées ou None en cas d'échec
             
-            if data:
-                logger.info(f"Données récupérées pour {segment_name}")
-                results.append({
-                    'segment_id': segment_id,
-                    'segment_name': segment_name,
-                    'data': data,
-                    'extraction_date': get_current_date()
-                })
-            else:
-                logger.error(f"Échec pour {segment_name}")
-                results.append({
-                    'segment_id': segment_id,
-                    'segment_name': segment_name,
-                    'data': None,
-                    'error': True,
-                    'extraction_date': get_current_date()
-                })
+        Returns:
+            Enregistrement avec le flag 'error' si aucune donnée
+        """
+        segment_id = segment.get('segment_id')
+        segment_name = segment.get('segment_name', 'N/A')
         
-        return results
+        if data:
+            logger.info(f"Données récupérées pour {segment_name}")
+            return {
+                'segment_id': segment_id,
+                'segment_name': segment_name,
+                'data': data,
+                'extraction_date': get_current_date()
+            }
+        
+        logger.error(f"Échec pour {segment_name}")
+        return {
+            'segment_id': segment_id,
+            'segment_name': segment_name,
+            'data': None,
+            'error': True,
+            'extraction_date': get_current_date()
+        }
     
-    def extract_website_data(self, domain: str, start_date: str, end_date: str) -> Dict:
+    def extract_website_data(self, domain: str, start_date: str, end_date: str,
+                             granularity: str = DEFAULT_GRANULARITY) -> Dict:
         """
         Extrait toutes les métriques pour un site web
         
@@ -254,12 +715,41 @@ class SimilarWebAPI:
             domain: Domaine à analyser
             start_date: Date de début (format YYYY-MM)
             end_date: Date de fin (format YYYY-MM)
+            granularity: Granularité demandée à l'API
             
         Returns:
             Dictionnaire avec toutes les métriques du site
         """
         logger.info(f"Extraction pour {domain}")
         
+        payloads = {}
+        for metric_name, endpoint in WEBSITE_METRICS_ENDPOINTS.items():
+            logger.info(f"Extraction {metric_name}...")
+            
+            try:
+                payloads[metric_name] = self.get_website_metric(domain, endpoint, start_date, end_date,
+                                                                granularity=granularity)
+            except CircuitOpenError as e:
+                logger.warning(f"{e}: {metric_name} ignoré pour {domain}")
+                payloads[metric_name] = None
+        
+        return self._build_website_result(domain, start_date, end_date, payloads)
+    
+    @staticmethod
+    def _build_website_result(domain: str, start_date: str, end_date: str,
+                              payloads: Dict[str, Optional[Dict]]) -> Dict:
+        """
+        Construit l'enregistrement de sortie d'un site web
+        
+        Args:
+            domain: Domaine analysé
+            start_date: Date de début
+            end_date: Date de fin
+            payloads: Réponse de chaque métrique (None si échec), dans l'ordre des endpoints
+            
+        Returns:
+            Enregistrement avec le dict 'metrics' et le nombre d'endpoints réussis
+        """
         domain_results = {
             'domain': domain,
             'period': f"{start_date} to {end_date}",
@@ -267,21 +757,22 @@ class SimilarWebAPI:
             'metrics': {}
         }
         
-        for metric_name, endpoint in WEBSITE_METRICS_ENDPOINTS.items():
-            logger.info(f"Extraction {metric_name}...")
-            
-            data = self.get_website_metric(domain, endpoint, start_date, end_date)
-            
+        for metric_name, data in payloads.items():
             if data:
                 logger.info(f"    {metric_name} récupéré")
                 domain_results['metrics'][metric_name] = data
             else:
-                logger.error(f"    Échec {metric_name}")
+                logger.error(f"    Échec {metric_name} pour {domain}")
                 domain_results['metrics'][metric_name] = None
         
+        domain_results['endpoints_succeeded'] = sum(1 for data in payloads.values() if data)
+        domain_results['endpoints_total'] = len(payloads)
+        
         return domain_results
     
-    def extract_all_websites(self, domains: List[str], start_date: str, end_date: str) -> List[Dict]:
+    def extract_all_websites(self, domains: List[str], start_date: str, end_date: str,
+                             granularity: str = DEFAULT_GRANULARITY,
+                             max_workers: int = 1) -> List[Dict]:
         """
         Extrait les données pour plusieurs sites web
         
@@ -289,19 +780,78 @@ class SimilarWebAPI:
             domains: Liste des domaines à analyser
             start_date: Date de début (format YYYY-MM)
             end_date: Date de fin (format YYYY-MM)
+            granularity: Granularité demandée à l'API
+            max_workers: Nombre d'appels simultanés (1 = extraction séquentielle)
             
         Returns:
-            Liste des résultats pour chaque domaine
+            Liste des résultats pour chaque domaine, dans l'ordre de domains
         """
         results = []
         
         logger.info(f"Extraction de {len(domains)} sites web...")
         
+        if max_workers and max_workers > 1:
+            return self._extract_websites_concurrently(domains, start_date, end_date,
+                                                       max_workers, granularity)
+        
         for domain in domains:
-            result = self.extract_website_data(domain, start_date, end_date)
+            result = self.extract_website_data(domain, start_date, end_date, granularity)
             results.append(result)
         
         return results
+    
+    def _extract_websites_concurrently(self, domains: List[str], start_date: str,
+                                       end_date: str, max_workers: int,
+                                       granularity: str = DEFAULT_GRANULARITY) -> List[Dict]:
+        """
+        Extrait les sites web via l'ordonnanceur (pool de threads borné)
+        
+        Returns:
+            Liste des résultats dans le même ordre que domains
+        """
+        logger.info(f"Mode concurrent: {max_workers} workers, "
+                    f"{len(domains) * len(WEBSITE_METRICS_ENDPOINTS)} appels")
+        
+        scheduler = TaskScheduler(max_workers)
+        key = self.schedule_websites(scheduler, domains, start_date, end_date, granularity)
+        return scheduler.run()[key]
+    
+    def schedule_websites(self, scheduler: TaskScheduler, domains: List[str],
+                          start_date: str, end_date: str,
+                          granularity: str = DEFAULT_GRANULARITY,
+                          priority: str = None, deadline: float = None,
+                          on_done: Callable[[List[Dict]], None] = None) -> Hashable:
+        """
+        Ajoute à l'ordonnanceur une tâche par couple (domaine, endpoint)
+        
+        Args:
+            scheduler: Ordonnanceur partagé par toute l'exécution
+            domains: Domaines à extraire
+            start_date: Date de début
+            end_date: Date de fin
+            granularity: Granularité demandée à l'API
+            priority: Priorité des tâches (celle du client si absente)
+            deadline: Échéance (time.time()) des tâches
+            on_done: Appelé avec les enregistrements quand tous les domaines sont extraits
+            
+        Returns:
+            Clé du groupe dans le résultat de scheduler.run()
+        """
+        def build(domain: str, payloads: Dict) -> Dict:
+            result = self._build_website_result(domain, start_date, end_date, payloads)
+            logger.info(f"{domain}: {result['endpoints_succeeded']}/{result['endpoints_total']} endpoints")
+            return result
+        
+        return scheduler.add_job(
+            'website', f"{start_date} to {end_date}", domains, list(WEBSITE_METRICS_ENDPOINTS),
+            fetch=lambda domain, metric_name: self.get_website_metric(
+                domain, WEBSITE_METRICS_ENDPOINTS[metric_name], start_date, end_date,
+                granularity=granularity),
+            build=build,
+            priority=priority or self.priority,
+            deadline=deadline,
+            on_done=on_done
+        )
 
 
 def save_results_to_json(data: Any, filename: str) -> None:
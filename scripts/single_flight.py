@@ -0,0 +1,110 @@
+"""
+Déduplication des requêtes identiques en vol (single-flight)
+Des appelants concurrents qui demandent la même chose partagent un seul appel API
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """Appel en cours partagé par plusieurs appelants"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Regroupe les appels concurrents portant sur la même clé
+
+    Le premier appelant exécute la fonction ; les suivants attendent et
+    reçoivent le même résultat (ou la même exception). Une exception propre
+    à l'appelant (retry_on, ex. budget refusé à sa priorité) n'est pas
+    propagée : chaque appelant en attente relance alors sa propre fonction.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.shared_count = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any],
+           retry_on: Tuple[Type[BaseException], ...] = ()) -> Any:
+        """
+        Exécute fn une seule fois pour tous les appelants simultanés de key
+
+        Args:
+            key: Identifiant de la requête
+            fn: Fonction de cet appelant
+            retry_on: Exceptions du premier appelant qui ne valent pas pour les
+                autres : ils réessaient alors avec leur propre fn
+
+        Returns:
+            Résultat de fn
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None:
+                    call.waiters += 1
+                    self.shared_count += 1
+                    leader = False
+                else:
+                    call = _Call()
+                    self._calls[key] = call
+                    leader = True
+
+            if leader:
+                break
+
+            call.done.wait()
+            if call.error is None:
+                return call.result
+            if not isinstance(call.error, retry_on):
+                raise call.error
+            logger.debug(f"Échec propre au premier appelant ({call.error!r}), nouvel essai: {key}")
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def stats(self) -> Dict:
+        """Retourne le nombre d'appels économisés et en cours"""
+        with self._lock:
+            return {
+                'shared': self.shared_count,
+                'in_flight': len(self._calls)
+            }
+
+
+_shared_single_flight = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_single_flight() -> SingleFlight:
+    """
+    Retourne le groupe single-flight unique du processus
+
+    Returns:
+        Instance partagée de SingleFlight
+    """
+    global _shared_single_flight
+
+    with _shared_lock:
+        if _shared_single_flight is None:
+            _shared_single_flight = SingleFlight()
+        return _shared_single_flight
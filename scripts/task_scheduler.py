@@ -0,0 +1,330 @@
+"""
+Ordonnanceur global des appels d'extraction
+Toutes les extractions sont aplaties en tâches (entité, période, endpoint) exécutées
+par priorité puis échéance ; seul le rate limiter du client rythme les appels
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+import sys
+import os
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+from scripts.quota_ledger import (PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL,
+                                  QuotaBudgetExceededError)
+from scripts.retry_policy import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Ordre de passage des priorités (plus petit = servi en premier)
+PRIORITY_RANK = {PRIORITY_HIGH: 0, PRIORITY_NORMAL: 1, PRIORITY_LOW: 2}
+
+
+class ExtractionTask:
+    """Un appel API : un endpoint d'une entité pour une période"""
+
+    __slots__ = ('job', 'entity', 'unit', 'call', 'priority', 'deadline', 'order', 'deferred_since')
+
+    def __init__(self, job: 'ExtractionJob', entity: str, unit: str,
+                 call: Callable[[], Any], priority: str, deadline: Optional[float]):
+        self.job = job
+        self.entity = entity
+        self.unit = unit
+        self.call = call
+        self.priority = priority
+        self.deadline = deadline
+        # Rang dans la file, et début du report si le circuit de l'endpoint était ouvert
+        self.order = None
+        self.deferred_since: Optional[float] = None
+
+    @property
+    def period(self) -> str:
+        return self.job.period
+
+
+class ExtractionJob:
+    """
+    Groupe de tâches d'un même type et d'une même période
+
+    Quand la dernière tâche est terminée, build() assemble un enregistrement par
+    entité (dans l'ordre d'origine) et on_done() reçoit la liste (sinon elle est
+    conservée pour le résultat de TaskScheduler.run()).
+    """
+
+    def __init__(self, key: Hashable, kind: str, period: str, entities: Sequence[Any],
+                 entity_id: Callable[[Any], str], units: Sequence[str],
+                 build: Callable[[Any, Dict[str, Any]], Dict],
+                 on_done: Callable[[List[Dict]], None] = None):
+        self.key = key
+        self.kind = kind
+        self.period = period
+        self.entities = list(entities)
+        self.entity_id = entity_id
+        self.units = list(units)
+        self.build = build
+        self.on_done = on_done
+        self.payloads: Dict[str, Dict[str, Any]] = {entity_id(e): {} for e in self.entities}
+        self.remaining = len(self.entities) * len(self.units)
+        self.results: Optional[List[Dict]] = None
+
+
+class TaskScheduler:
+    """
+    File de priorité unique pour toutes les tâches d'extraction
+
+    - les tâches sont servies par priorité (high, normal, low), puis par
+      échéance la plus proche, puis dans l'ordre d'ajout
+    - max_workers threads consomment la file ; aucune pause fixe : un appel
+      n'attend que le jeton du rate limiter (via le pool de clés du client)
+    - une tâche dont l'échéance est dépassée avant son lancement est abandonnée
+      (payload None) pour laisser l'exécution se terminer à temps
+    - une tâche refusée par un circuit ouvert (CircuitOpenError) est remise en
+      file jusqu'à la réouverture du circuit ; elle échoue si le circuit reste
+      ouvert plus de max_defer secondes ou au-delà de son échéance
+    - QuotaBudgetExceededError (ou une erreur de on_done) arrête la file et est
+      relevée par run() une fois les appels en cours terminés
+    """
+
+    def __init__(self, max_workers: int = EXTRACTION_MAX_WORKERS,
+                 max_defer: float = CIRCUIT_REQUEUE_MAX_WAIT):
+        """
+        Initialise l'ordonnanceur
+
+        Args:
+            max_workers: Nombre d'appels simultanés (1 = séquentiel dans l'ordre de la file)
+            max_defer: Durée maximum (secondes) de report d'une tâche dont le circuit est ouvert
+        """
+        self.max_workers = max(1, max_workers or 1)
+        self.max_defer = max_defer
+        self._lock = threading.Lock()
+        self._callback_lock = threading.Lock()
+        self._queue: List = []
+        # Tâches reportées : (instant time.monotonic() de remise en file, rang, tâche)
+        self._delayed: List = []
+        self._stopped = threading.Event()
+        self._sequence = itertools.count()
+        self._jobs: Dict[Hashable, ExtractionJob] = {}
+        self._error: Optional[BaseException] = None
+        self.stats = {'tasks': 0, 'completed': 0, 'failed': 0, 'expired': 0, 'cancelled': 0,
+                      'deferred': 0}
+
+    def add_job(self, kind: str, period: str, entities: Sequence[Any],
+                units: Sequence[str], fetch: Callable[[Any, str], Any],
+                build: Callable[[Any, Dict[str, Any]], Dict],
+                entity_id: Callable[[Any], str] = str,
+                priority: str = PRIORITY_NORMAL, deadline: float = None,
+                on_done: Callable[[List[Dict]], None] = None,
+                key: Hashable = None) -> Hashable:
+        """
+        Ajoute un groupe de tâches (une par entité et par unité)
+
+        Args:
+            kind: Type d'entité ('segment', 'website'...)
+            period: Période couverte (libellé)
+            entities: Entités à extraire
+            units: Endpoints ou groupes de métriques par entité
+            fetch: fetch(entity, unit) fait l'appel API et retourne le payload
+            build: build(entity, {unit: payload}) construit l'enregistrement de sortie
+            entity_id: Identifiant d'une entité
+            priority: PRIORITY_HIGH, PRIORITY_NORMAL ou PRIORITY_LOW
+            deadline: Échéance (time.time()) au-delà de laquelle les tâches sont abandonnées
+            on_done: Appelé avec les enregistrements quand le groupe est terminé
+            key: Clé du groupe dans le résultat de run() (générée si absente)
+
+        Returns:
+            Clé du groupe
+        """
+        if priority not in PRIORITY_RANK:
+            raise ValueError(f"Priorité inconnue: {priority}")
+
+        with self._lock:
+            key = key if key is not None else (kind, period, len(self._jobs))
+            job = ExtractionJob(key, kind, period, entities, entity_id, units, build, on_done)
+            self._jobs[key] = job
+
+            for entity in job.entities:
+                for unit in job.units:
+                    task = ExtractionTask(job, entity_id(entity), unit,
+                                          lambda entity=entity, unit=unit: fetch(entity, unit),
+                                          priority, deadline)
+                    task.order = (PRIORITY_RANK[priority],
+                                  deadline if deadline is not None else float('inf'),
+                                  next(self._sequence))
+                    heapq.heappush(self._queue, (task.order, task))
+            self.stats['tasks'] += job.remaining
+
+        # Un groupe vide est terminé d'emblée
+        if job.remaining == 0:
+            self._finish(job)
+
+        return key
+
+    def pending(self) -> int:
+        """Nombre de tâches encore en file (reportées comprises)"""
+        with self._lock:
+            return len(self._queue) + len(self._delayed)
+
+    def run(self) -> Dict[Hashable, List[Dict]]:
+        """
+        Exécute toutes les tâches en file
+
+        Returns:
+            Enregistrements de chaque groupe terminé sans on_done, par clé
+            (ceux des groupes avec on_done ne sont pas conservés : mémoire bornée)
+
+        Raises:
+            QuotaBudgetExceededError: si le budget a arrêté l'extraction
+        """
+        tasks = self.pending()
+        self._stopped.clear()
+        if tasks:
+            workers = min(self.max_workers, tasks)
+            logger.info(f"Ordonnanceur: {tasks} appels, {workers} workers")
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._worker) for _ in range(workers)]
+                for future in futures:
+                    future.result()
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+        return {key: job.results for key, job in self._jobs.items() if job.results is not None}
+
+    def _next_task(self) -> Tuple[Optional[ExtractionTask], float]:
+        """
+        Retire la tâche la plus prioritaire parmi celles qui peuvent partir
+
+        Returns:
+            (tâche, 0), (None, délai avant la prochaine tâche reportée)
+            ou (None, 0) si la file est vide ou arrêtée
+        """
+        with self._lock:
+            if self._error is not None:
+                return None, 0.0
+
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                task = heapq.heappop(self._delayed)[2]
+                heapq.heappush(self._queue, (task.order, task))
+
+            if self._queue:
+                return heapq.heappop(self._queue)[1], 0.0
+            if self._delayed:
+                return None, self._delayed[0][0] - now
+            return None, 0.0
+
+    def _defer(self, task: ExtractionTask, error: CircuitOpenError) -> Optional[str]:
+        """
+        Remet en file une tâche refusée par un circuit ouvert, jusqu'à sa réouverture
+
+        Returns:
+            None si la tâche est reportée, sinon l'issue à enregistrer
+            ('expired' si l'échéance tombe avant, 'failed' si le circuit reste ouvert trop longtemps)
+        """
+        now = time.monotonic()
+        if task.deferred_since is None:
+            task.deferred_since = now
+        not_before = max(error.open_until, now)
+
+        if task.deadline is not None and time.time() + (not_before - now) > task.deadline:
+            logger.warning(f"{error} jusqu'après l'échéance, abandon de {task.job.kind} "
+                           f"{task.entity} ({task.unit}, {task.period})")
+            return 'expired'
+        if not_before - task.deferred_since > self.max_defer:
+            logger.error(f"{error} depuis plus de {self.max_defer:.0f}s, abandon de "
+                         f"{task.job.kind} {task.entity} ({task.unit}, {task.period})")
+            return 'failed'
+
+        with self._lock:
+            if self._error is not None:
+                # File arrêtée entre-temps : la tâche est annulée comme les autres
+                self.stats['cancelled'] += 1
+                return None
+            heapq.heappush(self._delayed, (not_before, task.order, task))
+            self.stats['deferred'] += 1
+        logger.debug(f"{error}, {task.entity} ({task.unit}) reporté de {not_before - now:.1f}s")
+        return None
+
+    def _worker(self) -> None:
+        """Consomme la file jusqu'à ce qu'elle soit vide"""
+        while True:
+            task, wait = self._next_task()
+            if task is None:
+                if wait <= 0:
+                    return
+                # Seules des tâches reportées restent : attendre la première (ou l'arrêt de la file)
+                self._stopped.wait(wait)
+                continue
+
+            if task.deadline is not None and time.time() > task.deadline:
+                logger.warning(f"Échéance dépassée, abandon de {task.job.kind} "
+                               f"{task.entity} ({task.unit}, {task.period})")
+                self._complete(task, None, 'expired')
+                continue
+
+            try:
+                payload = task.call()
+            except QuotaBudgetExceededError as e:
+                # Budget épuisé : inutile de lancer les appels restants
+                self._stop(e)
+                return
+            except CircuitOpenError as e:
+                # Pas de résultat : la tâche repart à la réouverture du circuit
+                outcome = self._defer(task, e)
+                if outcome is not None:
+                    self._complete(task, None, outcome)
+                continue
+            except Exception as e:
+                logger.error(f"Erreur inattendue pour {task.entity} ({task.unit}): {e}")
+                payload = None
+
+            self._complete(task, payload, 'completed' if payload else 'failed')
+
+    def _stop(self, error: BaseException) -> None:
+        """Arrête la file : les tâches restantes ne sont pas lancées"""
+        with self._lock:
+            if self._error is None:
+                self._error = error
+            self.stats['cancelled'] += len(self._queue) + len(self._delayed)
+            self._queue.clear()
+            self._delayed.clear()
+        self._stopped.set()
+
+    def _complete(self, task: ExtractionTask, payload: Any, outcome: str) -> None:
+        """Enregistre le résultat d'une tâche et termine son groupe si c'était la dernière"""
+        job = task.job
+        with self._lock:
+            job.payloads[task.entity][task.unit] = payload
+            job.remaining -= 1
+            self.stats[outcome] += 1
+            finished = job.remaining == 0
+
+        if finished:
+            self._finish(job)
+
+    def _finish(self, job: ExtractionJob) -> None:
+        """Construit les enregistrements du groupe et appelle on_done (un groupe à la fois)"""
+        with self._callback_lock:
+            try:
+                results = [
+                    job.build(entity, {unit: job.payloads[job.entity_id(entity)].get(unit)
+                                       for unit in job.units})
+                    for entity in job.entities
+                ]
+                # Les payloads bruts ne sont plus utiles une fois les enregistrements construits
+                job.payloads = None
+                if job.on_done:
+                    job.on_done(results)
+                else:
+                    job.results = results
+            except Exception as e:
+                logger.error(f"Erreur à la finalisation de {job.kind} {job.period}: {e}")
+                self._stop(e)
@@ -0,0 +1,165 @@
+"""
+Registre local des fichiers déjà chargés dans BigQuery
+Un fichier inchangé (même taille, même date de modification) est ignoré sans être
+ouvert ; un fichier modifié n'est retraité que si son contenu a vraiment changé
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+import sys
+import os
+
+# Ajouter le chemin parent pour importer la config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import *
+
+logger = logging.getLogger(__name__)
+
+# Taille des blocs lus pour l'empreinte d'un fichier
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """Empreinte SHA-256 du contenu d'un fichier (lu par blocs)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadLedger:
+    """
+    Registre SQLite des fichiers chargés, par table de destination
+
+    Une entrée (chemin, table) garde la taille, la date de modification,
+    l'empreinte du contenu et les compteurs de lignes du dernier chargement réussi.
+    """
+
+    def __init__(self, path: str = UPLOAD_LEDGER_PATH):
+        """
+        Initialise le registre
+
+        Args:
+            path: Chemin du fichier SQLite
+        """
+        self.path = path
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploaded_files (
+                path TEXT NOT NULL,
+                table_id TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                sha256 TEXT NOT NULL,
+                rows_processed INTEGER NOT NULL DEFAULT 0,
+                rows_uploaded INTEGER NOT NULL DEFAULT 0,
+                rows_skipped INTEGER NOT NULL DEFAULT 0,
+                uploaded_at REAL NOT NULL,
+                PRIMARY KEY (path, table_id)
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _key(file_path: str) -> str:
+        """Chemin absolu : le registre ne dépend pas du répertoire de lancement"""
+        return os.path.abspath(file_path)
+
+    def check(self, file_path: str, table_id: str) -> Tuple[bool, Optional[Dict]]:
+        """
+        Indique si un fichier doit être (re)traité pour une table
+
+        Taille et date de modification identiques : ignoré sans ouvrir le fichier.
+        Sinon l'empreinte est calculée ; un contenu identique (fichier copié,
+        touché...) met seulement l'entrée à jour.
+
+        Args:
+            file_path: Fichier de données
+            table_id: Table BigQuery de destination
+
+        Returns:
+            (à traiter, empreinte à passer à record() après un chargement réussi)
+        """
+        stat = os.stat(file_path)
+        key = self._key(file_path)
+
+        with self._lock:
+            entry = self._conn.execute(
+                'SELECT size, mtime, sha256 FROM uploaded_files WHERE path = ? AND table_id = ?',
+                (key, table_id)).fetchone()
+
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            return False, None
+
+        fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': file_sha256(file_path)}
+        if entry is not None and entry[2] == fingerprint['sha256']:
+            with self._lock:
+                self._conn.execute(
+                    'UPDATE uploaded_files SET size = ?, mtime = ? WHERE path = ? AND table_id = ?',
+                    (fingerprint['size'], fingerprint['mtime'], key, table_id))
+                self._conn.commit()
+            return False, None
+
+        return True, fingerprint
+
+    def record(self, file_path: str, table_id: str, fingerprint: Dict,
+               rows_processed: int = 0, rows_uploaded: int = 0, rows_skipped: int = 0) -> None:
+        """
+        Enregistre le chargement réussi d'un fichier
+
+        Args:
+            file_path: Fichier de données
+            table_id: Table BigQuery de destination
+            fingerprint: Empreinte retournée par check()
+            rows_processed: Lignes lues dans le fichier
+            rows_uploaded: Nouvelles lignes chargées
+            rows_skipped: Lignes déjà présentes dans la table
+        """
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO uploaded_files (path, table_id, size, mtime, sha256, '
+                'rows_processed, rows_uploaded, rows_skipped, uploaded_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (self._key(file_path), table_id, fingerprint['size'], fingerprint['mtime'],
+                 fingerprint['sha256'], rows_processed, rows_uploaded, rows_skipped, time.time()))
+            self._conn.commit()
+
+    def forget(self, table_id: str = None) -> int:
+        """
+        Oublie les fichiers chargés (tous, ou ceux d'une table) pour tout retraiter
+
+        Returns:
+            Nombre d'entrées supprimées
+        """
+        with self._lock:
+            if table_id is None:
+                cursor = self._conn.execute('DELETE FROM uploaded_files')
+            else:
+                cursor = self._conn.execute('DELETE FROM uploaded_files WHERE table_id = ?', (table_id,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def summary(self) -> Dict:
+        """Retourne le contenu du registre par table pour les rapports"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT table_id, COUNT(*), COALESCE(SUM(rows_processed), 0), COALESCE(SUM(rows_uploaded), 0) '
+                'FROM uploaded_files GROUP BY table_id').fetchall()
+        return {
+            'path': self.path,
+            'tables': {table_id: {'files': files, 'rows_processed': processed, 'rows_uploaded': uploaded}
+                       for table_id, files, processed, uploaded in rows}
+        }
+
+    def close(self) -> None:
+        """Ferme la connexion SQLite"""
+        with self._lock:
+            self._conn.close()
@@ -4,13 +4,28 @@ Script d'upload BigQuery CORRIGÉ pour les données quotidiennes
 Préserve la granularité journalière au lieu de forcer au 1er du mois
 """
 import os
+import sys
 import json
 import glob
 import argparse
-from datetime import datetime
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import bigquery
 import logging
-from typing import Set, Tuple, List, Dict
+from typing import Dict, Iterator, List, Set, Tuple
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import (BIGQUERY_LOAD_CHUNK_ROWS, BIGQUERY_LOAD_MAX_WORKERS, BIGQUERY_LOAD_RETRIES,
+                           BIGQUERY_UPLOAD_MODE, PARQUET_DATA_PATH)
+from scripts.normalization import (ENTITY_SEGMENT, ENTITY_WEBSITE, frame_to_rows,
+                                   normalize_segments, normalize_websites)
+from scripts.result_sink import NDJSON_EXTENSION, iter_ndjson, load_normalized_sources
+from scripts.retry_policy import RetryPolicy
+from scripts.upload_ledger import UploadLedger
+
+PARQUET_EXTENSION = '.parquet'
 
 # Configuration du logging
 logging.basicConfig(
@@ -20,12 +35,15 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class BigQueryDailyUploader:
-    def __init__(self, project_id=None):
+    def __init__(self, project_id=None, ledger: UploadLedger = None):
         """Initialise le client BigQuery pour données quotidiennes"""
         self.project_id = project_id or os.environ.get('GCP_PROJECT_ID', 'lec-lco-mkt-acquisition-prd')
         self.client = bigquery.Client(project=self.project_id)
         self.dataset_id = 'similar_web_data'
         
+        # Registre des fichiers déjà chargés
+        self.ledger = ledger or UploadLedger()
+        
         # Cache pour les données existantes
         self._existing_segments = None
         self._existing_websites = None
@@ -92,207 +110,112 @@ class BigQueryDailyUploader:
             logger.warning(f"Erreur lors de la récupération des websites existants: {e}")
             return set()
     
-    def _process_segments_file_daily(self, file_path):
-        """Traite un fichier de segments - PRESERVE LA GRANULARITÉ QUOTIDIENNE + CONFIDENCE"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        if not isinstance(data, list):
-            logger.warning(f"Format inattendu dans {file_path}: attendu une liste")
-            return []
-        
-        rows = []
-        extraction_date = datetime.now().date().isoformat()
+    @staticmethod
+    def _find_files(file_pattern: str, parquet_pattern: str = None, source: str = 'all') -> List[str]:
+        """
+        Fichiers à traiter
+        
+        Args:
+            file_pattern: Fichiers bruts (plus leurs équivalents NDJSON pour un pattern en .json)
+            parquet_pattern: Fichiers du dataset Parquet normalisé (récursif)
+            source: 'raw', 'normalized', 'all', ou 'auto' (le dataset normalisé, plus
+                les fichiers bruts qui n'y ont pas d'équivalent : anciens fichiers,
+                extractions en SIMILARWEB_OUTPUT_FORMAT=ndjson, arrêts avant la fermeture)
+        """
+        raw = set(glob.glob(file_pattern, recursive=True))
+        if file_pattern.endswith('.json'):
+            raw.update(glob.glob(file_pattern[:-len('.json')] + NDJSON_EXTENSION))
+        normalized = set(glob.glob(parquet_pattern, recursive=True)) if parquet_pattern else set()
+        
+        if source == 'raw':
+            return sorted(raw)
+        if source == 'normalized':
+            return sorted(normalized)
+        if source == 'auto':
+            covered = load_normalized_sources()
+            return sorted(normalized | {path for path in raw if os.path.abspath(path) not in covered})
+        return sorted(raw | normalized)
+    
+    def _pending_files(self, files: List[str], table_id: str) -> List[Tuple[str, Dict]]:
+        """
+        Fichiers nouveaux ou modifiés depuis leur dernier chargement dans la table
         
-        for segment in data:
-            # Ignorer les segments avec erreur
-            if segment.get('error', False):
-                continue
-                
-            segment_id = segment.get('segment_id', '')
-            segment_name = segment.get('segment_name', '')
-            extraction_granularity = segment.get('extraction_granularity', 'unknown')
-            
-            # Vérifier la structure des données
-            segment_data = segment.get('data', {})
-            if not segment_data or 'segments' not in segment_data:
+        Returns:
+            (fichier, empreinte à enregistrer après chargement) pour chaque fichier à traiter
+        """
+        pending = []
+        for file_path in files:
+            try:
+                to_process, fingerprint = self.ledger.check(file_path, table_id)
+            except OSError as e:
+                logger.error(f"Erreur {file_path}: {e}")
                 continue
-            
-            # Traiter chaque point de données
-            for data_point in segment_data['segments']:
-                if not isinstance(data_point, dict):
-                    continue
-                
-                # PRESERVER LA DATE EXACTE (ne pas forcer au 1er du mois)
-                date_str = data_point.get('date', '')
-                if not date_str:
-                    continue
-                
-                # Validation et normalisation de la date
-                if len(date_str) == 10:  # Format YYYY-MM-DD (OK)
-                    final_date = date_str
-                elif len(date_str) == 7:  # Format YYYY-MM -> YYYY-MM-01 SEULEMENT pour granularité monthly
-                    if extraction_granularity == 'monthly':
-                        final_date = date_str + '-01'
-                    else:
-                        continue  # Ignorer les dates incomplètes pour granularité daily
-                else:
-                    continue  # Format invalide
-                    
-                row = {
-                    'segment_id': segment_id,
-                    'segment_name': segment_name,
-                    'date': final_date,  # Date préservée
-                    'granularity': extraction_granularity,  # Nouvelle colonne pour traçabilité
-                    'visits': float(data_point.get('visits', 0)) if data_point.get('visits') is not None else None,
-                    'share': float(data_point.get('share', 0.0)) if data_point.get('share') is not None else None,
-                    'bounce_rate': float(data_point.get('bounce_rate')) if data_point.get('bounce_rate') is not None else None,
-                    'pages_per_visit': float(data_point.get('pages_per_visit')) if data_point.get('pages_per_visit') is not None else None,
-                    'visit_duration': float(data_point.get('visit_duration')) if data_point.get('visit_duration') is not None else None,
-                    'page_views': float(data_point.get('page_views')) if data_point.get('page_views') is not None else None,
-                    'unique_visitors': float(data_point.get('unique_visitors')) if data_point.get('unique_visitors') is not None else None,
-                    'confidence': str(data_point.get('confidence')) if data_point.get('confidence') is not None else None,  # NOUVELLE COLONNE (STRING)
-                    'extraction_date': extraction_date
-                }
-                
-                # Ne garder que les lignes avec au moins visits ou share
-                if (row['visits'] is not None and row['visits'] > 0) or (row['share'] is not None and row['share'] > 0):
-                    rows.append(row)
+            if to_process:
+                pending.append((file_path, fingerprint))
         
-        return rows
+        if len(pending) < len(files):
+            logger.info(f"{len(files) - len(pending)} fichiers déjà chargés et inchangés ignorés")
+        return pending
     
-    def _process_websites_file_daily(self, file_path):
-        """Traite un fichier de websites - PRESERVE LA GRANULARITÉ QUOTIDIENNE + CONFIDENCE"""
+    @staticmethod
+    def _read_parquet_rows(file_path, kind) -> List[Dict]:
+        """Lignes d'un fichier Parquet ('segment' ou 'website'), déjà normalisées à l'extraction"""
+        from scripts.parquet_sink import read_parquet_rows
+        return read_parquet_rows(file_path, kind)
+    
+    @staticmethod
+    def _iter_records(file_path) -> Iterator[Dict]:
+        """
+        Parcourt les enregistrements d'un fichier d'extraction sans tout charger
+        (NDJSON écrit en flux, ou ancien fichier JSON contenant une liste)
+        """
+        if file_path.endswith(NDJSON_EXTENSION):
+            yield from iter_ndjson(file_path)
+            return
+        
         with open(file_path, 'r', encoding='utf-8') as f:
             data = json.load(f)
         
         if not isinstance(data, list):
             logger.warning(f"Format inattendu dans {file_path}: attendu une liste")
-            return []
-        
-        rows = []
-        extraction_date = datetime.now().date().isoformat()
-        
-        for website in data:
-            domain = website.get('domain', '')
-            metrics = website.get('metrics', {})
-            extraction_granularity = website.get('extraction_granularity', 'unknown')
-            
-            if not metrics:
-                continue
-            
-            # Extraire les visites comme référence de dates
-            visits_data = metrics.get('visits', {})
-            if not visits_data or 'visits' not in visits_data:
-                continue
-            
-            # Pour chaque point de date dans les visites
-            for visit_point in visits_data['visits']:
-                date_str = visit_point.get('date', '')
-                if not date_str:
-                    continue
-                
-                # PRESERVER LA DATE EXACTE (ne pas forcer au 1er du mois)
-                if len(date_str) == 10:  # Format YYYY-MM-DD (OK)
-                    final_date = date_str
-                elif len(date_str) == 7:  # Format YYYY-MM -> YYYY-MM-01 SEULEMENT pour granularité monthly
-                    if extraction_granularity == 'monthly':
-                        final_date = date_str + '-01'
-                    else:
-                        continue  # Ignorer les dates incomplètes pour granularité daily
-                else:
-                    continue  # Format invalide
-                
-                row = {
-                    'domain': domain,
-                    'date': final_date,  # Date préservée
-                    'granularity': extraction_granularity,  # Nouvelle colonne pour traçabilité
-                    'visits': float(visit_point.get('visits', 0)) if visit_point.get('visits') is not None else None,
-                    'bounce_rate': None,
-                    'pages_per_visit': None,
-                    'avg_visit_duration': None,
-                    'page_views': None,
-                    'unique_visitors': None,
-                    'desktop_share': None,
-                    'mobile_share': None,
-                    'confidence': float(visit_point.get('confidence')) if visit_point.get('confidence') is not None else None,  # NOUVELLE COLONNE
-                    'extraction_date': extraction_date
-                }
-                
-                # Ajouter les autres métriques si disponibles avec leur confidence
-                self._add_metric_to_row_with_confidence(row, metrics, 'bounce_rate', 'bounce_rate', final_date)
-                self._add_metric_to_row_with_confidence(row, metrics, 'pages_per_visit', 'pages_per_visit', final_date)
-                self._add_metric_to_row_with_confidence(row, metrics, 'avg_visit_duration', 'average_visit_duration', final_date)
-                self._add_metric_to_row_with_confidence(row, metrics, 'page_views', 'page_views', final_date)
-                
-                # Desktop/Mobile split
-                self._add_split_metrics(row, metrics, final_date)
-                
-                rows.append(row)
+            return
         
-        return rows
-
-    def _add_metric_to_row_with_confidence(self, row, metrics, metric_name, field_name, target_date):
-        """Ajoute une métrique à la ligne si elle existe pour la date EXACTE + gère confidence"""
-        metric_data = metrics.get(metric_name, {})
-        if metric_data and metric_name in metric_data:
-            for point in metric_data[metric_name]:
-                point_date = point.get('date', '')
-                
-                # Comparaison EXACTE de la date (pas de normalisation)
-                if point_date == target_date or point_date == target_date[:7]:  # YYYY-MM-DD ou YYYY-MM
-                    value = point.get(field_name)
-                    if value is not None:
-                        row[metric_name] = float(value)
-                    
-                    # Si confidence n'est pas encore définie et qu'elle existe dans ce point
-                    if row.get('confidence') is None:
-                        confidence = point.get('confidence')
-                        if confidence is not None:
-                            row['confidence'] = str(confidence)
-                    break
+        yield from data
     
-    def _add_metric_to_row(self, row, metrics, metric_name, field_name, target_date):
-        """Ajoute une métrique à la ligne si elle existe pour la date EXACTE"""
-        metric_data = metrics.get(metric_name, {})
-        if metric_data and metric_name in metric_data:
-            for point in metric_data[metric_name]:
-                point_date = point.get('date', '')
-                
-                # Comparaison EXACTE de la date (pas de normalisation)
-                if point_date == target_date or point_date == target_date[:7]:  # YYYY-MM-DD ou YYYY-MM
-                    value = point.get(field_name)
-                    if value is not None:
-                        row[metric_name] = float(value)
-                    break
+    def _process_segments_file_daily(self, file_path):
+        """Traite un fichier de segments - PRESERVE LA GRANULARITÉ QUOTIDIENNE + CONFIDENCE"""
+        if file_path.endswith(PARQUET_EXTENSION):
+            return self._read_parquet_rows(file_path, ENTITY_SEGMENT)
+        
+        # Fichier brut (JSON/NDJSON) : même normalisation qu'à l'extraction
+        return frame_to_rows(normalize_segments(self._iter_records(file_path)))
     
-    def _add_split_metrics(self, row, metrics, target_date):
-        """Ajoute les métriques desktop/mobile split pour la date EXACTE"""
-        split_data = metrics.get('desktop_mobile_split', {})
-        if split_data and 'data' in split_data:
-            for split_point in split_data['data']:
-                point_date = split_point.get('date', '')
-                
-                # Comparaison EXACTE de la date
-                if point_date == target_date or point_date == target_date[:7]:
-                    for device_data in split_point.get('data', []):
-                        device = device_data.get('device', '')
-                        value = device_data.get('value', 0)
-                        if device == 'desktop':
-                            row['desktop_share'] = float(value) if value is not None else None
-                        elif device == 'mobile':
-                            row['mobile_share'] = float(value) if value is not None else None
-                    break
+    def _process_websites_file_daily(self, file_path):
+        """Traite un fichier de websites - PRESERVE LA GRANULARITÉ QUOTIDIENNE + CONFIDENCE"""
+        if file_path.endswith(PARQUET_EXTENSION):
+            return self._read_parquet_rows(file_path, ENTITY_WEBSITE)
+        
+        return frame_to_rows(normalize_websites(self._iter_records(file_path)))
     
-    def upload_segments(self, file_pattern='data/segments_*.json'):
-        """Upload les fichiers de segments vers BigQuery avec granularité préservée"""
-        files = glob.glob(file_pattern)
+    def upload_segments(self, file_pattern='data/segments_*.json',
+                        parquet_pattern=os.path.join(PARQUET_DATA_PATH, 'entity=segment', '**', '*.parquet'),
+                        source='auto'):
+        """Upload les fichiers de segments (JSON, NDJSON, Parquet) vers BigQuery avec granularité préservée"""
+        files = self._find_files(file_pattern, parquet_pattern, source)
         logger.info(f"{len(files)} fichiers segments trouvés")
         
         if not files:
             logger.warning("Aucun fichier segments trouvé")
             return 0
         
+        table_id = f"{self.project_id}.{self.dataset_id}.segments_data"
+        
+        # Les fichiers déjà chargés et inchangés ne sont pas relus
+        pending = self._pending_files(files, table_id)
+        if not pending:
+            logger.info("Aucun fichier segments nouveau ou modifié")
+            return 0
+        
         # Récupérer les données existantes
         existing_keys = self.get_existing_segments_keys()
         
@@ -300,26 +223,26 @@ class BigQueryDailyUploader:
         total_rows_uploaded = 0
         total_rows_skipped = 0
         
-        table_id = f"{self.project_id}.{self.dataset_id}.segments_data"
-        
-        for file_path in sorted(files):
+        for file_path, fingerprint in pending:
             try:
-                logger.info(f"Traitement: {os.path.basename(file_path)}")
+                logger.info(f"Traitement: {os.path.relpath(file_path)}")
                 rows = self._process_segments_file_daily(file_path)
                 
                 if not rows:
                     logger.warning(f"{file_path}: Aucune donnée trouvée")
+                    self.ledger.record(file_path, table_id, fingerprint)
                     continue
                 
                 # Filtrer les doublons
                 new_rows = []
+                new_keys = set()
                 skipped_count = 0
                 
                 for row in rows:
                     key = (row['segment_id'], row['date'])
-                    if key not in existing_keys:
+                    if key not in existing_keys and key not in new_keys:
                         new_rows.append(row)
-                        existing_keys.add(key)
+                        new_keys.add(key)
                     else:
                         skipped_count += 1
                 
@@ -330,12 +253,18 @@ class BigQueryDailyUploader:
                     # Upload vers BigQuery
                     errors = self.client.insert_rows_json(table_id, new_rows)
                     if errors:
+                        # Pas d'entrée au registre : le fichier sera retraité au prochain passage
                         logger.error(f"Erreur pour {file_path}: {errors}")
-                    else:
-                        total_rows_uploaded += len(new_rows)
-                        logger.info(f"{os.path.basename(file_path)}: {len(new_rows)} nouvelles lignes (dates préservées) uploadées")
+                        continue
+                    # Clés connues seulement une fois chargées : un échec reste retentable
+                    existing_keys.update(new_keys)
+                    total_rows_uploaded += len(new_rows)
+                    logger.info(f"{os.path.basename(file_path)}: {len(new_rows)} nouvelles lignes (dates préservées) uploadées")
                 else:
                     logger.info(f"{os.path.basename(file_path)}: Toutes les données existent déjà")
+                
+                self.ledger.record(file_path, table_id, fingerprint, rows_processed=len(rows),
+                                   rows_uploaded=len(new_rows), rows_skipped=skipped_count)
                     
             except Exception as e:
                 logger.error(f"Erreur {file_path}: {str(e)}")
@@ -347,15 +276,25 @@ class BigQueryDailyUploader:
         
         return total_rows_uploaded
     
-    def upload_websites(self, file_pattern='data/websites_*.json'):
-        """Upload les fichiers de websites vers BigQuery avec granularité préservée"""
-        files = glob.glob(file_pattern)
+    def upload_websites(self, file_pattern='data/websites_*.json',
+                        parquet_pattern=os.path.join(PARQUET_DATA_PATH, 'entity=website', '**', '*.parquet'),
+                        source='auto'):
+        """Upload les fichiers de websites (JSON, NDJSON, Parquet) vers BigQuery avec granularité préservée"""
+        files = self._find_files(file_pattern, parquet_pattern, source)
         logger.info(f"{len(files)} fichiers websites trouvés")
         
         if not files:
             logger.warning("Aucun fichier websites trouvé")
             return 0
         
+        table_id = f"{self.project_id}.{self.dataset_id}.websites_data"
+        
+        # Les fichiers déjà chargés et inchangés ne sont pas relus
+        pending = self._pending_files(files, table_id)
+        if not pending:
+            logger.info("Aucun fichier websites nouveau ou modifié")
+            return 0
+        
         # Récupérer les données existantes
         existing_keys = self.get_existing_websites_keys()
         
@@ -363,26 +302,26 @@ class BigQueryDailyUploader:
         total_rows_uploaded = 0
         total_rows_skipped = 0
         
-        table_id = f"{self.project_id}.{self.dataset_id}.websites_data"
-        
-        for file_path in sorted(files):
+        for file_path, fingerprint in pending:
             try:
-                logger.info(f"Traitement: {os.path.basename(file_path)}")
+                logger.info(f"Traitement: {os.path.relpath(file_path)}")
                 rows = self._process_websites_file_daily(file_path)
                 
                 if not rows:
                     logger.warning(f"{file_path}: Aucune donnée trouvée")
+                    self.ledger.record(file_path, table_id, fingerprint)
                     continue
                 
                 # Filtrer les doublons
                 new_rows = []
+                new_keys = set()
                 skipped_count = 0
                 
                 for row in rows:
                     key = (row['domain'], row['date'])
-                    if key not in existing_keys:
+                    if key not in existing_keys and key not in new_keys:
                         new_rows.append(row)
-                        existing_keys.add(key)
+                        new_keys.add(key)
                     else:
                         skipped_count += 1
                 
@@ -393,12 +332,18 @@ class BigQueryDailyUploader:
                     # Upload vers BigQuery
                     errors = self.client.insert_rows_json(table_id, new_rows)
                     if errors:
+                        # Pas d'entrée au registre : le fichier sera retraité au prochain passage
                         logger.error(f"Erreur pour {file_path}: {errors}")
-                    else:
-                        total_rows_uploaded += len(new_rows)
-                        logger.info(f"{os.path.basename(file_path)}: {len(new_rows)} nouvelles lignes (dates préservées) uploadées")
+                        continue
+                    # Clés connues seulement une fois chargées : un échec reste retentable
+                    existing_keys.update(new_keys)
+                    total_rows_uploaded += len(new_rows)
+                    logger.info(f"{os.path.basename(file_path)}: {len(new_rows)} nouvelles lignes (dates préservées) uploadées")
                 else:
                     logger.info(f"{os.path.basename(file_path)}: Toutes les données existent déjà")
+                
+                self.ledger.record(file_path, table_id, fingerprint, rows_processed=len(rows),
+                                   rows_uploaded=len(new_rows), rows_skipped=skipped_count)
                     
             except Exception as e:
                 logger.error(f"Erreur {file_path}: {str(e)}")
@@ -410,6 +355,200 @@ class BigQueryDailyUploader:
         
         return total_rows_uploaded
     
+    def _batch_specs(self) -> Dict[str, Dict]:
+        """Fichiers, traitement et clé d'unicité de chaque table pour l'upload par lots"""
+        return {
+            'segments': {
+                'file_pattern': 'data/segments_*.json',
+                'parquet_pattern': os.path.join(PARQUET_DATA_PATH, 'entity=segment', '**', '*.parquet'),
+                'process': self._process_segments_file_daily,
+                'existing_keys': self.get_existing_segments_keys,
+                'key': 'segment_id',
+                'table_id': f"{self.project_id}.{self.dataset_id}.segments_data"
+            },
+            'websites': {
+                'file_pattern': 'data/websites_*.json',
+                'parquet_pattern': os.path.join(PARQUET_DATA_PATH, 'entity=website', '**', '*.parquet'),
+                'process': self._process_websites_file_daily,
+                'existing_keys': self.get_existing_websites_keys,
+                'key': 'domain',
+                'table_id': f"{self.project_id}.{self.dataset_id}.websites_data"
+            }
+        }
+    
+    def _prepare_load_chunks(self, kind: str, spec: Dict, pending: List[Tuple[str, Dict]],
+                             workdir: str, chunk_rows: int) -> Tuple[List[Dict], Dict[str, Dict]]:
+        """
+        Écrit les nouvelles lignes d'une table en fichiers NDJSON de chunk_rows lignes
+        
+        Returns:
+            (lots à charger, état de chaque fichier source : empreinte, compteurs, lots)
+        """
+        existing_keys = spec['existing_keys']()
+        # Clé déjà retenue dans ce passage -> lot qui la contient
+        batch_keys = {}
+        chunks, sources = [], {}
+        current = None
+        
+        def close_current():
+            if current is not None:
+                current['handle'].close()
+                del current['handle']
+        
+        for file_path, fingerprint in pending:
+            source = {'fingerprint': fingerprint, 'processed': 0, 'uploaded': 0, 'skipped': 0,
+                      'chunks': set(), 'failed': False}
+            sources[file_path] = source
+            try:
+                logger.info(f"Traitement: {os.path.relpath(file_path)}")
+                rows = spec['process'](file_path)
+            except Exception as e:
+                logger.error(f"Erreur {file_path}: {str(e)}")
+                source['failed'] = True
+                continue
+            
+            source['processed'] = len(rows)
+            for row in rows:
+                key = (row[spec['key']], row['date'])
+                if key in existing_keys or key in batch_keys:
+                    source['skipped'] += 1
+                    # Doublon d'une ligne de ce passage : le fichier dépend aussi de son lot
+                    if key in batch_keys:
+                        source['chunks'].add(batch_keys[key])
+                    continue
+                
+                if current is None or current['rows'] >= chunk_rows:
+                    close_current()
+                    path = os.path.join(workdir, f"{kind}_{len(chunks) + 1:04d}{NDJSON_EXTENSION}")
+                    current = {'kind': kind, 'table_id': spec['table_id'], 'path': path, 'rows': 0,
+                               'keys': set(), 'handle': open(path, 'w', encoding='utf-8')}
+                    chunks.append(current)
+                
+                current['handle'].write(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n')
+                current['rows'] += 1
+                current['keys'].add(key)
+                batch_keys[key] = len(chunks) - 1
+                source['uploaded'] += 1
+                source['chunks'].add(len(chunks) - 1)
+        
+        close_current()
+        return chunks, sources
+    
+    def _run_load_job(self, chunk: Dict, retry_policy: RetryPolicy) -> bool:
+        """
+        Charge un lot NDJSON dans sa table (job atomique : tout ou rien)
+        
+        Seul ce lot est renvoyé en cas d'échec, jusqu'à max_retries fois.
+        
+        Returns:
+            True si le job a réussi
+        """
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND
+        )
+        name = os.path.basename(chunk['path'])
+        
+        for attempt in range(retry_policy.max_retries + 1):
+            try:
+                with open(chunk['path'], 'rb') as f:
+                    job = self.client.load_table_from_file(f, chunk['table_id'], job_config=job_config)
+                job.result()
+                logger.info(f"{name}: {chunk['rows']} lignes chargées dans {chunk['table_id']} (job {job.job_id})")
+                return True
+            except Exception as e:
+                if attempt == retry_policy.max_retries:
+                    logger.error(f"{name}: échec définitif du chargement après {attempt + 1} tentatives: {e}")
+                    return False
+                delay = retry_policy.backoff(attempt)
+                logger.warning(f"{name}: échec du chargement ({e}), nouvelle tentative dans {delay:.1f}s")
+                time.sleep(delay)
+        return False
+    
+    def upload_batch(self, kinds=('segments', 'websites'), source='auto',
+                     patterns: Dict[str, Tuple[str, str]] = None,
+                     chunk_rows: int = BIGQUERY_LOAD_CHUNK_ROWS,
+                     max_workers: int = BIGQUERY_LOAD_MAX_WORKERS,
+                     retries: int = BIGQUERY_LOAD_RETRIES) -> Dict[str, int]:
+        """
+        Upload par jobs de chargement (load_table_from_file) au lieu de insert_rows_json
+        
+        Les nouvelles lignes de chaque table sont regroupées en fichiers NDJSON de
+        chunk_rows lignes, chargés en parallèle (toutes tables confondues). Un job
+        est atomique : un lot en échec est renvoyé seul, sans les lots déjà
+        chargés. Un fichier source n'entre au registre que si tous les lots qui
+        contiennent ses lignes ont été chargés.
+        
+        Args:
+            kinds: Tables à alimenter ('segments', 'websites')
+            source: Fichiers lus (voir _find_files)
+            patterns: (pattern des fichiers bruts, pattern Parquet) par table, à la place des défauts
+            chunk_rows: Lignes par job de chargement
+            max_workers: Jobs de chargement simultanés
+            retries: Nouvelles tentatives d'un job en échec
+            
+        Returns:
+            Nouvelles lignes chargées par table
+        """
+        specs = self._batch_specs()
+        uploaded = {kind: 0 for kind in kinds}
+        retry_policy = RetryPolicy(max_retries=retries)
+        
+        with tempfile.TemporaryDirectory(prefix='bigquery_load_') as workdir:
+            chunks, sources_by_kind = [], {}
+            
+            for kind in kinds:
+                spec = specs[kind]
+                if patterns and kind in patterns:
+                    spec['file_pattern'], spec['parquet_pattern'] = patterns[kind]
+                files = self._find_files(spec['file_pattern'], spec['parquet_pattern'], source)
+                logger.info(f"{len(files)} fichiers {kind} trouvés")
+                pending = self._pending_files(files, spec['table_id'])
+                if not pending:
+                    logger.info(f"Aucun fichier {kind} nouveau ou modifié")
+                    continue
+                
+                kind_chunks, sources = self._prepare_load_chunks(kind, spec, pending, workdir, chunk_rows)
+                sources_by_kind[kind] = (kind_chunks, sources)
+                chunks.extend(kind_chunks)
+            
+            if chunks:
+                logger.info(f"{len(chunks)} jobs de chargement ({sum(c['rows'] for c in chunks)} lignes), "
+                            f"{min(max_workers, len(chunks))} en parallèle")
+                with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+                    outcomes = list(executor.map(lambda chunk: self._run_load_job(chunk, retry_policy), chunks))
+                for chunk, succeeded in zip(chunks, outcomes):
+                    chunk['succeeded'] = succeeded
+        
+        for kind, (kind_chunks, sources) in sources_by_kind.items():
+            spec = specs[kind]
+            existing_keys = spec['existing_keys']()
+            for chunk in kind_chunks:
+                if chunk['succeeded']:
+                    existing_keys.update(chunk['keys'])
+                    uploaded[kind] += chunk['rows']
+            
+            processed = sum(s['processed'] for s in sources.values())
+            skipped = sum(s['skipped'] for s in sources.values())
+            retry_later = 0
+            for file_path, state in sources.items():
+                # Fichier enregistré seulement si toutes ses lignes sont dans la table
+                if state['failed'] or not all(kind_chunks[i]['succeeded'] for i in state['chunks']):
+                    retry_later += 1
+                    continue
+                self.ledger.record(file_path, spec['table_id'], state['fingerprint'],
+                                   rows_processed=state['processed'], rows_uploaded=state['uploaded'],
+                                   rows_skipped=state['skipped'])
+            
+            logger.info(f"RÉSUMÉ {kind.upper()} (jobs de chargement):")
+            logger.info(f"   - Lignes traitées: {processed}")
+            logger.info(f"   - Nouvelles lignes chargées: {uploaded[kind]}")
+            logger.info(f"   - Doublons ignorés: {skipped}")
+            if retry_later:
+                logger.warning(f"   - Fichiers à retraiter au prochain passage: {retry_later}")
+        
+        return uploaded
+    
     def verify_daily_data(self):
         """Vérifie les données quotidiennes dans BigQuery"""
         logger.info("\nVÉRIFICATION BIGQUERY - DONNÉES QUOTIDIENNES")
@@ -477,7 +616,15 @@ def main():
     parser.add_argument('--clear-cache', action='store_true',
                        help='Vider le cache des données existantes avant upload')
     parser.add_argument('--pattern', type=str,
-                       help='Pattern personnalisé pour les fichiers (ex: data/*daily*)')
+                       help='Pattern personnalisé pour les fichiers (ex: data/*daily*, data/parquet/**/month=2024-*/*.parquet)')
+    parser.add_argument('--mode', choices=['load', 'stream'], default=BIGQUERY_UPLOAD_MODE,
+                       help='load : jobs de chargement par lots (parallèles, atomiques) ; '
+                            'stream : insert_rows_json fichier par fichier')
+    parser.add_argument('--reprocess', action='store_true',
+                       help='Ignorer le registre des fichiers déjà chargés et tout retraiter')
+    parser.add_argument('--source', choices=['auto', 'normalized', 'raw', 'all'], default='auto',
+                       help="Fichiers lus : dataset Parquet normalisé, fichiers bruts JSON/NDJSON, les deux, "
+                            "ou auto (le dataset normalisé s'il existe)")
     
     args = parser.parse_args()
     
@@ -490,6 +637,9 @@ def main():
     if args.clear_cache:
         uploader.clear_cache()
     
+    if args.reprocess:
+        logger.info(f"Registre des fichiers chargés vidé ({uploader.ledger.forget()} entrées)")
+    
     logger.info("UPLOAD QUOTIDIEN VERS BIGQUERY (GRANULARITÉ PRÉSERVÉE)")
     logger.info("=" * 60)
     
@@ -499,13 +649,25 @@ def main():
     segments_pattern = args.pattern or 'data/segments_*.json'
     websites_pattern = args.pattern or 'data/websites_*.json'
     
-    if args.type in ['all', 'segments']:
-        uploaded = uploader.upload_segments(segments_pattern)
-        total_uploaded += uploaded
-    
-    if args.type in ['all', 'websites']:
-        uploaded = uploader.upload_websites(websites_pattern)
-        total_uploaded += uploaded
+    if args.mode == 'load':
+        kinds = ('segments', 'websites') if args.type == 'all' else (args.type,)
+        # Un pattern personnalisé remplace aussi le parcours du dataset Parquet
+        patterns = {'segments': (segments_pattern, None), 'websites': (websites_pattern, None)} \
+            if args.pattern else None
+        uploaded = uploader.upload_batch(kinds, source='all' if args.pattern else args.source,
+                                         patterns=patterns)
+        total_uploaded += sum(uploaded.values())
+    else:
+        if args.type in ['all', 'segments']:
+            # Un pattern personnalisé remplace aussi le parcours du dataset Parquet
+            uploaded = uploader.upload_segments(segments_pattern, None, 'all') if args.pattern \
+                else uploader.upload_segments(segments_pattern, source=args.source)
+            total_uploaded += uploaded
+        
+        if args.type in ['all', 'websites']:
+            uploaded = uploader.upload_websites(websites_pattern, None, 'all') if args.pattern \
+                else uploader.upload_websites(websites_pattern, source=args.source)
+            total_uploaded += uploaded
     
     # Vérification finale
     uploader.verify_daily_data()
@@ -0,0 +1,86 @@
+"""
+Fixtures partagées : client BigQuery factice pour les tests d'upload
+"""
+import itertools
+import json
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeLoadJob:
+    """Job de chargement : les lignes n'arrivent dans la table qu'à result()"""
+
+    def __init__(self, client, table_id, rows, error):
+        self.client = client
+        self.table_id = table_id
+        self.rows = rows
+        self.error = error
+        self.job_id = f'job_{next(client._job_ids)}'
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        with self.client._lock:
+            self.client.tables.setdefault(self.table_id, []).extend(self.rows)
+        return self
+
+
+class FakeBigQueryClient:
+    """
+    Client BigQuery en mémoire
+
+    load_failures[nom du fichier chargé] = nombre d'échecs avant succès,
+    insert_failures = nombre d'appels insert_rows_json refusés.
+    """
+
+    def __init__(self, project=None):
+        self.project = project
+        self.tables = {}
+        self.load_calls = []
+        self.insert_calls = []
+        self.load_failures = {}
+        self.insert_failures = 0
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+
+    def query(self, query):
+        table = next((rows for table_id, rows in self.tables.items()
+                      if table_id.rsplit('.', 1)[-1] in query), [])
+        rows = [SimpleNamespace(**row) for row in table]
+        return SimpleNamespace(result=lambda: rows)
+
+    def insert_rows_json(self, table_id, rows):
+        with self._lock:
+            self.insert_calls.append((table_id, len(rows)))
+            if self.insert_failures:
+                self.insert_failures -= 1
+                return [{'index': 0, 'errors': ['refusé']}]
+            self.tables.setdefault(table_id, []).extend(rows)
+        return []
+
+    def load_table_from_file(self, f, table_id, job_config=None):
+        name = os.path.basename(f.name)
+        rows = [json.loads(line) for line in f.read().decode('utf-8').splitlines() if line]
+        with self._lock:
+            self.load_calls.append(name)
+            error = None
+            if self.load_failures.get(name):
+                self.load_failures[name] -= 1
+                error = RuntimeError(f'job {name} en échec')
+        return FakeLoadJob(self, table_id, rows, error)
+
+
+@pytest.fixture
+def bigquery_client(monkeypatch):
+    """Client factice installé à la place de bigquery.Client"""
+    from scripts import upload_to_bigquery
+    client = FakeBigQueryClient()
+    monkeypatch.setattr(upload_to_bigquery.bigquery, 'Client', lambda project=None: client)
+    return client
@@ -0,0 +1,158 @@
+"""
+Tests du journal de reprise du backfill et des lots écrits par mois
+"""
+import glob
+import json
+import os
+import sys
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import SEGMENT_METRICS_GROUPS
+from scripts import historical_backfill
+from scripts.api_metrics import ApiMetrics
+from scripts.backfill_journal import KIND_SEGMENT, KIND_WEBSITE, BackfillJournal
+from scripts.fake_similarweb_server import start_fake_server
+from scripts.quota_ledger import QuotaBudgetExceededError, QuotaLedger
+from scripts.rate_limiter import TokenBucketRateLimiter
+from scripts.response_cache import ResponseCache
+from scripts.retry_policy import CircuitBreakerRegistry
+from scripts.similarweb_api import SimilarWebAPI
+from scripts.single_flight import SingleFlight
+
+GROUPS = list(SEGMENT_METRICS_GROUPS)
+
+
+def test_journal_reloads_units_and_periods(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = BackfillJournal(path)
+    journal.record(KIND_SEGMENT, '2024-01', {'a': GROUPS, 'b': GROUPS[:1], 'c': []}, file='f.ndjson')
+    journal.mark_period_done('2023-12')
+
+    reloaded = BackfillJournal(path)
+    assert reloaded.pending(KIND_SEGMENT, '2024-01', ['a', 'b', 'c'], GROUPS) == ['b', 'c']
+    assert reloaded.pending(KIND_WEBSITE, '2024-01', ['a'], ['visits']) == ['a']
+    assert reloaded.is_period_done('2023-12')
+    assert not reloaded.is_period_done('2024-01')
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    BackfillJournal(path).record(KIND_SEGMENT, '2024-01', {'a': GROUPS})
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"kind": "segment", "period": "2024-01", "entities": {"b"')
+
+    assert BackfillJournal(path).pending(KIND_SEGMENT, '2024-01', ['a', 'b'], GROUPS) == ['b']
+
+
+def test_reset_keeps_backup(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = BackfillJournal(path)
+    journal.mark_period_done('2024-01')
+    journal.reset()
+
+    assert not journal.is_period_done('2024-01')
+    assert not BackfillJournal(path).is_period_done('2024-01')
+    assert os.path.exists(path + '.bak')
+
+
+def _client(tmp_path, url) -> SimilarWebAPI:
+    return SimilarWebAPI(
+        api_key='test-key', base_url=url,
+        rate_limiter=TokenBucketRateLimiter(rate=1000, burst=1000),
+        cache=ResponseCache(path=str(tmp_path / 'cache.sqlite')),
+        single_flight=SingleFlight(),
+        circuit_breakers=CircuitBreakerRegistry(),
+        quota_ledger=QuotaLedger(path=str(tmp_path / 'quota.sqlite'), monthly_quota=100000, reserve=0),
+        metrics=ApiMetrics()
+    )
+
+
+def _run(client, journal, domains):
+    return historical_backfill.run_backfill(
+        start_year=2024, end_month='2024-01', api_client=client, journal=journal,
+        assume_yes=True, processes=1, max_workers=2, domains=domains)
+
+
+def _written_segments(directory) -> list:
+    rows = []
+    for path in sorted(glob.glob(os.path.join(directory, 'data', 'segments_extraction_202401_*.ndjson'))):
+        with open(path, encoding='utf-8') as f:
+            rows.extend(json.loads(line) for line in f if line.strip())
+    return rows
+
+
+def test_resumed_partial_segment_is_written_once_complete(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server, url = start_fake_server(segments=2)
+    try:
+        client = _client(tmp_path, url)
+        partial_id = client.get_segment_catalog().get_segments()[0]['segment_id']
+        journal = BackfillJournal(str(tmp_path / 'journal.jsonl'))
+
+        # Premier passage : un groupe de métriques du premier segment échoue
+        fetch_group = client._fetch_segment_group
+
+        def failing_group(segment_id, metrics_group, *args, **kwargs):
+            if segment_id == partial_id and metrics_group == GROUPS[-1]:
+                return None
+            return fetch_group(segment_id, metrics_group, *args, **kwargs)
+
+        monkeypatch.setattr(client, '_fetch_segment_group', failing_group)
+        _run(client, journal, ['site00.example'])
+
+        assert partial_id not in [row['segment_id'] for row in _written_segments(tmp_path)]
+        assert not journal.is_period_done('2024-01')
+
+        # Reprise : seul le segment partiel est redemandé, puis écrit complet
+        monkeypatch.setattr(client, '_fetch_segment_group', fetch_group)
+        stats = _run(client, journal, ['site00.example'])
+
+        rows = _written_segments(tmp_path)
+        assert sorted(row['segment_id'] for row in rows) == sorted(
+            s['segment_id'] for s in server.state.segments)
+        resumed = [row for row in rows if row['segment_id'] == partial_id]
+        assert resumed[0]['metric_groups_succeeded'] == GROUPS
+        assert stats['segments_skipped'] == 1
+        assert journal.is_period_done('2024-01')
+        client.close()
+    finally:
+        server.shutdown()
+
+
+def test_sinks_closed_when_budget_stops_scheduler(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server, url = start_fake_server(segments=2)
+    try:
+        client = _client(tmp_path, url)
+        client.get_segment_catalog().get_segments()
+
+        opened, closed = [], []
+        open_period_sink = historical_backfill.open_period_sink
+
+        def tracking_sink(kind, period):
+            sink = open_period_sink(kind, period)
+            close = sink.close
+            sink.close = lambda: closed.append(kind) or close()
+            opened.append(kind)
+            return sink
+
+        calls = []
+        check_budget = client.quota_ledger.check_budget
+
+        def limited_budget(calls_count=1, priority=None):
+            calls.append(1)
+            if len(calls) > 3:
+                raise QuotaBudgetExceededError('budget épuisé')
+            check_budget(calls_count, priority)
+
+        monkeypatch.setattr(historical_backfill, 'open_period_sink', tracking_sink)
+        monkeypatch.setattr(client.quota_ledger, 'check_budget', limited_budget)
+        stats = _run(client, BackfillJournal(str(tmp_path / 'journal.jsonl')),
+                     ['site00.example', 'site01.example'])
+
+        assert stats['paused']
+        assert sorted(closed) == sorted(opened) == [KIND_SEGMENT, KIND_WEBSITE]
+        client.close()
+    finally:
+        server.shutdown()
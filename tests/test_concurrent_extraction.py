@@ -0,0 +1,167 @@
+"""
+Tests de l'extraction concurrente : mêmes enregistrements, dans le même ordre, qu'en séquentiel
+"""
+import os
+import sys
+import threading
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import SEGMENT_METRICS_GROUPS, WEBSITE_METRICS_ENDPOINTS
+from scripts.api_metrics import ApiMetrics
+from scripts.fake_similarweb_server import build_segment_payload, start_fake_server
+from scripts.quota_ledger import QuotaLedger
+from scripts.rate_limiter import TokenBucketRateLimiter
+from scripts.retry_policy import CircuitBreakerRegistry, RetryPolicy
+from scripts.similarweb_api import SimilarWebAPI
+from scripts.single_flight import SingleFlight
+
+
+def _client(tmp_path, url) -> SimilarWebAPI:
+    # Sans cache : chaque extraction refait tous les appels
+    return SimilarWebAPI(
+        api_key='test-key', base_url=url, use_cache=False,
+        rate_limiter=TokenBucketRateLimiter(rate=1000, burst=1000),
+        single_flight=SingleFlight(),
+        circuit_breakers=CircuitBreakerRegistry(),
+        retry_policy=RetryPolicy(max_retries=0),
+        quota_ledger=QuotaLedger(path=str(tmp_path / 'quota.sqlite'), monthly_quota=100000, reserve=0),
+        metrics=ApiMetrics()
+    )
+
+
+class InFlight:
+    """Compte les appels simultanés d'une méthode du client (fail : entités ou couples en échec)"""
+
+    def __init__(self, method, fail=()):
+        self.method = method
+        self.fail = set(fail)
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, entity, unit, *args, **kwargs):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        try:
+            if entity in self.fail or (entity, unit) in self.fail:
+                return None
+            return self.method(entity, unit, *args, **kwargs)
+        finally:
+            with self._lock:
+                self.current -= 1
+
+
+def _expected_points(segment_id, start, end, granularity) -> list:
+    """Points attendus : les métriques de tous les groupes jointes par date"""
+    points = {}
+    for group in SEGMENT_METRICS_GROUPS:
+        params = {'start_date': start, 'end_date': end, 'granularity': granularity, 'metrics': group}
+        for point in build_segment_payload(segment_id, params)[0]['segments']:
+            points.setdefault(point['date'], {}).update(point)
+    return [points[d] for d in sorted(points)]
+
+
+def test_segment_groups_fetched_in_parallel_and_joined_by_date(tmp_path, monkeypatch):
+    # Catalogue de segments persisté sous data/ : isolé par test
+    monkeypatch.chdir(tmp_path)
+    server, url = start_fake_server(segments=1, latency_ms=50)
+    try:
+        client = _client(tmp_path, url)
+        segment_id = client.get_segment_catalog().get_segments()[0]['segment_id']
+        calls = InFlight(client._fetch_segment_group)
+        monkeypatch.setattr(client, '_fetch_segment_group', calls)
+
+        parallel = client.get_segment_data(segment_id, '2024-01-01', '2024-01-10', granularity='daily')
+        assert calls.peak == len(SEGMENT_METRICS_GROUPS)
+
+        calls.peak = 0
+        sequential = client.get_segment_data(segment_id, '2024-01-01', '2024-01-10',
+                                             granularity='daily', parallel_groups=False)
+        assert calls.peak == 1
+        client.close()
+
+        expected = _expected_points(segment_id, '2024-01-01', '2024-01-10', 'daily')
+        assert len(expected) == 10
+        assert parallel['segments'] == sequential['segments'] == expected
+        assert {'visits', 'share', 'bounce_rate', 'pages_per_visit', 'visit_duration',
+                'page_views'} <= set(parallel['segments'][0])
+    finally:
+        server.shutdown()
+
+
+def test_failed_group_keeps_metrics_of_other_groups():
+    params = {'start_date': '2024-01', 'end_date': '2024-02', 'granularity': 'monthly'}
+    visits = build_segment_payload('seg', dict(params, metrics='visits,share'))[0]
+    views = build_segment_payload('seg', dict(params, metrics='page-views'))[0]
+    # Un point sans valeur ne masque pas celle d'un autre groupe
+    views['segments'][0]['confidence'] = None
+    del views['segments'][1]
+
+    combined = SimilarWebAPI._combine_segment_groups([visits, None, views])
+
+    assert [p['date'] for p in combined['segments']] == ['2024-01-01', '2024-02-01']
+    assert 'page_views' in combined['segments'][0] and 'page_views' not in combined['segments'][1]
+    assert combined['segments'][0]['confidence'] == visits['segments'][0]['confidence']
+    assert SimilarWebAPI._combine_segment_groups([None, {'segments': []}]) is None
+
+
+def test_concurrent_segments_match_sequential(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server, url = start_fake_server(segments=12, latency_ms=20)
+    try:
+        client = _client(tmp_path, url)
+        segments = client.get_segment_catalog().get_segments()
+        failed_id = segments[5]['segment_id']
+        calls = InFlight(client._fetch_segment_group, fail=[failed_id])
+        monkeypatch.setattr(client, '_fetch_segment_group', calls)
+
+        sequential = client.extract_all_segments('2024-01', '2024-03', max_workers=1,
+                                                 granularity='monthly')
+        concurrent = client.extract_all_segments('2024-01', '2024-03', max_workers=8,
+                                                 granularity='monthly')
+        client.close()
+
+        assert calls.peak > len(SEGMENT_METRICS_GROUPS)
+        assert [r['segment_id'] for r in concurrent] == [s['segment_id'] for s in segments]
+        # Seul le mode concurrent indique les groupes réussis (reprise du backfill)
+        for record in concurrent:
+            groups = record.pop('metric_groups_succeeded')
+            assert groups == ([] if record['segment_id'] == failed_id else SEGMENT_METRICS_GROUPS)
+        assert concurrent == sequential
+        assert [r['segment_id'] for r in concurrent if r.get('error')] == [failed_id]
+        assert server.state.snapshot()['by_family']['segment_query'] == 2 * 11 * len(SEGMENT_METRICS_GROUPS)
+    finally:
+        server.shutdown()
+
+
+def test_concurrent_websites_match_sequential(tmp_path, monkeypatch):
+    server, url = start_fake_server(segments=1, latency_ms=20)
+    try:
+        client = _client(tmp_path, url)
+        domains = [f'site{i:02d}.example' for i in range(6)]
+        calls = InFlight(client.get_website_metric,
+                         fail=[('site02.example', WEBSITE_METRICS_ENDPOINTS['bounce_rate'])])
+        monkeypatch.setattr(client, 'get_website_metric', calls)
+
+        sequential = client.extract_all_websites(domains, '2024-01', '2024-03', max_workers=1,
+                                                 granularity='monthly')
+        concurrent = client.extract_all_websites(domains, '2024-01', '2024-03', max_workers=8,
+                                                 granularity='monthly')
+        client.close()
+
+        assert calls.peak > 1
+        assert concurrent == sequential
+        assert [r['domain'] for r in concurrent] == domains
+        for record in concurrent:
+            assert list(record['metrics']) == list(WEBSITE_METRICS_ENDPOINTS)
+            assert record['endpoints_total'] == len(WEBSITE_METRICS_ENDPOINTS)
+        failed = concurrent[2]
+        assert failed['metrics']['bounce_rate'] is None
+        assert failed['endpoints_succeeded'] == len(WEBSITE_METRICS_ENDPOINTS) - 1
+        assert all(r['endpoints_succeeded'] == len(WEBSITE_METRICS_ENDPOINTS)
+                   for r in concurrent if r is not failed)
+        assert concurrent[0]['metrics']['visits']['visits']
+    finally:
+        server.shutdown()
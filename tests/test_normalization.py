@@ -0,0 +1,147 @@
+"""
+Tests de parité de la normalisation avec les lignes de l'uploader d'origine
+"""
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import WEBSITE_METRICS_ENDPOINTS
+from scripts.fake_similarweb_server import build_segment_payload, build_website_payload
+from scripts.normalization import (ENTITY_SEGMENT, ENTITY_WEBSITE, frame_to_rows,
+                                   normalize_records)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Dernier commit avant la normalisation : lignes construites par l'uploader lui-même
+BASELINE = 'c6504b1'
+EXTRACTION_DATE = '2024-06-01'
+
+
+@pytest.fixture(scope='module')
+def legacy_uploader(tmp_path_factory):
+    """Uploader d'origine chargé depuis git, sans client BigQuery"""
+    try:
+        source = subprocess.run(['git', 'show', f'{BASELINE}:scripts/upload_to_bigquery.py'],
+                                cwd=ROOT, capture_output=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip(f"uploader d'origine ({BASELINE}) indisponible")
+    path = tmp_path_factory.mktemp('legacy') / 'legacy_upload_to_bigquery.py'
+    path.write_bytes(source)
+    spec = importlib.util.spec_from_file_location('legacy_upload_to_bigquery', str(path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return object.__new__(module.BigQueryDailyUploader)
+
+
+def _legacy_rows(process, records, tmp_path) -> list:
+    path = tmp_path / 'records.json'
+    path.write_text(json.dumps(records), encoding='utf-8')
+    rows = process(str(path))
+    for row in rows:
+        row['extraction_date'] = EXTRACTION_DATE
+    return rows
+
+
+def _rows(kind, records) -> list:
+    return frame_to_rows(normalize_records(kind, records, extraction_date=EXTRACTION_DATE))
+
+
+def _segment_record(segment_id, start, end, granularity) -> dict:
+    params = {'start_date': start, 'end_date': end, 'granularity': granularity,
+              'metrics': 'visits,share,bounce-rate,pages-per-visit'}
+    payload, _ = build_segment_payload(segment_id, params)
+    return {'segment_id': segment_id, 'segment_name': f'Segment {segment_id}',
+            'extraction_granularity': granularity, 'data': payload}
+
+
+def _website_record(domain, start, end, granularity) -> dict:
+    params = {'start_date': start, 'end_date': end, 'granularity': granularity}
+    metrics = {name: build_website_payload(domain, endpoint, params)[0]
+               for name, endpoint in WEBSITE_METRICS_ENDPOINTS.items()}
+    return {'domain': domain, 'extraction_granularity': granularity, 'metrics': metrics}
+
+
+def segment_records() -> list:
+    records = [
+        _segment_record('seg-daily', '2024-01-01', '2024-02-15', 'daily'),
+        _segment_record('seg-monthly', '2023-01', '2023-12', 'monthly'),
+    ]
+    points = records[0]['data']['segments']
+    # Lignes écartées (ni visites ni part de marché), valeurs et confidence absentes
+    points[0].update(visits=0, share=0)
+    points[1].update(visits=None, share=0.2, bounce_rate=None)
+    del points[2]['confidence']
+    points[3]['confidence'] = 'high'
+    # Mois incomplet en journalier, date vide
+    points[4]['date'] = '2024-01'
+    points[5]['date'] = ''
+    # Mois abrégés en mensuel, complétés au 1er
+    for point in records[1]['data']['segments']:
+        point['date'] = point['date'][:7]
+    records.append({'segment_id': 'seg-error', 'error': 'HTTP 500', 'data': None})
+    return records
+
+
+def website_records() -> list:
+    records = [
+        _website_record('daily.example', '2024-01-01', '2024-03-31', 'daily'),
+        _website_record('monthly.example', '2023-01', '2023-12', 'monthly'),
+        _website_record('partial.example', '2024-01-01', '2024-01-20', 'daily'),
+    ]
+    daily = records[0]['metrics']
+    # Confidence des visites absente : reprise de la première métrique jointe
+    del daily['visits']['visits'][0]['confidence']
+    del daily['visits']['visits'][1]['confidence']
+    del daily['bounce_rate']['bounce_rate'][1]['confidence']
+    # Point joint sans valeur, point de split sans mobile, dates sans métrique jointe
+    daily['page_views']['page_views'][2]['page_views'] = None
+    daily['desktop_mobile_split']['data'][3]['data'].pop()
+    daily['pages_per_visit']['pages_per_visit'] = daily['pages_per_visit']['pages_per_visit'][10:]
+    # Métriques jointes au mois quand la série des visites est journalière
+    for point in daily['avg_visit_duration']['avg_visit_duration'][:31]:
+        point['date'] = '2024-01'
+    # Point du mois placé avant les points du jour : le premier de la série l'emporte
+    daily['bounce_rate']['bounce_rate'].insert(0, {'date': '2024-02', 'bounce_rate': 0.5, 'confidence': 0.7})
+    # Séries mensuelles abrégées, y compris celle des visites
+    for name, metric in records[1]['metrics'].items():
+        for point in metric['data' if name == 'desktop_mobile_split' else name]:
+            point['date'] = point['date'][:7]
+    partial = records[2]['metrics']
+    partial['bounce_rate'] = None
+    partial['desktop_mobile_split'] = None
+    partial['visits']['visits'][4]['date'] = '2024-01'
+    records += [
+        {'domain': 'failed.example', 'metrics': {'visits': None}},
+        {'domain': 'empty.example', 'metrics': {}},
+    ]
+    return records
+
+
+def test_segment_rows_match_legacy_uploader(legacy_uploader, tmp_path):
+    records = segment_records()
+    expected = _legacy_rows(legacy_uploader._process_segments_file_daily, records, tmp_path)
+
+    assert expected
+    assert _rows(ENTITY_SEGMENT, records) == expected
+
+
+def test_website_rows_match_legacy_uploader(legacy_uploader, tmp_path):
+    records = website_records()
+    expected = _legacy_rows(legacy_uploader._process_websites_file_daily, records, tmp_path)
+    rows = _rows(ENTITY_WEBSITE, records)
+
+    # L'ancien uploader envoyait en chaîne la confidence reprise d'une métrique jointe ;
+    # elle est désormais toujours un float, de même valeur une fois chargée en FLOAT
+    joined = [row for row in expected if isinstance(row['confidence'], str)]
+    assert joined
+    for row in joined:
+        row['confidence'] = float(row['confidence'])
+
+    assert len(expected) > 100
+    assert rows == expected
+    assert all(isinstance(row['confidence'], float) for row in rows)
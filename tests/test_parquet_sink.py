@@ -0,0 +1,43 @@
+"""
+Tests du sink Parquet : confidences de segments très variées dans une même partition
+"""
+import os
+import sys
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.parquet_sink import ParquetResultSink, read_normalized, read_parquet_rows
+
+
+def _segment_record(index: int, days: int = 31) -> dict:
+    """Segment d'un mois de points journaliers, une confidence distincte par point"""
+    return {
+        'segment_id': f'seg-{index}',
+        'segment_name': f'Segment {index}',
+        'extraction_granularity': 'daily',
+        'data': {'segments': [
+            {'date': f'2024-01-{day:02d}', 'visits': 100 + day, 'share': 0.1,
+             'confidence': round(0.5 + (index * days + day) / 10000, 4)}
+            for day in range(1, days + 1)
+        ]}
+    }
+
+
+def test_more_than_128_distinct_confidences_in_one_partition(tmp_path):
+    sink = ParquetResultSink('segment', directory=str(tmp_path), granularity='daily')
+    sink.write_many([_segment_record(i) for i in range(5)])
+    files = sink.close()
+
+    assert len(files) == 1
+    path = os.path.join(str(tmp_path), files[0])
+    assert pq.read_schema(path).field('confidence').type == pa.dictionary(pa.int32(), pa.string())
+
+    rows = read_parquet_rows(path, 'segment')
+    assert len(rows) == 5 * 31
+    assert len({row['confidence'] for row in rows}) == 5 * 31
+
+    frame = read_normalized('segment', '2024-01-01', '2024-01-31', directory=str(tmp_path))
+    assert len(frame) == 5 * 31
@@ -0,0 +1,114 @@
+"""
+Tests du registre des appels API : écriture groupée, budget par priorité et estimation hors cache
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import WEBSITE_METRICS_ENDPOINTS
+from scripts.api_metrics import ApiMetrics
+from scripts.daily_extraction import (estimate_extraction_calls, extract_periods,
+                                      get_date_range_for_extraction)
+from scripts.fake_similarweb_server import start_fake_server
+from scripts.quota_ledger import (PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL,
+                                  QuotaBudgetExceededError, QuotaLedger)
+from scripts.rate_limiter import TokenBucketRateLimiter
+from scripts.response_cache import ResponseCache
+from scripts.retry_policy import CircuitBreakerRegistry
+from scripts.similarweb_api import SimilarWebAPI
+from scripts.single_flight import SingleFlight
+
+
+def _ledger(tmp_path, **options) -> QuotaLedger:
+    options.setdefault('flush_seconds', 3600)
+    return QuotaLedger(path=str(tmp_path / 'quota.sqlite'), **options)
+
+
+def _rows(tmp_path) -> int:
+    with sqlite3.connect(str(tmp_path / 'quota.sqlite')) as conn:
+        return conn.execute('SELECT COUNT(*) FROM api_calls').fetchone()[0]
+
+
+def test_calls_are_written_in_batches(tmp_path):
+    ledger = _ledger(tmp_path, flush_rows=3)
+    ledger.record('/website/a', 'website_visits', 200, cost=1)
+    ledger.record('/website/a', 'website_visits', 200, cost=1)
+    assert _rows(tmp_path) == 0
+
+    ledger.record('/website/a', 'website_visits', 200, cost=1)
+    assert _rows(tmp_path) == 3
+
+    ledger.record('/website/a', 'website_visits', 200, cached=True)
+    ledger.flush()
+    assert _rows(tmp_path) == 4
+    assert ledger.summary()['by_family']['website_visits'] == {
+        'calls': 4, 'cost': 3, 'bytes': 0, 'cached': 1}
+
+
+def test_used_counts_pending_calls(tmp_path):
+    ledger = _ledger(tmp_path, flush_rows=100)
+    assert ledger.used() == 0
+    for _ in range(5):
+        ledger.record('/segment/s/query', 'segment_query', 200, cost=1)
+
+    assert _rows(tmp_path) == 0
+    assert ledger.used() == 5
+
+
+def test_used_sees_other_processes_after_refresh(tmp_path):
+    ledger = _ledger(tmp_path, refresh_seconds=0)
+    other = _ledger(tmp_path, flush_rows=1)
+    assert ledger.used() == 0
+
+    other.record('/segment/s/query', 'segment_query', 200, cost=2)
+    assert ledger.used() == 2
+
+
+def test_budget_keeps_reserve_for_daily_automation(tmp_path):
+    ledger = _ledger(tmp_path, monthly_quota=10, reserve=4)
+    for _ in range(5):
+        ledger.record('/segment/s/query', 'segment_query', 200, cost=1)
+
+    # 5 restants : low s'arrête à la réserve, normal va jusqu'au quota, high n'est jamais bloquée
+    assert ledger.can_spend(1, PRIORITY_LOW)
+    assert not ledger.can_spend(2, PRIORITY_LOW)
+    assert ledger.can_spend(5, PRIORITY_NORMAL)
+    assert not ledger.can_spend(6, PRIORITY_NORMAL)
+    assert ledger.can_spend(100, PRIORITY_HIGH)
+
+    with pytest.raises(QuotaBudgetExceededError):
+        ledger.check_budget(2, PRIORITY_LOW)
+    ledger.check_budget(100, PRIORITY_HIGH)
+
+
+def test_estimate_skips_calls_served_by_cache(tmp_path):
+    server, url = start_fake_server(segments=1)
+    try:
+        client = SimilarWebAPI(
+            api_key='test-key', base_url=url,
+            rate_limiter=TokenBucketRateLimiter(rate=1000, burst=1000),
+            cache=ResponseCache(path=str(tmp_path / 'cache.sqlite')),
+            single_flight=SingleFlight(),
+            circuit_breakers=CircuitBreakerRegistry(),
+            quota_ledger=_ledger(tmp_path),
+            metrics=ApiMetrics()
+        )
+        periods = get_date_range_for_extraction('2024-01-01', '2024-01-10', 'daily')
+        domains = ['site00.example', 'site01.example']
+
+        assert estimate_extraction_calls(client, periods, segments=False, domains=domains) == \
+            len(domains) * len(WEBSITE_METRICS_ENDPOINTS)
+
+        extract_periods(client, periods, segments=False, domains=domains, max_workers=2)
+        # Relance d'une extraction terminée : tout vient du cache
+        assert estimate_extraction_calls(client, periods, segments=False, domains=domains) == 0
+        assert estimate_extraction_calls(client, periods, segments=False,
+                                         domains=domains + ['site02.example']) == \
+            len(WEBSITE_METRICS_ENDPOINTS)
+        client.close()
+    finally:
+        server.shutdown()
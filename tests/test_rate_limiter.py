@@ -0,0 +1,128 @@
+"""
+Tests du token bucket adaptatif : rafale, Retry-After, AIMD et partage entre processus
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.api_metrics import ApiMetrics
+from scripts.fake_similarweb_server import start_fake_server
+from scripts.quota_ledger import QuotaLedger
+from scripts.rate_limiter import FileLockedRateLimiter, TokenBucketRateLimiter, parse_retry_after
+from scripts.retry_policy import CircuitBreakerRegistry, RetryPolicy
+from scripts.similarweb_api import SimilarWebAPI
+from scripts.single_flight import SingleFlight
+
+PARAMS = {'start_date': '2024-01', 'end_date': '2024-01', 'granularity': 'monthly'}
+
+
+def test_parse_retry_after_seconds_and_http_date():
+    assert parse_retry_after('2.5') == 2.5
+    assert parse_retry_after('-3') == 0
+    in_ten = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=10), usegmt=True)
+    assert 8 < parse_retry_after(in_ten) <= 10
+    assert parse_retry_after('bientôt') is None
+    assert parse_retry_after(None) is None
+
+
+def test_burst_then_calls_are_spaced_by_rate():
+    limiter = TokenBucketRateLimiter(rate=10, burst=3, min_rate=1, max_rate=10)
+    assert [limiter.reserve() for _ in range(3)] == [0, 0, 0]
+    # Chaque réservation au-delà de la rafale attend un jeton de plus
+    assert limiter.reserve() == pytest.approx(0.1, abs=0.02)
+    assert limiter.reserve() == pytest.approx(0.2, abs=0.02)
+
+
+def test_rate_limited_halves_rate_down_to_floor_and_blocks():
+    limiter = TokenBucketRateLimiter(rate=8, burst=5, min_rate=1, max_rate=10, decrease_factor=0.5)
+    assert limiter.on_rate_limited({'Retry-After': '0.3'}) == 0.3
+    assert limiter.rate == 4
+    # Jetons restants ou non, rien ne part avant le Retry-After
+    assert 0.25 < limiter.reserve() <= 0.3
+
+    for _ in range(5):
+        limiter.on_rate_limited({'Retry-After': '0'})
+    assert limiter.rate == 1
+    assert limiter.snapshot()['throttled_count'] == 6
+
+
+def test_success_raises_rate_once_per_interval_up_to_ceiling():
+    limiter = TokenBucketRateLimiter(rate=2, burst=1, min_rate=1, max_rate=3,
+                                     increase_step=1, increase_interval=0.05)
+    limiter.on_success()
+    assert limiter.rate == 2
+
+    time.sleep(0.06)
+    limiter.on_success()
+    limiter.on_success()
+    assert limiter.rate == 3
+
+    time.sleep(0.06)
+    limiter.on_success()
+    assert limiter.rate == 3
+
+
+def test_exhausted_window_blocks_until_reset():
+    limiter = TokenBucketRateLimiter(rate=100, burst=10)
+    limiter.on_success({'X-RateLimit-Remaining': '5', 'X-RateLimit-Reset': '30'})
+    assert limiter.available_in() == 0
+
+    limiter.on_success({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '0.2'})
+    assert 0.15 < limiter.available_in() <= 0.2
+
+    # Reset donné en timestamp epoch
+    epoch = TokenBucketRateLimiter(rate=100, burst=10)
+    epoch.on_success({'RateLimit-Remaining': '0', 'RateLimit-Reset': str(time.time() + 5)})
+    assert 4 < epoch.available_in() <= 5
+
+
+def test_file_locked_limiters_share_bucket(tmp_path):
+    path = str(tmp_path / 'limiter.json')
+    options = dict(rate=10, burst=2, min_rate=1, max_rate=10, decrease_factor=0.5)
+    first = FileLockedRateLimiter(path, **options)
+    second = FileLockedRateLimiter(path, **options)
+
+    assert first.reserve() == 0
+    assert second.reserve() == 0
+    # Rafale commune épuisée : le premier attend aussi
+    assert first.reserve() > 0
+
+    # Un 429 vu par un processus ralentit les autres
+    second.on_rate_limited({'Retry-After': '1'})
+    state = first.snapshot()
+    assert state['rate'] == 5
+    assert state['blocked_for'] > 0.9
+
+
+def test_client_adapts_to_server_rate_limit(tmp_path):
+    server, url = start_fake_server(segments=1, rate_limit=20, burst=2)
+    try:
+        limiter = TokenBucketRateLimiter(rate=200, burst=20, min_rate=1, max_rate=200,
+                                         decrease_factor=0.5)
+        client = SimilarWebAPI(
+            api_key='test-key', base_url=url, use_cache=False,
+            rate_limiter=limiter,
+            single_flight=SingleFlight(),
+            retry_policy=RetryPolicy(max_retries=10),
+            circuit_breakers=CircuitBreakerRegistry(),
+            quota_ledger=QuotaLedger(path=str(tmp_path / 'quota.sqlite')),
+            metrics=ApiMetrics()
+        )
+        for i in range(30):
+            endpoint = f'/website/site{i:02d}.example/total-traffic-and-engagement/visits'
+            assert client._make_request(endpoint, PARAMS) is not None
+        client.close()
+
+        stats = server.state.snapshot()
+        assert stats['ok'] == 30
+        assert stats['throttled'] > 0
+        assert limiter.snapshot()['throttled_count'] == stats['throttled']
+        assert limiter.rate < 200
+    finally:
+        server.shutdown()
@@ -0,0 +1,50 @@
+"""
+Tests du catalogue de segments : un seul describe par expiration
+"""
+import os
+import sys
+import threading
+import time
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.segment_catalog import SegmentCatalog
+
+
+def test_concurrent_stale_callers_share_one_describe(tmp_path):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return [{'segment_id': 'a', 'segment_name': 'A'}]
+
+    catalog = SegmentCatalog(fetch=fetch, path=str(tmp_path / 'catalog.json'))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(catalog.get_segments()))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result == [{'segment_id': 'a', 'segment_name': 'A'}] for result in results)
+
+
+def test_catalog_persisted_between_instances(tmp_path):
+    path = str(tmp_path / 'catalog.json')
+    SegmentCatalog(fetch=lambda: [{'segment_id': 'a'}], path=path).get_segments()
+
+    def fail():
+        raise AssertionError("describe ne doit pas être appelé")
+
+    assert SegmentCatalog(fetch=fail, path=path).get_segments() == [{'segment_id': 'a'}]
+
+
+def test_failed_describe_keeps_stale_catalog(tmp_path):
+    path = str(tmp_path / 'catalog.json')
+    SegmentCatalog(fetch=lambda: [{'segment_id': 'a'}], path=path).get_segments()
+
+    stale = SegmentCatalog(fetch=lambda: None, path=path, ttl=0)
+    assert stale.get_segments() == [{'segment_id': 'a'}]
@@ -0,0 +1,124 @@
+"""
+Tests du single-flight et de la clé de cache : une requête identique, un seul appel par hôte
+"""
+import os
+import sys
+import threading
+import time
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.api_metrics import ApiMetrics
+from scripts.fake_similarweb_server import start_fake_server
+from scripts.quota_ledger import QuotaBudgetExceededError, QuotaLedger
+from scripts.rate_limiter import TokenBucketRateLimiter
+from scripts.response_cache import ResponseCache
+from scripts.retry_policy import CircuitBreakerRegistry
+from scripts.similarweb_api import SimilarWebAPI
+from scripts.single_flight import SingleFlight
+
+PARAMS = {'start_date': '2024-01', 'end_date': '2024-01', 'granularity': 'monthly'}
+ENDPOINT = '/website/site00.example/total-traffic-and-engagement/visits'
+
+
+def _client(tmp_path, base_url, cache=None, single_flight=None) -> SimilarWebAPI:
+    """Client isolé : cache, registre, circuits et limiteur propres au test"""
+    return SimilarWebAPI(
+        api_key='test-key', base_url=base_url,
+        rate_limiter=TokenBucketRateLimiter(rate=1000, burst=1000),
+        cache=cache or ResponseCache(path=str(tmp_path / 'cache.sqlite')),
+        single_flight=single_flight or SingleFlight(),
+        circuit_breakers=CircuitBreakerRegistry(),
+        quota_ledger=QuotaLedger(path=str(tmp_path / 'quota.sqlite'), flush_rows=1),
+        metrics=ApiMetrics()
+    )
+
+
+def _run_threads(target, count: int) -> list:
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_callers_share_one_call():
+    group = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'ok': True}
+
+    results = _run_threads(lambda: group.do('k', fn), 6)
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert group.stats() == {'shared': 5, 'in_flight': 0}
+
+
+def test_leader_error_is_shared_unless_retry_on():
+    group = SingleFlight()
+    started = threading.Event()
+
+    def leader():
+        started.set()
+        time.sleep(0.1)
+        raise QuotaBudgetExceededError('budget')
+
+    errors = []
+
+    def run_leader():
+        try:
+            group.do('k', leader)
+        except QuotaBudgetExceededError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run_leader)
+    thread.start()
+    started.wait()
+
+    # Le budget refusé au premier appelant ne vaut pas pour celui-ci : il relance sa fonction
+    assert group.do('k', lambda: 'mine', retry_on=(QuotaBudgetExceededError,)) == 'mine'
+    thread.join()
+    assert len(errors) == 1
+
+
+def test_cache_key_includes_base_url():
+    key = ResponseCache.make_key(ENDPOINT, PARAMS, 'https://api.similarweb.com/v1')
+    assert key == ResponseCache.make_key(ENDPOINT, dict(PARAMS, api_key='x'),
+                                         'https://api.similarweb.com/v1/')
+    assert key != ResponseCache.make_key(ENDPOINT, PARAMS, 'http://127.0.0.1:8765/v1')
+
+
+def test_identical_requests_reach_server_once(tmp_path):
+    server, url = start_fake_server(segments=2, latency_ms=100, latency_jitter=0)
+    try:
+        client = _client(tmp_path, url)
+        results = _run_threads(lambda: client._make_request(ENDPOINT, PARAMS), 5)
+        client.close()
+
+        assert server.state.snapshot()['ok'] == 1
+        assert all(result is results[0] and result is not None for result in results)
+    finally:
+        server.shutdown()
+
+
+def test_cache_not_shared_between_hosts(tmp_path):
+    first, first_url = start_fake_server(segments=2)
+    second, second_url = start_fake_server(segments=2)
+    try:
+        cache = ResponseCache(path=str(tmp_path / 'cache.sqlite'))
+        group = SingleFlight()
+        for url in (first_url, second_url, first_url):
+            _client(tmp_path, url, cache=cache, single_flight=group)._make_request(ENDPOINT, PARAMS)
+
+        assert first.state.snapshot()['ok'] == 1
+        assert second.state.snapshot()['ok'] == 1
+        assert cache.hits == 1
+    finally:
+        first.shutdown()
+        second.shutdown()
@@ -0,0 +1,130 @@
+"""
+Tests de l'ordonnanceur : priorités, échéances, ordre des enregistrements et arrêt sur budget
+"""
+import os
+import random
+import sys
+import threading
+import time
+
+import pytest
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.quota_ledger import (PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL,
+                                  QuotaBudgetExceededError)
+from scripts.task_scheduler import TaskScheduler
+
+
+def _build(entity, payloads) -> dict:
+    return {'entity': entity, 'payloads': payloads}
+
+
+class Calls:
+    """fetch() qui enregistre l'ordre des appels"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.order = []
+        self._lock = threading.Lock()
+
+    def __call__(self, entity, unit):
+        with self._lock:
+            self.order.append((entity, unit))
+        if self.delay:
+            time.sleep(random.uniform(0, self.delay))
+        return f'{entity}:{unit}'
+
+
+def test_tasks_served_by_priority_then_deadline_then_insertion():
+    scheduler = TaskScheduler(max_workers=1)
+    calls = Calls()
+    later = time.time() + 60
+    sooner = time.time() + 30
+
+    scheduler.add_job('segment', 'p', ['low'], ['u'], calls, _build, priority=PRIORITY_LOW)
+    scheduler.add_job('segment', 'p', ['normal-1', 'normal-2'], ['u'], calls, _build)
+    scheduler.add_job('segment', 'p', ['normal-late'], ['u'], calls, _build, deadline=later)
+    scheduler.add_job('segment', 'p', ['normal-soon'], ['u'], calls, _build, deadline=sooner)
+    scheduler.add_job('website', 'p', ['high'], ['a', 'b'], calls, _build, priority=PRIORITY_HIGH)
+    scheduler.run()
+
+    assert calls.order == [('high', 'a'), ('high', 'b'), ('normal-soon', 'u'), ('normal-late', 'u'),
+                           ('normal-1', 'u'), ('normal-2', 'u'), ('low', 'u')]
+    assert scheduler.stats['completed'] == 7
+
+
+def test_expired_tasks_are_dropped_without_calling():
+    scheduler = TaskScheduler(max_workers=2)
+    calls = Calls()
+    expired = scheduler.add_job('segment', 'p', ['old'], ['a', 'b'], calls, _build,
+                                deadline=time.time() - 1)
+    fresh = scheduler.add_job('segment', 'p', ['new'], ['a'], calls, _build,
+                              deadline=time.time() + 60)
+    results = scheduler.run()
+
+    assert calls.order == [('new', 'a')]
+    assert results[expired] == [{'entity': 'old', 'payloads': {'a': None, 'b': None}}]
+    assert results[fresh] == [{'entity': 'new', 'payloads': {'a': 'new:a'}}]
+    assert scheduler.stats['expired'] == 2
+
+
+def test_results_keep_entity_and_unit_order_under_concurrency():
+    scheduler = TaskScheduler(max_workers=8)
+    entities = [f'e{i:02d}' for i in range(20)]
+    units = ['u1', 'u2', 'u3']
+    key = scheduler.add_job('segment', 'p', entities, units, Calls(delay=0.01), _build)
+    results = scheduler.run()[key]
+
+    assert [r['entity'] for r in results] == entities
+    assert all(list(r['payloads']) == units for r in results)
+    assert results[7]['payloads']['u2'] == 'e07:u2'
+
+
+def test_failed_calls_give_none_and_on_done_receives_records():
+    scheduler = TaskScheduler(max_workers=2)
+    done = []
+
+    def fetch(entity, unit):
+        if unit == 'bad':
+            raise ValueError('réponse illisible')
+        return {'unit': unit} if entity != 'empty' else None
+
+    key = scheduler.add_job('website', 'p', ['site', 'empty'], ['ok', 'bad'], fetch, _build,
+                            on_done=done.append)
+    results = scheduler.run()
+
+    # Enregistrements remis à on_done, pas conservés pour run()
+    assert key not in results
+    assert done == [[{'entity': 'site', 'payloads': {'ok': {'unit': 'ok'}, 'bad': None}},
+                     {'entity': 'empty', 'payloads': {'ok': None, 'bad': None}}]]
+    assert scheduler.stats['completed'] == 1
+    assert scheduler.stats['failed'] == 3
+
+
+def test_budget_exhaustion_stops_queue_and_is_raised():
+    scheduler = TaskScheduler(max_workers=1)
+    calls = []
+
+    def fetch(entity, unit):
+        calls.append(entity)
+        if len(calls) == 3:
+            raise QuotaBudgetExceededError('budget épuisé')
+        return 'ok'
+
+    scheduler.add_job('segment', 'p', [f'e{i}' for i in range(10)], ['u'], fetch, _build)
+    with pytest.raises(QuotaBudgetExceededError):
+        scheduler.run()
+
+    assert calls == ['e0', 'e1', 'e2']
+    assert scheduler.stats['cancelled'] == 7
+    assert scheduler.pending() == 0
+
+
+def test_unknown_priority_and_empty_job():
+    scheduler = TaskScheduler()
+    with pytest.raises(ValueError):
+        scheduler.add_job('segment', 'p', ['a'], ['u'], Calls(), _build, priority='urgent')
+
+    key = scheduler.add_job('segment', 'p', [], ['u'], Calls(), _build, priority=PRIORITY_NORMAL)
+    assert scheduler.run() == {key: []}
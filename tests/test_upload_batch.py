@@ -0,0 +1,74 @@
+"""
+Tests de l'upload par jobs de chargement : lots renvoyés seuls, registre par fichier source
+"""
+import os
+import sys
+from collections import Counter
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.retry_policy import RetryPolicy
+from scripts.upload_ledger import UploadLedger
+from scripts.upload_to_bigquery import BigQueryDailyUploader
+from tests.test_upload_ledger import write_segments
+
+TABLE = 'projet.similar_web_data.segments_data'
+PATTERNS = {'segments': ('data/segments_*.json', None)}
+
+
+def _uploader(tmp_path, monkeypatch) -> BigQueryDailyUploader:
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    # Pas d'attente entre deux tentatives
+    monkeypatch.setattr(RetryPolicy, 'backoff', lambda self, attempt: 0)
+    return BigQueryDailyUploader('projet', ledger=UploadLedger(str(tmp_path / 'ledger.sqlite')))
+
+
+def _keys(rows) -> Counter:
+    return Counter((row['segment_id'], row['date']) for row in rows)
+
+
+def test_failed_chunk_is_retried_alone(tmp_path, monkeypatch, bigquery_client):
+    uploader = _uploader(tmp_path, monkeypatch)
+    for i in range(3):
+        write_segments(f'data/segments_{i}.json', [f'seg{i}'])
+    bigquery_client.load_failures['segments_0002.ndjson'] = 1
+
+    uploaded = uploader.upload_batch(kinds=('segments',), source='raw', patterns=PATTERNS,
+                                     chunk_rows=10, max_workers=3, retries=2)
+
+    assert uploaded == {'segments': 30}
+    assert Counter(bigquery_client.load_calls) == {
+        'segments_0001.ndjson': 1, 'segments_0002.ndjson': 2, 'segments_0003.ndjson': 1}
+    assert max(_keys(bigquery_client.tables[TABLE]).values()) == 1
+    assert uploader.ledger.summary()['tables'][TABLE]['files'] == 3
+    uploader.ledger.close()
+
+
+def test_source_recorded_only_when_all_its_chunks_loaded(tmp_path, monkeypatch, bigquery_client):
+    uploader = _uploader(tmp_path, monkeypatch)
+    write_segments('data/segments_1.json', ['a'])
+    write_segments('data/segments_2.json', ['b'])
+    # 15 lignes par lot : le second fichier est réparti sur les deux lots
+    bigquery_client.load_failures['segments_0002.ndjson'] = 10
+
+    uploaded = uploader.upload_batch(kinds=('segments',), source='raw', patterns=PATTERNS,
+                                     chunk_rows=15, max_workers=2, retries=1)
+
+    assert uploaded == {'segments': 15}
+    assert bigquery_client.load_calls.count('segments_0002.ndjson') == 2
+    assert uploader.ledger.check('data/segments_1.json', TABLE) == (False, None)
+    assert uploader.ledger.check('data/segments_2.json', TABLE)[0]
+
+    # Passage suivant : seul le second fichier est relu, sans doublon des lignes déjà chargées
+    bigquery_client.load_failures.clear()
+    bigquery_client.load_calls.clear()
+    uploaded = uploader.upload_batch(kinds=('segments',), source='raw', patterns=PATTERNS,
+                                     chunk_rows=15, max_workers=2, retries=1)
+
+    assert uploaded == {'segments': 5}
+    assert bigquery_client.load_calls == ['segments_0001.ndjson']
+    keys = _keys(bigquery_client.tables[TABLE])
+    assert len(keys) == 20 and max(keys.values()) == 1
+    assert not uploader.ledger.check('data/segments_2.json', TABLE)[0]
+    uploader.ledger.close()
@@ -0,0 +1,73 @@
+"""
+Tests du registre des fichiers chargés : fichiers inchangés ignorés, fichiers modifiés retraités
+"""
+import json
+import os
+import sys
+
+# Ajouter le chemin parent pour importer les modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.fake_similarweb_server import build_segment_payload
+from scripts.upload_ledger import UploadLedger
+from scripts.upload_to_bigquery import BigQueryDailyUploader
+
+TABLE = 'projet.similar_web_data.segments_data'
+
+
+def write_segments(path, segment_ids, end_date='2024-01-10') -> str:
+    params = {'start_date': '2024-01-01', 'end_date': end_date, 'granularity': 'daily',
+              'metrics': 'visits,share'}
+    records = [{'segment_id': segment_id, 'segment_name': segment_id, 'extraction_granularity': 'daily',
+                'data': build_segment_payload(segment_id, params)[0]} for segment_id in segment_ids]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(records, f)
+    return str(path)
+
+
+def test_unchanged_file_is_skipped_and_changed_file_reprocessed(tmp_path):
+    path = write_segments(tmp_path / 'segments_1.json', ['a'])
+    ledger = UploadLedger(str(tmp_path / 'ledger.sqlite'))
+
+    to_process, fingerprint = ledger.check(path, TABLE)
+    assert to_process
+    ledger.record(path, TABLE, fingerprint, rows_processed=10, rows_uploaded=10)
+    assert ledger.check(path, TABLE) == (False, None)
+    # Autre table : le fichier reste à charger
+    assert ledger.check(path, 'projet.similar_web_data.websites_data')[0]
+
+    # Fichier touché sans changement de contenu : toujours ignoré
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert ledger.check(path, TABLE) == (False, None)
+
+    write_segments(path, ['a', 'b'])
+    to_process, fingerprint = ledger.check(path, TABLE)
+    assert to_process and fingerprint['size'] == os.path.getsize(path)
+
+    reloaded = UploadLedger(str(tmp_path / 'ledger.sqlite'))
+    assert reloaded.summary()['tables'] == {TABLE: {'files': 1, 'rows_processed': 10, 'rows_uploaded': 10}}
+    assert reloaded.forget(TABLE) == 1
+    assert reloaded.check(str(tmp_path / 'segments_1.json'), TABLE)[0]
+
+
+def test_streaming_upload_skips_loaded_files(tmp_path, monkeypatch, bigquery_client):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    write_segments('data/segments_1.json', ['a'])
+    write_segments('data/segments_2.json', ['b'])
+    uploader = BigQueryDailyUploader('projet', ledger=UploadLedger(str(tmp_path / 'ledger.sqlite')))
+    table_id = 'projet.similar_web_data.segments_data'
+
+    # Premier insert refusé : ce fichier n'entre pas au registre
+    bigquery_client.insert_failures = 1
+    assert uploader.upload_segments(source='raw') == 10
+    assert uploader.upload_segments(source='raw') == 10
+    assert len(bigquery_client.insert_calls) == 3
+
+    # Plus rien à relire ; un fichier complété n'envoie que ses nouvelles lignes
+    assert uploader.upload_segments(source='raw') == 0
+    assert len(bigquery_client.insert_calls) == 3
+    write_segments('data/segments_2.json', ['b'], end_date='2024-01-15')
+    assert uploader.upload_segments(source='raw') == 5
+    assert len(bigquery_client.tables[table_id]) == 25
+    uploader.ledger.close()